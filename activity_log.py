@@ -0,0 +1,154 @@
+"""
+QuickDesk compact ticket activity encoding
+
+A TicketActivity row stores a small-integer event code, the actor's user id
+and a compact JSON payload of structured old/new values (agent ids rather than
+usernames, status and priority names). The human-readable sentence is
+rendered when the row is displayed, so nothing but the facts is stored.
+In-app Notification rows (see notifications.py) use the same codes and
+payloads.
+
+Payload keys:
+    o / n   old and new value (status, priority, or agent user id)
+    b       1 when the change was made through a bulk action
+    s, p    edited subject / priority as [old, new]
+    c       edited category as [old id, new id]
+    d       1 when the description was edited
+    g       1 when the tags were edited
+    m       comment id, for 'commented' events
+    i       1 when a comment is an internal note
+    r       SLA stage ('response' or 'resolution') breached, for automatic escalations
+    x       free text carried over from rows written before this encoding
+
+This module only deals with codes and payloads; it does not import the models.
+"""
+
+import json
+
+EVENTS = {
+    'other': 0,
+    'created': 1,
+    'edited': 2,
+    'status_changed': 3,
+    'priority_changed': 4,
+    'assigned': 5,
+    'unassigned': 6,
+    'self_assigned': 7,
+    'auto_assigned': 8,
+    'escalated': 9,
+    'commented': 10,
+}
+EVENT_NAMES = {code: name for name, code in EVENTS.items()}
+
+# Events whose payload stores agent user ids as the old/new values
+AGENT_EVENTS = frozenset(EVENTS[name] for name in ('assigned', 'unassigned', 'auto_assigned'))
+
+def encode(**values):
+    """Compact JSON payload of the non-empty values, or None"""
+    values = {key: value for key, value in values.items() if value is not None and value != ''}
+    return json.dumps(values, separators=(',', ':'), ensure_ascii=False) if values else None
+
+def decode(data):
+    return json.loads(data) if data else {}
+
+def activity_row(ticket_id, user_id, event, created_at=None, **values):
+    """Column values for a TicketActivity row of the named event"""
+    row = {'ticket_id': ticket_id, 'user_id': user_id, 'event': EVENTS[event], 'data': encode(**values)}
+    if created_at is not None:
+        row['created_at'] = created_at
+    return row
+
+def referenced_user_ids(event, data):
+    """User ids in a payload, so callers can resolve many rows' names in one query"""
+    if event not in AGENT_EVENTS:
+        return set()
+    values = decode(data)
+    return {value for value in (values.get('o'), values.get('n')) if isinstance(value, int)}
+
+def referenced_category_ids(event, data):
+    """Category ids in a payload, resolved in one query like referenced_user_ids"""
+    if event != EVENTS['edited']:
+        return set()
+    return {value for value in decode(data).get('c', ()) if isinstance(value, int)}
+
+def render(event, data, actor_name, username=None, category_name=None):
+    """Human-readable sentence for an activity row
+
+    username and category_name resolve stored ids to display names; they are
+    only called for events that reference other users or categories.
+    """
+    values = decode(data)
+    name = EVENT_NAMES.get(event, 'other')
+    bulk = ' (bulk)' if values.get('b') else ''
+
+    def agent(key):
+        value = values.get(key)
+        if isinstance(value, int) and username:
+            return username(value) or 'unknown'
+        return value or 'unknown'
+
+    if name == 'created':
+        return f'Ticket created by {actor_name}'
+    if name == 'status_changed':
+        return f"Status changed from {values.get('o')} to {values.get('n')} by {actor_name}{bulk}"
+    if name == 'priority_changed':
+        return f"Priority changed from {values.get('o')} to {values.get('n')} by {actor_name}{bulk}"
+    if name == 'escalated':
+        if values.get('r') == 'response':
+            return 'Escalated automatically: first response SLA breached'
+        if values.get('r'):
+            return 'Escalated automatically: resolution SLA breached'
+        return f'Ticket escalated by {actor_name}'
+    if name == 'commented':
+        return f'{actor_name} added an internal note' if values.get('i') else f'{actor_name} commented'
+    if name == 'self_assigned':
+        return f'{actor_name} accepted this ticket for resolution'
+    if name == 'auto_assigned':
+        return f"Auto-assigned to {agent('n')}"
+    if name == 'assigned':
+        new_agent = agent('n')
+        if new_agent == actor_name and not bulk:
+            return f'Ticket assigned to {new_agent} (self-assigned)'
+        return f'Ticket assigned to {new_agent} by {actor_name}{bulk}'
+    if name == 'unassigned':
+        return f"Ticket unassigned from {agent('o')} by {actor_name}{bulk}"
+    if name == 'edited':
+        if 'x' in values:
+            return f"Ticket edited by {actor_name}: {values['x']}"
+        changes = []
+        if 's' in values:
+            changes.append(f'Subject: "{values["s"][0]}" → "{values["s"][1]}"')
+        if values.get('d'):
+            changes.append('Description updated')
+        if values.get('g'):
+            changes.append('Tags updated')
+        if 'p' in values:
+            changes.append(f"Priority: {values['p'][0]} → {values['p'][1]}")
+        if 'c' in values:
+            old_category, new_category = values['c']
+            if category_name:
+                old_category, new_category = category_name(old_category), category_name(new_category)
+            changes.append(f'Category: {old_category} → {new_category}')
+        return f"Ticket edited by {actor_name}: {'; '.join(changes)}"
+    return values.get('x') or f'Activity by {actor_name}'
+
+def convert_legacy(activity_type, description, old_value, new_value, user_ids):
+    """(event code, payload) for a row written in the old free-text format
+
+    user_ids maps usernames to ids for the assignment events; names that no
+    longer resolve are kept as text.
+    """
+    description = description or ''
+    event = EVENTS.get(activity_type, EVENTS['other'])
+    bulk = 1 if description.endswith('(bulk)') else None
+
+    if activity_type in ('status_changed', 'priority_changed', 'escalated'):
+        return event, encode(o=old_value, n=new_value, b=bulk)
+    if activity_type in ('assigned', 'unassigned', 'auto_assigned'):
+        return event, encode(o=user_ids.get(old_value, old_value), n=user_ids.get(new_value, new_value), b=bulk)
+    if activity_type in ('created', 'self_assigned'):
+        return event, None
+    if activity_type == 'edited':
+        _, _, changes = description.partition(': ')
+        return event, encode(x=changes or description)
+    return EVENTS['other'], encode(x=description)
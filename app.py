@@ -24,6 +24,10 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from dotenv import load_dotenv
 import os
+import time
+
+# Measured from here to the end of this module and reported as startup.seconds
+_startup_started = time.perf_counter()
 
 # Load environment variables from .env file
 load_dotenv()
@@ -40,6 +44,39 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-pro
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///quickdesk.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Disable modification tracking for performance
 
+# Database engine profile: SQLite pragmas and connection pool sizing
+app.config['SQLITE_PROFILE'] = os.getenv('SQLITE_PROFILE', 'production')  # production or default
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))
+app.config['SQLITE_TEMP_STORE'] = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# SQLite single-writer mode: queued writes on one thread, reads from a read-only pool
+app.config['SQLITE_WRITE_QUEUE'] = (os.getenv('SQLITE_WRITE_QUEUE', 'False').lower() == 'true'
+                                    and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'))
+app.config['SQLITE_READ_POOL_SIZE'] = int(os.getenv('SQLITE_READ_POOL_SIZE', 8))
+app.config['WRITE_QUEUE_MAX_BATCH'] = int(os.getenv('WRITE_QUEUE_MAX_BATCH', 50))
+app.config['WRITE_QUEUE_TIMEOUT'] = float(os.getenv('WRITE_QUEUE_TIMEOUT', 10))
+
+# Optional read replica for analytics, stats and list views, and the read-your-writes window (seconds)
+app.config['REPLICA_DATABASE_URL'] = os.getenv('REPLICA_DATABASE_URL')
+app.config['READ_YOUR_WRITES_SECONDS'] = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+from db_engine import (engine_options, read_bind_options, replica_bind_options, init_engine_profile,
+                       READ_BIND, REPLICA_BIND)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+app.config['SQLALCHEMY_BINDS'] = {}
+if app.config['SQLITE_WRITE_QUEUE']:
+    app.config['SQLALCHEMY_BINDS'][READ_BIND] = read_bind_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+if app.config['REPLICA_DATABASE_URL']:
+    app.config['SQLALCHEMY_BINDS'][REPLICA_BIND] = replica_bind_options(app.config['REPLICA_DATABASE_URL'], app.config)
+init_engine_profile(app)
+
 # File upload configuration
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB default
@@ -52,6 +89,104 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', app.config['MAIL_USERNAME'])
 
+# Response compression configuration
+app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', 'True').lower() == 'true'
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 500))  # Bytes; smaller bodies are sent as-is
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))  # 1 (fastest) to 9 (smallest)
+app.config['COMPRESS_MIMETYPES'] = os.getenv(
+    'COMPRESS_MIMETYPES', 'text/html,text/css,text/plain,application/json,application/javascript'
+).split(',')
+
+# Seconds before the in-memory tag autocomplete index is rebuilt to pick up other workers' changes
+app.config['TAG_INDEX_TTL'] = int(os.getenv('TAG_INDEX_TTL', 60))
+
+# User directory search: index refresh interval (seconds) and result cap
+app.config['USER_INDEX_TTL'] = int(os.getenv('USER_INDEX_TTL', 60))
+app.config['USER_SEARCH_MAX_RESULTS'] = int(os.getenv('USER_SEARCH_MAX_RESULTS', 1000))
+
+# Maximum number of tickets a single bulk action may change
+app.config['BULK_ACTION_MAX_TICKETS'] = int(os.getenv('BULK_ACTION_MAX_TICKETS', 5000))
+
+# Auto-assignment: weight agent load by ticket priority, and tickets written per commit
+app.config['AUTO_ASSIGN_WEIGHTED'] = os.getenv('AUTO_ASSIGN_WEIGHTED', 'True').lower() == 'true'
+app.config['AUTO_ASSIGN_CHUNK_SIZE'] = int(os.getenv('AUTO_ASSIGN_CHUNK_SIZE', 1000))
+app.config['AUTO_ASSIGN_INTERVAL'] = float(os.getenv('AUTO_ASSIGN_INTERVAL', 0))  # Seconds between scheduled runs; 0 = on demand only
+
+# Cascading deletes: rows per commit, and ticket count above which a user is deleted in the background
+app.config['DELETE_CHUNK_SIZE'] = int(os.getenv('DELETE_CHUNK_SIZE', 500))
+app.config['USER_DELETE_BACKGROUND_THRESHOLD'] = int(os.getenv('USER_DELETE_BACKGROUND_THRESHOLD', 1000))
+
+# Write-behind buffer for touch updates (last_login, ticket updated_at): flush interval and size
+app.config['WRITE_BEHIND_ENABLED'] = os.getenv('WRITE_BEHIND_ENABLED', 'True').lower() == 'true'
+app.config['WRITE_BEHIND_INTERVAL'] = float(os.getenv('WRITE_BEHIND_INTERVAL', 5))
+app.config['WRITE_BEHIND_MAX_ENTRIES'] = int(os.getenv('WRITE_BEHIND_MAX_ENTRIES', 500))
+
+# SMTP connection pool: idle connections kept open, and seconds before an idle one is closed
+app.config['MAIL_POOL_SIZE'] = int(os.getenv('MAIL_POOL_SIZE', 4))
+app.config['MAIL_POOL_IDLE_TIMEOUT'] = float(os.getenv('MAIL_POOL_IDLE_TIMEOUT', 60))
+
+# Email outbox: sending threads per process (0 = use a separate `python outbox.py`),
+# idle poll interval, and retry policy before an email is dead-lettered
+app.config['EMAIL_WORKERS'] = int(os.getenv('EMAIL_WORKERS', 2))
+app.config['EMAIL_POLL_INTERVAL'] = float(os.getenv('EMAIL_POLL_INTERVAL', 5))
+app.config['EMAIL_MAX_ATTEMPTS'] = int(os.getenv('EMAIL_MAX_ATTEMPTS', 6))
+app.config['EMAIL_RETRY_BASE'] = float(os.getenv('EMAIL_RETRY_BASE', 30))  # Seconds, doubled per attempt
+app.config['EMAIL_RETRY_MAX'] = float(os.getenv('EMAIL_RETRY_MAX', 3600))
+
+# Notification digests: seconds a recipient's emails are held to coalesce a burst into
+# one digest, and when daily/weekly digests go out (UTC hour; weekday 0 = Monday)
+app.config['NOTIFICATION_COALESCE_SECONDS'] = float(os.getenv('NOTIFICATION_COALESCE_SECONDS', 60))
+app.config['DIGEST_HOUR'] = int(os.getenv('DIGEST_HOUR', 8))
+app.config['DIGEST_WEEKDAY'] = int(os.getenv('DIGEST_WEEKDAY', 0))
+
+# Live dashboard feed: seconds between polls for new ticket events (one poller per process),
+# seconds between keep-alives, and seconds before a stream is closed for the browser to reconnect
+app.config['LIVE_FEED_POLL_INTERVAL'] = float(os.getenv('LIVE_FEED_POLL_INTERVAL', 2))
+app.config['LIVE_FEED_HEARTBEAT'] = float(os.getenv('LIVE_FEED_HEARTBEAT', 15))
+app.config['LIVE_FEED_STREAM_SECONDS'] = float(os.getenv('LIVE_FEED_STREAM_SECONDS', 300))
+
+# SLA targets in hours per priority ("priority:hours,..."), and the escalation scan:
+# seconds between scans (0 = never) and tickets escalated per transaction
+def _priority_hours(value):
+    return {priority.strip(): float(hours) for priority, hours in (item.split(':') for item in value.split(','))}
+
+app.config['SLA_FIRST_RESPONSE_HOURS'] = _priority_hours(os.getenv('SLA_FIRST_RESPONSE_HOURS', 'urgent:1,high:4,medium:8,low:24'))
+app.config['SLA_RESOLUTION_HOURS'] = _priority_hours(os.getenv('SLA_RESOLUTION_HOURS', 'urgent:4,high:24,medium:72,low:168'))
+app.config['SLA_SCAN_INTERVAL'] = float(os.getenv('SLA_SCAN_INTERVAL', 60))
+app.config['SLA_SCAN_BATCH'] = int(os.getenv('SLA_SCAN_BATCH', 500))
+
+# Periodic job scheduler: run jobs in this process's background thread (False = leave them to
+# `python scheduler.py`), seconds between checks, lease length before another process takes over,
+# and days of run history kept
+app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', 'True').lower() == 'true'
+app.config['SCHEDULER_TICK'] = float(os.getenv('SCHEDULER_TICK', 5))
+app.config['SCHEDULER_LEASE_SECONDS'] = float(os.getenv('SCHEDULER_LEASE_SECONDS', 30))
+app.config['SCHEDULER_HISTORY_DAYS'] = int(os.getenv('SCHEDULER_HISTORY_DAYS', 14))
+
+# Outbound webhooks: delivery threads per process (0 = use a separate `python webhooks.py`),
+# idle poll interval, events per request, request timeout in seconds, and retry policy
+# before an event is dead-lettered
+app.config['WEBHOOK_WORKERS'] = int(os.getenv('WEBHOOK_WORKERS', 4))
+app.config['WEBHOOK_POLL_INTERVAL'] = float(os.getenv('WEBHOOK_POLL_INTERVAL', 1))
+app.config['WEBHOOK_BATCH_SIZE'] = int(os.getenv('WEBHOOK_BATCH_SIZE', 50))
+app.config['WEBHOOK_TIMEOUT'] = float(os.getenv('WEBHOOK_TIMEOUT', 5))
+app.config['WEBHOOK_MAX_ATTEMPTS'] = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+app.config['WEBHOOK_RETRY_BASE'] = float(os.getenv('WEBHOOK_RETRY_BASE', 10))  # Seconds, doubled per failure
+app.config['WEBHOOK_RETRY_MAX'] = float(os.getenv('WEBHOOK_RETRY_MAX', 3600))
+
+# Email-to-ticket ingestion: maildir polled by a scheduler job (unset = run `python email_ingest.py`
+# by hand), seconds between polls, messages per transaction, whether unknown senders get an account,
+# and the category name for new tickets (default: the first active category)
+app.config['INBOUND_MAILDIR'] = os.getenv('INBOUND_MAILDIR')
+app.config['INBOUND_POLL_INTERVAL'] = float(os.getenv('INBOUND_POLL_INTERVAL', 30))
+app.config['INBOUND_BATCH_SIZE'] = int(os.getenv('INBOUND_BATCH_SIZE', 200))
+app.config['INBOUND_CREATE_USERS'] = os.getenv('INBOUND_CREATE_USERS', 'True').lower() == 'true'
+app.config['INBOUND_CATEGORY'] = os.getenv('INBOUND_CATEGORY')
+
+# Template caching configuration
+app.config['JINJA_CACHE_DIR'] = os.getenv('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+app.config['TEMPLATE_WARMUP'] = os.getenv('TEMPLATE_WARMUP', 'True').lower() == 'true'
+
 # Import models first
 from models import db, User, Ticket, Category, Comment, Vote, Attachment
 
@@ -63,6 +198,46 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 mail = Mail(app)
 
+# Gzip-encode eligible responses
+from compression import init_compression
+init_compression(app)
+
+# Persist compiled templates across worker restarts
+from templating import init_template_cache, warm_templates
+init_template_cache(app)
+
+# Route hot write paths through the SQLite writer thread when enabled
+from sqlite_writer import init_write_queue
+init_write_queue(app)
+
+# Track each client's last write for replica read-your-writes
+from replica import init_replica
+init_replica(app)
+
+# Batch low-value timestamp writes off the request path
+from write_behind import init_write_behind
+init_write_behind(app)
+
+# Reuse authenticated SMTP connections across messages
+from mail_transport import init_mail_transport
+init_mail_transport(app)
+
+# Deliver notification emails from the outbox in background threads
+from outbox import init_email_outbox
+init_email_outbox(app)
+
+# Stream ticket activity to open dashboards from one poller per process
+from live_feed import init_live_feed
+init_live_feed(app)
+
+# Periodic jobs (SLA scans, auto-assignment), each run by one process at a time under a database lease
+from scheduler import init_scheduler
+init_scheduler(app)
+
+# Push ticket events to webhook subscriptions from a pool of delivery threads
+from webhooks import init_webhooks
+init_webhooks(app)
+
 # Create upload directory
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
@@ -76,11 +251,13 @@ from routes.auth import auth_bp
 from routes.main import main_bp
 from routes.tickets import tickets_bp
 from routes.admin import admin_bp
+from routes.notifications import notifications_bp
 
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(main_bp)
 app.register_blueprint(tickets_bp, url_prefix='/tickets')
 app.register_blueprint(admin_bp, url_prefix='/admin')
+app.register_blueprint(notifications_bp, url_prefix='/notifications')
 
 # Add custom template filters
 @app.template_filter('nl2br')
@@ -111,6 +288,13 @@ def inject_utility_functions():
         'get_user_display_name': get_user_display_name
     }
 
+# Precompile templates so the first requests after a deploy are not slowed down
+if app.config['TEMPLATE_WARMUP']:
+    warm_templates(app)
+
+import metrics
+metrics.set_gauge('startup.seconds', round(time.perf_counter() - _startup_started, 4))
+
 # Database initialization is handled by run_enhanced.py or setup scripts
 # This prevents issues when running with enhanced models
 
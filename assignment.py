@@ -0,0 +1,198 @@
+"""
+QuickDesk auto-assignment engine
+
+Assigns unassigned open tickets to active agents by current load instead of
+round-robin. Agents sit in a min-heap keyed by their open-ticket load (a plain
+count, or a sum of priority weights when weighting is enabled). Tickets are
+assigned most urgent and oldest first, each to the least loaded agent.
+Agents skilled in the ticket's category are preferred unless they already
+carry more than SKILL_SLACK load above the least loaded agent overall.
+
+Assignments and activity rows are written with executemany statements in
+chunks, committing after each chunk so the write lock is never held for the
+whole run. The UPDATE only matches tickets that are still unassigned, like a
+work queue claim; the chunk is re-read afterwards and activity rows and
+notifications are written only for the tickets this run actually assigned.
+"""
+
+import heapq
+import time
+from datetime import datetime
+from sqlalchemy import bindparam, case, func
+from models import Ticket, TicketActivity, User, agent_skills, db
+from activity_log import activity_row
+from notifications import add_notifications, notification_rows
+import metrics
+
+OPEN_STATUSES = ('open', 'in_progress')
+PRIORITY_WEIGHTS = {'urgent': 4, 'high': 3, 'medium': 2, 'low': 1}
+
+# Extra load a skilled agent may carry before a generalist gets the ticket instead
+SKILL_SLACK = 10
+
+def _priority_rank():
+    return case(
+        (Ticket.priority == 'urgent', 0),
+        (Ticket.priority == 'high', 1),
+        (Ticket.priority == 'medium', 2),
+        (Ticket.priority == 'low', 3),
+        else_=4
+    )
+
+class AssignmentEngine:
+    """Least-loaded agent selection with optional per-category skills"""
+
+    def __init__(self, loads, skills=None, weighted=False, skill_slack=SKILL_SLACK):
+        # loads: {agent_id: current load}; skills: {category_id: {agent_id, ...}}
+        self.weighted = weighted
+        self.skill_slack = skill_slack
+        self._loads = dict(loads)
+        self._versions = dict.fromkeys(self._loads, 0)
+        self._general = [(load, agent_id, 0) for agent_id, load in self._loads.items()]
+        heapq.heapify(self._general)
+
+        self._agent_categories = {}
+        self._skilled = {}
+        for category_id, agent_ids in (skills or {}).items():
+            agent_ids = [agent_id for agent_id in agent_ids if agent_id in self._loads]
+            if not agent_ids:
+                continue
+            heap = [(self._loads[agent_id], agent_id, 0) for agent_id in agent_ids]
+            heapq.heapify(heap)
+            self._skilled[category_id] = heap
+            for agent_id in agent_ids:
+                self._agent_categories.setdefault(agent_id, []).append(category_id)
+
+    def _pop_current(self, heap):
+        # Entries are invalidated lazily: a stale version means the agent was re-pushed
+        while heap:
+            load, agent_id, version = heap[0]
+            if self._versions[agent_id] == version:
+                return agent_id
+            heapq.heappop(heap)
+        return None
+
+    def assign(self, priority, category_id=None):
+        """Pick the least loaded agent for a ticket and account for its load"""
+        agent_id = self._pop_current(self._general)
+        if agent_id is None:
+            return None
+
+        if category_id in self._skilled:
+            skilled_id = self._pop_current(self._skilled[category_id])
+            if self._loads[skilled_id] <= self._loads[agent_id] + self.skill_slack:
+                agent_id = skilled_id
+
+        self._loads[agent_id] += PRIORITY_WEIGHTS.get(priority, 1) if self.weighted else 1
+        self._versions[agent_id] += 1
+        entry = (self._loads[agent_id], agent_id, self._versions[agent_id])
+        heapq.heappush(self._general, entry)
+        for skilled_category in self._agent_categories.get(agent_id, ()):
+            heapq.heappush(self._skilled[skilled_category], entry)
+        return agent_id
+
+    def release(self, agent_id, priority):
+        """Take back the load of an assignment that did not happen"""
+        self._loads[agent_id] -= PRIORITY_WEIGHTS.get(priority, 1) if self.weighted else 1
+        self._versions[agent_id] += 1
+        entry = (self._loads[agent_id], agent_id, self._versions[agent_id])
+        heapq.heappush(self._general, entry)
+        for skilled_category in self._agent_categories.get(agent_id, ()):
+            heapq.heappush(self._skilled[skilled_category], entry)
+
+def load_agent_state(weighted=False, use_skills=True):
+    """Read active agents with their open load and category skills"""
+    agents = dict(db.session.query(User.id, User.username).filter(
+        User.role == 'agent', User.is_active.is_(True)
+    ).all())
+
+    if weighted:
+        load_expression = func.sum(case(
+            *[(Ticket.priority == priority, weight) for priority, weight in PRIORITY_WEIGHTS.items()],
+            else_=1
+        ))
+    else:
+        load_expression = func.count(Ticket.id)
+
+    loads = dict.fromkeys(agents, 0)
+    for agent_id, load in db.session.query(Ticket.assigned_to, load_expression).filter(
+        Ticket.assigned_to.isnot(None),
+        Ticket.status.in_(OPEN_STATUSES)
+    ).group_by(Ticket.assigned_to):
+        if agent_id in loads:
+            loads[agent_id] = load or 0
+
+    skills = {}
+    if use_skills:
+        for agent_id, category_id in db.session.query(agent_skills.c.user_id, agent_skills.c.category_id):
+            if agent_id in agents:
+                skills.setdefault(category_id, set()).add(agent_id)
+
+    return agents, loads, skills
+
+def auto_assign(actor_id, weighted=False, use_skills=True, chunk_size=1000):
+    """Assign every unassigned open ticket and return a summary"""
+    started = time.perf_counter()
+    agents, loads, skills = load_agent_state(weighted=weighted, use_skills=use_skills)
+    if not agents:
+        return None
+
+    engine = AssignmentEngine(loads, skills=skills, weighted=weighted)
+    tickets = db.session.query(Ticket.id, Ticket.priority, Ticket.category_id, Ticket.user_id).filter(
+        Ticket.assigned_to.is_(None),
+        Ticket.status.in_(OPEN_STATUSES)
+    ).order_by(_priority_rank(), Ticket.created_at, Ticket.id).all()
+
+    ticket_table = Ticket.__table__
+    assign_statement = ticket_table.update().where(
+        ticket_table.c.id == bindparam('b_ticket_id'),
+        ticket_table.c.assigned_to.is_(None)
+    ).values(assigned_to=bindparam('b_agent_id'), updated_at=bindparam('b_now'))
+
+    assigned_count = 0
+    conflicts = 0
+    for start in range(0, len(tickets), chunk_size):
+        now = datetime.utcnow()
+        chunk = tickets[start:start + chunk_size]
+        planned = {}
+        for ticket_id, priority, category_id, creator_id in chunk:
+            planned[ticket_id] = engine.assign(priority, category_id)
+        db.session.execute(assign_statement, [
+            {'b_ticket_id': ticket_id, 'b_agent_id': agent_id, 'b_now': now}
+            for ticket_id, agent_id in planned.items()
+        ])
+
+        # executemany cannot report which rows matched, so read back the chunk's assignees; tickets
+        # not held by their planned agent were claimed by someone else in the meantime
+        assigned = {ticket_id for ticket_id, agent_id in db.session.query(Ticket.id, Ticket.assigned_to).filter(
+            Ticket.id.in_(list(planned))
+        ) if planned[ticket_id] == agent_id}
+
+        activities = []
+        notifications = []
+        for ticket_id, priority, category_id, creator_id in chunk:
+            agent_id = planned[ticket_id]
+            if ticket_id not in assigned:
+                engine.release(agent_id, priority)
+                continue
+            activities.append(activity_row(ticket_id, actor_id, 'auto_assigned', created_at=now, n=agent_id))
+            notifications.extend(notification_rows(ticket_id, actor_id, 'auto_assigned',
+                                                   [agent_id, creator_id], now, n=agent_id))
+
+        if activities:
+            db.session.execute(TicketActivity.__table__.insert(), activities)
+            add_notifications(notifications)
+        db.session.commit()
+        assigned_count += len(activities)
+        conflicts += len(chunk) - len(activities)
+
+    elapsed = time.perf_counter() - started
+    metrics.record_timing('auto_assign.run', elapsed)
+    metrics.increment('auto_assign.tickets', assigned_count)
+    metrics.increment('auto_assign.conflicts', conflicts)
+
+    return {
+        'assigned_count': assigned_count,
+        'agent_count': len(agents),
+        'elapsed_seconds': round(elapsed, 3),
+    }
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Auto-assignment benchmark
+
+Seeds a throwaway SQLite database with agents and unassigned tickets, runs
+the load-aware assignment engine and reports throughput and load balance.
+
+Usage: python benchmarks/bench_auto_assign.py [--tickets 100000] [--agents 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--agents', type=int, default=500)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--weighted', action='store_true', help='Weight agent load by ticket priority')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['TEMPLATE_WARMUP'] = 'False'
+
+    from app import app, db
+    from models import User, Category, Ticket, agent_skills
+    from assignment import auto_assign
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [
+            {'name': f'Category {i}'} for i in range(args.categories)
+        ])
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'bench-admin', 'email': 'admin@bench.local', 'password_hash': '-', 'role': 'admin', 'is_active': True}
+        ] + [
+            {'username': f'agent{i}', 'email': f'agent{i}@bench.local', 'password_hash': '-', 'role': 'agent', 'is_active': True}
+            for i in range(args.agents)
+        ])
+        # A quarter of the agents specialise in one category
+        db.session.execute(agent_skills.insert(), [
+            {'user_id': i + 2, 'category_id': (i % args.categories) + 1} for i in range(0, args.agents, 4)
+        ])
+        priorities = ['low', 'medium', 'high', 'urgent']
+        for start in range(0, args.tickets, 10000):
+            db.session.execute(Ticket.__table__.insert(), [
+                {
+                    'subject': f'Ticket {i}',
+                    'description': 'Benchmark ticket',
+                    'status': 'open',
+                    'priority': random.choice(priorities),
+                    'user_id': 1,
+                    'category_id': random.randint(1, args.categories),
+                }
+                for i in range(start, min(start + 10000, args.tickets))
+            ])
+        db.session.commit()
+
+        print(f"Assigning {args.tickets} tickets across {args.agents} agents "
+              f"({'priority weighted' if args.weighted else 'ticket count'} load)...")
+        started = time.perf_counter()
+        result = auto_assign(1, weighted=args.weighted)
+        elapsed = time.perf_counter() - started
+
+        counts = [count for _, count in db.session.query(
+            Ticket.assigned_to, db.func.count(Ticket.id)
+        ).group_by(Ticket.assigned_to)]
+
+    print(f"  assigned:      {result['assigned_count']}")
+    print(f"  elapsed:       {elapsed:.2f}s")
+    print(f"  throughput:    {result['assigned_count'] / elapsed:,.0f} tickets/s")
+    print(f"  per agent:     min {min(counts)} / max {max(counts)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Email ingestion benchmark
+
+Writes a large sample mbox (new requests from a few hundred customers,
+replies threaded by In-Reply-To and by subject tag, agent answers, some
+attachments and auto-replies), ingests it into a throwaway database and
+reports messages/sec with batched commits and with one commit per message.
+It also reports the peak memory needed to stream and parse the whole mbox.
+
+Usage: python benchmarks/bench_email_ingest.py [--messages 20000] [--batch 1,200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from email.message import EmailMessage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def write_mbox(path, count, customers, seed=1):
+    """A sample mailbox of count messages; returns its size in bytes"""
+    rng = random.Random(seed)
+    threads = []  # (Message-ID of the opening email, customer, subject)
+    with open(path, 'wb') as mbox:
+        for number in range(count):
+            message = EmailMessage()
+            message['Message-ID'] = f'<bench.{number}@mail.example>'
+            message['To'] = 'support@bench.local'
+            roll = rng.random()
+            if threads and roll < 0.35:
+                opening, customer, subject = rng.choice(threads)
+                if rng.random() < 0.5:
+                    # The customer follows up on their own email
+                    message['From'] = f'Customer {customer} <customer{customer}@mail.example>'
+                    message['In-Reply-To'] = message['References'] = opening
+                else:
+                    # An agent answers from their mail client
+                    message['From'] = f'agent{customer % 5}@bench.local'
+                    message['In-Reply-To'] = opening
+                message['Subject'] = f'Re: {subject}'
+                message.set_content(f'Reply {number}\n\nOn Monday, someone wrote:\n> ' + 'quoted text\n> ' * 20)
+            else:
+                customer = rng.randrange(customers)
+                subject = f'Request {number}: cannot sign in to the portal'
+                message['From'] = f'Customer {customer} <customer{customer}@mail.example>'
+                message['Subject'] = subject
+                if roll > 0.98:
+                    message['Auto-Submitted'] = 'auto-replied'
+                message.set_content('Hello,\n\n' + 'I am having a problem with my account. ' * rng.randint(5, 60))
+                if roll > 0.9:
+                    message.add_attachment(os.urandom(rng.randint(2_000, 60_000)), maintype='application',
+                                           subtype='pdf', filename=f'screenshot-{number}.pdf')
+                threads.append((message['Message-ID'], customer, subject))
+            mbox.write(b'From bench@mail.example Mon Jan  1 00:00:00 2026\n')
+            mbox.write(message.as_bytes(policy=message.policy.clone(linesep='\n')).replace(b'\nFrom ', b'\n>From '))
+            mbox.write(b'\n')
+    return os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--batch', default='1,200', help='Comma-separated INBOUND_BATCH_SIZE values')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quickdesk-bench-')
+    mbox_path = os.path.join(workdir, 'sample.mbox')
+    size = write_mbox(mbox_path, args.messages, args.customers)
+    print(f'Sample mbox: {args.messages} messages, {size / 1e6:.1f} MB')
+
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}", TEMPLATE_WARMUP='False',
+                      EMAIL_WORKERS='0', WEBHOOK_WORKERS='0', SCHEDULER_ENABLED='False',
+                      UPLOAD_FOLDER=os.path.join(workdir, 'uploads'))
+    from app import app, db
+    from models import User, Category
+    from email_ingest import EmailIngester, MboxSource, parse_message
+
+    # Memory is traced in a pass of its own, as tracing slows everything down
+    tracemalloc.start()
+    for key, message, digest, _ in MboxSource(mbox_path):
+        parse_message(key, message, digest)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'Peak memory streaming and parsing the whole mbox: {peak / 1e6:.1f} MB')
+
+    print(f"{'batch':>6}   {'msgs/sec':>9}   {'MB/s':>6}   {'tickets':>7}   {'comments':>8}   {'attachments':>11}")
+    for batch_size in [int(value) for value in args.batch.split(',')]:
+        with app.app_context():
+            # Every round starts from an empty database
+            db.drop_all()
+            db.create_all()
+            db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+            db.session.execute(User.__table__.insert(), [
+                {'username': f'agent{i}', 'email': f'agent{i}@bench.local', 'password_hash': '-',
+                 'role': 'agent', 'is_active': True}
+                for i in range(5)
+            ])
+            db.session.commit()
+
+            report = EmailIngester(batch_size=batch_size, send_email=False).ingest(MboxSource(mbox_path))
+            print(f"{batch_size:>6}   {report['messages'] / report['seconds']:>9.0f}   "
+                  f"{report['bytes'] / report['seconds'] / 1e6:>6.1f}   {report['tickets']:>7}   "
+                  f"{report['comments']:>8}   {report['attachments']:>11}")
+            db.session.remove()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Email outbox benchmark
+
+Runs status updates against a throwaway database while a local SMTP sink
+(benchmarks/smtp_sink.py) answers slowly and rejects a share of messages.
+Reports request latency with the outbox, the same latency when each email
+is sent inline as before, and how long the worker pool takes to drain the
+outbox, with the number of retries and dead letters.
+
+Usage: python benchmarks/bench_email_outbox.py [--updates 200] [--delay 0.1] [--fail-rate 0.1]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.1, help='SMTP sink seconds per message')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='Share of messages the sink rejects')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    from smtp_sink import SMTPSink
+    sink = SMTPSink(port=0, delay=args.delay, fail_rate=args.fail_rate).start()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False',
+        MAIL_SERVER='localhost', MAIL_PORT=str(sink.port), MAIL_USE_TLS='False',
+        MAIL_USERNAME='quickdesk@localhost', MAIL_PASSWORD='',
+        EMAIL_WORKERS=str(args.workers), EMAIL_POLL_INTERVAL='0.5', NOTIFICATION_COALESCE_SECONDS='0',
+        # Fast retries so the benchmark finishes; production waits much longer
+        EMAIL_RETRY_BASE='0.05', EMAIL_RETRY_MAX='1', EMAIL_MAX_ATTEMPTS='4',
+    )
+
+    from app import app, db
+    from models import User, Category, Ticket, EmailOutbox
+    from utils import send_notification_email
+    import metrics
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'admin', 'email': 'admin@bench.local', 'password_hash': '-', 'role': 'admin', 'is_active': True},
+        ] + [
+            # One customer per ticket, so no two emails are coalesced into a digest
+            {'username': f'customer{i}', 'email': f'customer{i}@bench.local', 'password_hash': '-',
+             'role': 'user', 'is_active': True}
+            for i in range(args.updates)
+        ])
+        db.session.execute(Ticket.__table__.insert(), [
+            {'subject': f'Ticket {i}', 'description': 'Benchmark ticket', 'status': 'open',
+             'priority': 'medium', 'user_id': i + 2, 'category_id': 1}
+            for i in range(args.updates)
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    latencies = []
+    started = time.perf_counter()
+    for ticket_id in range(1, args.updates + 1):
+        request_started = time.perf_counter()
+        response = client.post(f'/tickets/{ticket_id}/status', json={'status': 'in_progress'})
+        latencies.append(time.perf_counter() - request_started)
+        assert response.status_code == 200, response.status_code
+
+    # Wait for every email to be delivered or dead-lettered
+    with app.app_context():
+        while EmailOutbox.query.filter(EmailOutbox.status != 'dead').count():
+            time.sleep(0.05)
+        drained = time.perf_counter() - started
+        dead = EmailOutbox.query.filter_by(status='dead').count()
+        accepted = sink.messages
+
+        # The old behaviour: send inline inside the request
+        inline = []
+        for ticket in Ticket.query.limit(10):
+            with app.test_request_context():
+                inline_started = time.perf_counter()
+                send_notification_email(ticket, 'status_changed', 'customer@bench.local',
+                                        old_status='open', new_status='in_progress')
+                inline.append(time.perf_counter() - inline_started)
+
+    counters = metrics.snapshot()['counters']
+    print(f"{args.updates} status updates, SMTP sink {args.delay * 1000:.0f}ms per message, "
+          f"{args.fail_rate:.0%} rejected, {args.workers} outbox workers")
+    print(f"  request latency with outbox   p50 {percentile(latencies, 0.5) * 1000:6.1f}ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.1f}ms")
+    print(f"  inline send (previous)        p50 {percentile(inline, 0.5) * 1000:6.1f}ms added per email")
+    print(f"  outbox drained in {drained:.2f}s: {counters.get('email_outbox.sent', 0)} sent, "
+          f"{counters.get('email_outbox.retries', 0)} retries, {dead} dead-lettered "
+          f"(sink accepted {accepted})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Live dashboard feed benchmark
+
+Opens N live-feed streams against a throwaway database while tickets keep
+changing, and counts the SQL statements the process runs. It compares that
+with what the old dashboard cost: every open tab re-rendering the full
+agent dashboard every five minutes. Reports statements per second for each
+client count, and how long events took to reach the clients.
+
+Usage: python benchmarks/bench_live_feed.py [--clients 1,10,100] [--seconds 5] [--changes-per-second 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Seconds between reloads of each agent dashboard tab before the live feed
+OLD_RELOAD_SECONDS = 300
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', default='1,10,100', help='Comma-separated stream counts')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--changes-per-second', type=float, default=5)
+    parser.add_argument('--tickets', type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False', EMAIL_WORKERS='0',
+                      LIVE_FEED_POLL_INTERVAL='1', LIVE_FEED_STREAM_SECONDS=str(args.seconds + 5))
+
+    from sqlalchemy import event
+    from app import app, db
+    from models import User, Category, Ticket, TicketActivity
+    from activity_log import activity_row
+    from live_feed import live_feed
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'admin', 'email': 'admin@bench.local', 'password_hash': '-', 'role': 'admin', 'is_active': True},
+            {'username': 'customer', 'email': 'customer@bench.local', 'password_hash': '-', 'role': 'user', 'is_active': True},
+        ])
+        db.session.execute(Ticket.__table__.insert(), [
+            {'subject': f'Ticket {i}', 'description': 'Benchmark ticket', 'status': 'open',
+             'priority': 'medium', 'user_id': 2, 'category_id': 1}
+            for i in range(args.tickets)
+        ])
+        db.session.commit()
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(threading.get_ident()))
+
+    # Statements behind one render of the agent dashboard, as every tab used to reload it
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    statements.clear()
+    client.get('/agent-dashboard')
+    per_render = len(statements)
+
+    print(f"{args.tickets} tickets, {args.changes_per_second:g} changes/s, "
+          f"{per_render} statements per dashboard render")
+    print(f"  {'clients':>7}   {'live feed':>14}   {'reload every 5 min':>18}   {'event latency p50':>17}")
+
+    for count in [int(value) for value in args.clients.split(',')]:
+        latencies = []
+        stop = threading.Event()
+
+        def consume(client, backlog):
+            for message in live_feed.stream(client, backlog):
+                if message.startswith('id: '):
+                    created = float(message.split('"subject":"', 1)[1].split('"', 1)[0])
+                    latencies.append(time.time() - created)
+                if stop.is_set():
+                    return
+
+        with app.app_context():
+            streams = [live_feed.subscribe(1, True) for _ in range(count)]
+        threads = [threading.Thread(target=consume, args=stream, daemon=True) for stream in streams]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(1)
+        statements.clear()
+        started = time.perf_counter()
+        with app.app_context():
+            # Changes carry their wall-clock time in the ticket subject, to measure delivery
+            while time.perf_counter() - started < args.seconds:
+                ticket_id = int(time.perf_counter() * 1000) % args.tickets + 1
+                Ticket.query.filter_by(id=ticket_id).update({'subject': repr(time.time())})
+                db.session.add(TicketActivity(**activity_row(ticket_id, 1, 'status_changed', o='open', n='open')))
+                db.session.commit()
+                time.sleep(1 / args.changes_per_second)
+        writer_thread = threading.get_ident()
+        elapsed = time.perf_counter() - started
+        feed_rate = sum(1 for ident in statements if ident != writer_thread) / elapsed
+
+        stop.set()
+        for client, _ in streams:
+            live_feed.unsubscribe(client)
+            client.queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else float('nan')
+        print(f"  {count:>7}   {feed_rate:>8.2f} stmt/s   {count * per_render / OLD_RELOAD_SECONDS:>11.2f} stmt/s"
+              f"   {p50:>14.0f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+SLA scan benchmark
+
+Fills a throwaway database with open tickets and times one pass of the SLA
+scanner (a range scan of ix_ticket_sla_due for deadlines that have passed)
+against the naive alternative of loading every open ticket and checking its
+deadlines in Python. Reports both with nothing overdue and with --overdue
+tickets to escalate.
+
+Usage: python benchmarks/bench_sla_scan.py [--tickets 20000,100000] [--overdue 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PRIORITIES = ('low', 'medium', 'high', 'urgent')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', default='20000,100000', help='Comma-separated open ticket counts')
+    parser.add_argument('--overdue', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ.update(DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False', EMAIL_WORKERS='0',
+                      SLA_SCAN_INTERVAL='0')
+
+    from app import app, db
+    from models import User, Category, Notification, Ticket, TicketActivity, TicketEscalation
+    from sla import compute_sla, escalate_breaches, refresh_sla
+
+    def naive_scan(now):
+        """What a scan costs without the stored deadline: check every open ticket"""
+        overdue = 0
+        for status, created_at, priority, first_response_at, stage, response_hours, resolution_hours in db.session.query(
+            Ticket.status, Ticket.created_at, Ticket.priority, Ticket.first_response_at, Ticket.sla_stage,
+            Category.sla_first_response_hours, Category.sla_resolution_hours
+        ).join(Category, Ticket.category_id == Category.id).filter(Ticket.status.in_(('open', 'in_progress'))):
+            _, due, _ = compute_sla(status, created_at, priority, first_response_at, stage,
+                                 response_hours, resolution_hours)
+            if due is not None and due <= now:
+                overdue += 1
+        return overdue
+
+    def best_of(fn):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+            db.session.rollback()
+        return min(timings) * 1000
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'admin', 'email': 'admin@bench.local', 'password_hash': '-', 'role': 'admin', 'is_active': True},
+            {'username': 'customer', 'email': 'customer@bench.local', 'password_hash': '-', 'role': 'user', 'is_active': True},
+        ])
+        db.session.commit()
+
+        print(f"{'open tickets':>12}   {'naive scan':>10}   {'index scan, none due':>20}   "
+              f"{f'index scan, {args.overdue} due':>20}")
+        created = 0
+        now = datetime.utcnow()
+        for count in [int(value) for value in args.tickets.split(',')]:
+            # Recent tickets, nowhere near their deadlines
+            db.session.execute(Ticket.__table__.insert(), [
+                {'subject': f'Ticket {i}', 'description': 'Benchmark ticket', 'status': 'open',
+                 'priority': PRIORITIES[i % 4], 'user_id': 2, 'category_id': 1,
+                 'created_at': now - timedelta(minutes=i % 30)}
+                for i in range(created, count)
+            ])
+            refresh_sla(range(created + 1, count + 1))
+            db.session.commit()
+            created = count
+
+            naive = best_of(lambda: naive_scan(now))
+            idle = best_of(lambda: escalate_breaches(now))
+
+            # Push some deadlines into the past; each timed pass escalates them, then is undone
+            Ticket.query.filter(Ticket.id <= args.overdue).update(
+                {Ticket.sla_due_at: now - timedelta(minutes=1)}, synchronize_session=False
+            )
+            db.session.commit()
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                escalated = escalate_breaches(now, limit=args.overdue)
+                timings.append(time.perf_counter() - started)
+                assert escalated == args.overdue
+                # Undo the escalations so the next pass has the same work
+                for model in (TicketEscalation, TicketActivity, Notification):
+                    db.session.execute(model.__table__.delete())
+                Ticket.query.filter(Ticket.id <= args.overdue).update(
+                    {Ticket.sla_stage: 'response', Ticket.sla_due_at: now - timedelta(minutes=1)},
+                    synchronize_session=False
+                )
+                db.session.commit()
+            busy = min(timings) * 1000
+
+            print(f"{count:>12}   {naive:>8.1f}ms   {idle:>18.2f}ms   {busy:>18.1f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+SMTP connection pool benchmark
+
+Sends the same batch of notification messages to a local SMTP sink
+(benchmarks/smtp_sink.py) three ways: Flask-Mail's mail.send(), which opens
+a connection per message; SMTPPool.send() per message; and
+SMTPPool.send_batch() from several threads, as the outbox workers do. The
+sink's --connect-delay stands in for the TLS handshake and login of a real
+server. Reports messages per second and connections opened for each.
+
+Usage: python benchmarks/bench_smtp_pool.py [--messages 500] [--connect-delay 0.02] [--threads 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--connect-delay', type=float, default=0.02, help='Sink seconds per new connection')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=10, help='Messages per send_batch() call')
+    args = parser.parse_args()
+
+    from smtp_sink import SMTPSink
+    sink = SMTPSink(port=0, connect_delay=args.connect_delay).start()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False',
+        MAIL_SERVER='localhost', MAIL_PORT=str(sink.port), MAIL_USE_TLS='False',
+        MAIL_USERNAME='quickdesk@localhost', MAIL_PASSWORD='secret', EMAIL_WORKERS='0',
+        MAIL_POOL_SIZE=str(args.threads),
+    )
+
+    from flask_mail import Message
+    from app import app
+    from mail_transport import smtp_pool
+
+    def messages(count):
+        return [Message(subject=f'Ticket Status Updated: #{i}', sender='quickdesk@localhost',
+                        recipients=[f'customer{i}@bench.local'], body='Your ticket was updated.')
+                for i in range(count)]
+
+    def run(label, send):
+        sink.messages = sink.connections = 0
+        smtp_pool.close_all()
+        started = time.perf_counter()
+        send()
+        elapsed = time.perf_counter() - started
+        print(f"  {label:<28} {sink.messages / elapsed:>8,.0f} msg/s   "
+              f"{sink.messages} sent over {sink.connections} connection(s)")
+
+    def per_message_connection():
+        mail = app.extensions['mail']
+        for message in messages(args.messages):
+            mail.send(message)
+
+    def pooled_sequential():
+        for message in messages(args.messages):
+            smtp_pool.send(message)
+
+    def pooled_batches():
+        pending = messages(args.messages)
+        lock = threading.Lock()
+
+        def worker():
+            with app.app_context():
+                while True:
+                    with lock:
+                        batch, pending[:args.batch] = pending[:args.batch], []
+                    if not batch:
+                        return
+                    smtp_pool.send_batch(batch)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    print(f"{args.messages} messages, {args.connect_delay * 1000:.0f}ms per new SMTP connection")
+    with app.app_context():
+        run('mail.send (connect per msg)', per_message_connection)
+        run('pooled send', pooled_sequential)
+        run(f'pooled batches x{args.threads} threads', pooled_batches)
+        smtp_pool.close_all()
+
+if __name__ == '__main__':
+    main()
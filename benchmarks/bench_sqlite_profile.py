@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+SQLite engine profile benchmark
+
+Runs the same mixed workload against a fresh SQLite database once with stock
+SQLite settings (SQLITE_PROFILE=default) and once with the production profile
+(WAL, busy_timeout, synchronous=NORMAL, ...). Reader threads load tickets with
+their comments while writer threads add comments and change ticket status.
+Reports operations per second and "database is locked" errors for each run.
+
+Usage: python benchmarks/bench_sqlite_profile.py [--readers 8] [--writers 4] [--seconds 10]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run_workload(args):
+    """Child process: seed, run the workload with the current profile, print JSON"""
+    from app import app, db
+    from models import User, Category, Ticket, Comment
+    from sqlalchemy.exc import OperationalError
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'email': f'user{i}@bench.local', 'password_hash': '-', 'role': 'agent', 'is_active': True}
+            for i in range(20)
+        ])
+        db.session.execute(Ticket.__table__.insert(), [
+            {'subject': f'Ticket {i}', 'description': 'Benchmark ticket ' * 20, 'status': 'open',
+             'priority': 'medium', 'user_id': 1 + i % 20, 'category_id': 1}
+            for i in range(args.tickets)
+        ])
+        db.session.commit()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    counts_lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    def count(key):
+        with counts_lock:
+            counts[key] += 1
+
+    def reader():
+        with app.app_context():
+            while time.monotonic() < deadline:
+                try:
+                    ticket_id = random.randint(1, args.tickets)
+                    db.session.get(Ticket, ticket_id)
+                    Comment.query.filter_by(ticket_id=ticket_id).all()
+                    db.session.rollback()
+                    count('reads')
+                except OperationalError:
+                    db.session.rollback()
+                    count('locked')
+            db.session.remove()
+
+    def writer():
+        with app.app_context():
+            while time.monotonic() < deadline:
+                try:
+                    ticket_id = random.randint(1, args.tickets)
+                    db.session.add(Comment(content='Benchmark comment', ticket_id=ticket_id, user_id=random.randint(1, 20)))
+                    Ticket.query.filter_by(id=ticket_id).update(
+                        {'status': random.choice(['open', 'in_progress'])}, synchronize_session=False)
+                    db.session.commit()
+                    count('writes')
+                except OperationalError:
+                    db.session.rollback()
+                    count('locked')
+            db.session.remove()
+
+    threads = ([threading.Thread(target=reader) for _ in range(args.readers)] +
+               [threading.Thread(target=writer) for _ in range(args.writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts['journal_mode'] = journal_mode
+    print(json.dumps(counts))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_workload(args)
+        return
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+    for profile in ('default', 'production'):
+        db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', SQLITE_PROFILE=profile, TEMPLATE_WARMUP='False')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child',
+             '--readers', str(args.readers), '--writers', str(args.writers),
+             '--seconds', str(args.seconds), '--tickets', str(args.tickets)],
+            env=env, cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(f"  {profile:<10} journal={result['journal_mode']:<8} "
+              f"reads/s {result['reads'] / args.seconds:>8,.0f}   "
+              f"writes/s {result['writes'] / args.seconds:>7,.0f}   "
+              f"locked errors {result['locked']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Webhook delivery benchmark
+
+Records ticket events into a throwaway database at a steady rate while the
+webhook dispatcher delivers them to several local endpoints
+(benchmarks/webhook_sink.py) that verify every signature. One endpoint is
+slower than WEBHOOK_TIMEOUT, so each of its requests times out and it backs
+off. For each batch size the benchmark reports delivery throughput and
+event-to-endpoint latency of the healthy endpoints, showing how batching
+raises throughput and that the slow endpoint does not hold them up.
+
+Usage: python benchmarks/bench_webhooks.py [--events 2000] [--rate 1000] [--endpoints 3] [--batch 1,50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--rate', type=int, default=1000, help='Events recorded per second')
+    parser.add_argument('--endpoints', type=int, default=3, help='Healthy endpoints')
+    parser.add_argument('--batch', default='1,50', help='Comma-separated WEBHOOK_BATCH_SIZE values')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.005, help='Healthy endpoint seconds per request')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False', EMAIL_WORKERS='0',
+        SCHEDULER_ENABLED='False', WEBHOOK_WORKERS='0', WEBHOOK_POLL_INTERVAL='0.05',
+        # The slow endpoint times out on every request and backs off briefly
+        WEBHOOK_TIMEOUT='0.5', WEBHOOK_RETRY_BASE='1', WEBHOOK_RETRY_MAX='2', WEBHOOK_MAX_ATTEMPTS='1000',
+    )
+
+    from app import app, db
+    from models import User, Category, Ticket, TicketActivity, WebhookSubscription
+    from activity_log import activity_row
+    from webhook_sink import WebhookSink
+    from webhooks import WEBHOOK_EVENTS, subscribe, webhook_dispatcher
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'customer', 'email': 'customer@bench.local', 'password_hash': '-', 'role': 'user', 'is_active': True},
+        ])
+        db.session.commit()
+    # The timing-out endpoint's retries are expected
+    app.logger.setLevel('ERROR')
+    webhook_dispatcher.start(workers=args.workers)
+
+    print(f"{args.events} events at {args.rate}/s, {args.endpoints} healthy endpoints "
+          f"({args.delay * 1000:.0f}ms per request) and one timing out, {args.workers} workers")
+    print(f"{'batch':>6}   {'delivered/s':>11}   {'requests':>8}   {'latency p50':>11}   {'p95':>8}   "
+          f"{'p99':>8}   {'slow endpoint':>13}")
+    for batch_size in [int(value) for value in args.batch.split(',')]:
+        app.config['WEBHOOK_BATCH_SIZE'] = batch_size
+        sinks = [WebhookSink('127.0.0.1', 0, delay=args.delay).start() for _ in range(args.endpoints)]
+        slow = WebhookSink('127.0.0.1', 0, delay=2).start()
+
+        with app.app_context():
+            # Replace the previous round's subscriptions; new ones start at the head of the event log
+            WebhookSubscription.query.update({WebhookSubscription.is_active: False})
+            for number, sink in enumerate(sinks + [slow]):
+                sink.secret = subscribe(f'Endpoint {number}', sink.url, WEBHOOK_EVENTS).secret
+            db.session.commit()
+
+        def record_events():
+            """Insert tickets with their 'created' events in 10ms slices at the requested rate"""
+            with app.app_context():
+                per_slice = max(args.rate // 100, 1)
+                started = time.perf_counter()
+                for first in range(0, args.events, per_slice):
+                    now = datetime.utcnow()
+                    count = min(per_slice, args.events - first)
+                    result = db.session.execute(Ticket.__table__.insert().returning(Ticket.__table__.c.id), [
+                        {'subject': f'Ticket {first + i}', 'description': 'Benchmark ticket', 'status': 'open',
+                         'priority': 'medium', 'user_id': 1, 'category_id': 1, 'created_at': now}
+                        for i in range(count)
+                    ])
+                    db.session.execute(TicketActivity.__table__.insert(), [
+                        activity_row(ticket_id, 1, 'created', created_at=now) for (ticket_id,) in result
+                    ])
+                    db.session.commit()
+                    time.sleep(max(started + (first + count) / args.rate - time.perf_counter(), 0))
+
+        started = time.perf_counter()
+        producer = threading.Thread(target=record_events)
+        producer.start()
+        while any(sink.events < args.events for sink in sinks):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        producer.join()
+
+        latencies = [latency for sink in sinks for latency in sink.latencies]
+        delivered = sum(sink.events for sink in sinks)
+        assert all(sorted(set(sink.event_ids)) == sorted(sink.event_ids) for sink in sinks), 'duplicate delivery'
+        assert not any(sink.bad_signatures for sink in sinks), 'bad signature'
+        print(f"{batch_size:>6}   {delivered / elapsed:>11.0f}   {sum(sink.requests for sink in sinks):>8}   "
+              f"{percentile(latencies, 0.5) * 1000:>9.0f}ms   {percentile(latencies, 0.95) * 1000:>6.0f}ms   "
+              f"{percentile(latencies, 0.99) * 1000:>6.0f}ms   {slow.requests:>4} timed out")
+        for sink in sinks + [slow]:
+            sink.shutdown()
+
+if __name__ == '__main__':
+    main()
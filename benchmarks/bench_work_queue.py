@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Work queue benchmark
+
+Seeds a throwaway SQLite database with unassigned tickets, lets many agent
+threads claim tickets concurrently until the queue is empty, and checks that
+no ticket was claimed twice.
+
+Usage: python benchmarks/bench_work_queue.py [--tickets 2000] [--agents 32]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--agents', type=int, default=32)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['TEMPLATE_WARMUP'] = 'False'
+
+    from app import app, db
+    from models import User, Category, Ticket, TicketActivity
+    from work_queue import claim_next_ticket
+    import metrics
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'agent{i}', 'email': f'agent{i}@bench.local', 'password_hash': '-', 'role': 'agent', 'is_active': True}
+            for i in range(args.agents)
+        ])
+        db.session.execute(Ticket.__table__.insert(), [
+            {
+                'subject': f'Ticket {i}',
+                'description': 'Benchmark ticket',
+                'status': 'open',
+                'priority': random.choice(['low', 'medium', 'high', 'urgent']),
+                'user_id': 1,
+                'category_id': 1,
+            }
+            for i in range(args.tickets)
+        ])
+        db.session.commit()
+
+    claims = []
+    errors = []
+
+    def agent_worker(agent_id):
+        with app.app_context():
+            agent = db.session.get(User, agent_id)
+            while True:
+                try:
+                    ticket = claim_next_ticket(agent)
+                except Exception as e:
+                    # SQLite "database is locked" under heavy write contention
+                    db.session.rollback()
+                    errors.append(str(e))
+                    continue
+                if ticket is None:
+                    break
+                claims.append(ticket.id)
+            db.session.remove()
+
+    print(f"Claiming {args.tickets} tickets with {args.agents} concurrent agents...")
+    started = time.perf_counter()
+    threads = [threading.Thread(target=agent_worker, args=(i + 1,)) for i in range(args.agents)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        unassigned = Ticket.query.filter(Ticket.assigned_to.is_(None)).count()
+        activities = TicketActivity.query.count()
+
+    counters = metrics.snapshot()['counters']
+    print(f"  claimed:       {len(claims)} ({len(set(claims))} distinct)")
+    print(f"  unassigned:    {unassigned}")
+    print(f"  activity rows: {activities}")
+    print(f"  lost races:    {counters.get('work_queue.conflicts', 0)}")
+    print(f"  db errors:     {len(errors)}")
+    print(f"  elapsed:       {elapsed:.2f}s")
+    print(f"  throughput:    {len(claims) / elapsed:,.0f} claims/s")
+
+if __name__ == '__main__':
+    main()
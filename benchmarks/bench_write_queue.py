@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+SQLite write queue stress test
+
+Fires hundreds of concurrent vote and comment requests at the app (through
+the Flask test client, one thread per simulated user) once with direct
+writes and once with SQLITE_WRITE_QUEUE enabled, then checks every request
+succeeded and every write landed. Reports throughput, request latency, the
+number of failed requests and the writer's batch statistics.
+
+Usage: python benchmarks/bench_write_queue.py [--users 300] [--requests 10]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run_stress(args):
+    """Child process: seed, fire the requests, print JSON results"""
+    from app import app, db
+    from models import User, Category, Ticket, Comment, Vote
+    import metrics
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['MAIL_USERNAME'] = None
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'name': 'General'}])
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'email': f'user{i}@bench.local', 'password_hash': '-', 'role': 'agent', 'is_active': True}
+            for i in range(args.users)
+        ])
+        db.session.execute(Ticket.__table__.insert(), [
+            {'subject': f'Ticket {i}', 'description': 'Benchmark ticket', 'status': 'open',
+             'priority': 'medium', 'user_id': 1, 'category_id': 1}
+            for i in range(args.tickets)
+        ])
+        db.session.commit()
+
+    latencies = []
+    failures = []
+    comments_sent = []
+    results_lock = threading.Lock()
+    barrier = threading.Barrier(args.users)
+
+    def user_session(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        # Vote on distinct tickets so the final vote count is predictable
+        tickets = random.sample(range(1, args.tickets + 1), args.requests)
+        barrier.wait()
+        for ticket_id in tickets:
+            started = time.perf_counter()
+            if random.random() < 0.5:
+                response = client.post(f'/tickets/{ticket_id}/vote', json={'vote_type': 'up'})
+                ok = response.status_code == 200
+            else:
+                response = client.post(f'/tickets/{ticket_id}/comment', data={'content': 'Stress test comment'})
+                ok = response.status_code == 302
+                if ok:
+                    with results_lock:
+                        comments_sent.append(ticket_id)
+            with results_lock:
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    failures.append(response.status_code)
+
+    threads = [threading.Thread(target=user_session, args=(i + 1,)) for i in range(args.users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        votes = Vote.query.count()
+        comments = Comment.query.count()
+
+    latencies.sort()
+    snapshot = metrics.snapshot()
+    print(json.dumps({
+        'requests': len(latencies),
+        'failures': len(failures),
+        'elapsed': elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'votes': votes,
+        'expected_votes': len(latencies) - len(comments_sent) - len(failures),
+        'comments': comments,
+        'expected_comments': len(comments_sent),
+        'batches': snapshot['counters'].get('write_queue.batches', 0),
+        'jobs': snapshot['counters'].get('write_queue.jobs', 0),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=10, help='Requests per user')
+    parser.add_argument('--tickets', type=int, default=200)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_stress(args)
+        return
+
+    print(f"{args.users} concurrent users x {args.requests} vote/comment requests")
+    for mode in ('direct', 'queue'):
+        db_path = os.path.join(tempfile.mkdtemp(prefix='quickdesk-bench-'), 'bench.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', TEMPLATE_WARMUP='False',
+                   SQLITE_WRITE_QUEUE='True' if mode == 'queue' else 'False')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--users', str(args.users),
+             '--requests', str(args.requests), '--tickets', str(args.tickets)],
+            env=env, cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        line = (f"  {mode:<7} {result['requests'] / result['elapsed']:>7,.0f} req/s   "
+                f"p50 {result['p50'] * 1000:>6.1f}ms   p99 {result['p99'] * 1000:>7.1f}ms   "
+                f"failed {result['failures']}   votes {result['votes']}/{result['expected_votes']}   "
+                f"comments {result['comments']}/{result['expected_comments']}")
+        if result['batches']:
+            line += f"   avg batch {result['jobs'] / result['batches']:.1f}"
+        print(line)
+
+if __name__ == '__main__':
+    main()
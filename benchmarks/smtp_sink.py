@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in
+
+A tiny threaded SMTP server that accepts every message and throws it away,
+for exercising the email outbox without a real mail server. It can be made
+slow (--delay seconds per message, --connect-delay seconds per connection to
+stand in for the TLS handshake and login of a real server) or flaky
+(--fail-rate, answering a share of messages with "451 temporary failure")
+to watch retries and dead letters.
+It accepts any AUTH PLAIN/LOGIN credentials and does not offer STARTTLS.
+
+Point QuickDesk at it with:
+
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=False
+    MAIL_USERNAME=quickdesk@localhost MAIL_PASSWORD=
+
+Usage: python benchmarks/smtp_sink.py [--port 1025] [--delay 0.2] [--connect-delay 0.05] [--fail-rate 0.1]
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """SMTP server counting connections and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=1025, delay=0.0, fail_rate=0.0, connect_delay=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.delay = delay
+        self.connect_delay = connect_delay
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.failures = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve from a background thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        server.count('connections')
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+        self.reply('220 quickdesk-smtp-sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                self.reply('250-quickdesk-smtp-sink')
+                self.reply('250-AUTH PLAIN LOGIN')
+                self.reply('250 8BITMIME')
+            elif verb == 'AUTH':
+                if command.upper() == 'AUTH LOGIN':
+                    # Username and password prompts; any answer is accepted
+                    for prompt in ('334 VXNlcm5hbWU6', '334 UGFzc3dvcmQ6'):
+                        self.reply(prompt)
+                        self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.fail_rate and random.random() < server.fail_rate:
+                    server.count('failures')
+                    self.reply('451 Temporary failure, try again later')
+                else:
+                    server.count('messages')
+                    self.reply('250 OK: queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            elif verb in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds spent on each message')
+    parser.add_argument('--connect-delay', type=float, default=0.0, help='Seconds spent opening each connection')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of messages answered with 451')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.delay, args.fail_rate, args.connect_delay)
+    print(f'SMTP sink listening on {args.host}:{sink.port}; Ctrl+C to stop')
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f'{sink.messages} message(s) accepted, {sink.failures} rejected, {sink.connections} connection(s)')
+
+if __name__ == '__main__':
+    main()
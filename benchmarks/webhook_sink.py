@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Local webhook stand-in
+
+A tiny threaded HTTP server that accepts webhook deliveries, checks their
+signatures and counts the events, for exercising the webhook dispatcher
+without a real endpoint. It can be made slow (--delay seconds per request)
+or flaky (--fail-rate, answering a share of requests with 503) to watch
+backoff, isolation and dead letters.
+
+Add it as a webhook in the admin area (URL http://localhost:8765/hook) and
+pass that subscription's signing secret with --secret to verify signatures.
+
+Usage: python benchmarks/webhook_sink.py [--port 8765] [--secret ...] [--delay 0.5] [--fail-rate 0.1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+class WebhookSink(ThreadingHTTPServer):
+    """HTTP server counting requests, events and bad signatures"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=8765, secret=None, delay=0.0, fail_rate=0.0):
+        super().__init__((host, port), _WebhookHandler)
+        self.secret = secret
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.events = 0
+        self.failures = 0
+        self.bad_signatures = 0
+        self.event_ids = []
+        # Seconds from each event's creation to its arrival
+        self.latencies = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.port}/hook'
+
+    def start(self):
+        """Serve from a background thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.count('requests')
+        if server.delay:
+            time.sleep(server.delay)
+        if server.secret is not None:
+            from webhooks import verify_signature
+            if not verify_signature(server.secret, self.headers.get('X-QuickDesk-Timestamp'), body,
+                                    self.headers.get('X-QuickDesk-Signature')):
+                server.count('bad_signatures')
+                return self.reply(401)
+        if server.fail_rate and random.random() < server.fail_rate:
+            server.count('failures')
+            return self.reply(503)
+
+        events = json.loads(body)['events']
+        arrived = datetime.utcnow()
+        with server.lock:
+            server.events += len(events)
+            for event in events:
+                server.event_ids.append(event['id'])
+                server.latencies.append((arrived - datetime.fromisoformat(event['created_at'])).total_seconds())
+        self.reply(204)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--secret', help='Signing secret to verify requests against')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds spent on each request')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    args = parser.parse_args()
+
+    sink = WebhookSink(args.host, args.port, args.secret, args.delay, args.fail_rate)
+    print(f'Webhook sink listening on {sink.url}; Ctrl+C to stop')
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f'{sink.events} event(s) in {sink.requests} request(s), {sink.failures} rejected, '
+          f'{sink.bad_signatures} bad signature(s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+QuickDesk bulk ticket actions
+
+Applies one change (assign, status, priority or close) to many tickets inside
+a single transaction. Permission rules are expressed as query filters, each
+change is one set-based UPDATE per chunk of ids, activity rows are written with
+executemany inserts, and SLA deadlines, in-app notifications and notification
+emails are updated in the same transaction.
+"""
+
+from datetime import datetime
+from models import Ticket, TicketActivity, User, db
+from activity_log import activity_row
+from outbox import enqueue_email
+from notifications import add_notifications, notification_rows, watchers
+from sla import refresh_sla
+
+BULK_ACTIONS = ('assign', 'status', 'priority', 'close')
+VALID_STATUSES = ('open', 'in_progress', 'resolved', 'closed')
+VALID_PRIORITIES = ('low', 'medium', 'high', 'urgent')
+
+# Keeps IN lists below database bind-parameter limits
+CHUNK_SIZE = 500
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def parse_ticket_ids(raw_ids, max_tickets):
+    """Validate and de-duplicate a list of ticket ids from a request body"""
+    if not isinstance(raw_ids, list) or not raw_ids:
+        raise ValueError('ticket_ids must be a non-empty list')
+    try:
+        ticket_ids = sorted({int(ticket_id) for ticket_id in raw_ids})
+    except (TypeError, ValueError):
+        raise ValueError('ticket_ids must contain integers')
+    if len(ticket_ids) > max_tickets:
+        raise ValueError(f'At most {max_tickets} tickets can be changed at once')
+    return ticket_ids
+
+def _permission_filters(actor, action, value):
+    """Query filters restricting the tickets actor may change with this action"""
+    if actor.is_admin():
+        return []
+    if action == 'assign':
+        # Agents may only claim unassigned tickets for themselves
+        return [Ticket.assigned_to.is_(None)]
+    # Agents may only change tickets assigned to them, as in update_status
+    return [Ticket.assigned_to == actor.id]
+
+def _resolve_change(actor, action, value):
+    """Return (column, new value, activity type) for an action, validating value"""
+    if action == 'close':
+        return Ticket.status, 'closed', 'status_changed'
+
+    if action == 'status':
+        if value not in VALID_STATUSES:
+            raise ValueError('Invalid status')
+        return Ticket.status, value, 'status_changed'
+
+    if action == 'priority':
+        if value not in VALID_PRIORITIES:
+            raise ValueError('Invalid priority')
+        return Ticket.priority, value, 'priority_changed'
+
+    if action == 'assign':
+        if value is None:
+            if not actor.is_admin():
+                raise PermissionError('Only admins can unassign tickets')
+            return Ticket.assigned_to, None, 'unassigned'
+        try:
+            agent_id = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid agent')
+        if not actor.is_admin() and agent_id != actor.id:
+            raise PermissionError('Only admins can assign tickets to other agents')
+        return Ticket.assigned_to, agent_id, 'assigned'
+
+    raise ValueError('Invalid action')
+
+def apply_bulk_action(actor, ticket_ids, action, value=None):
+    """Apply action to ticket_ids in one transaction and return a summary"""
+    column, new_value, activity_type = _resolve_change(actor, action, value)
+
+    agent = None
+    if activity_type == 'assigned':
+        agent = db.session.get(User, new_value)
+        if not agent or not agent.is_agent() or not agent.is_active:
+            raise ValueError('Invalid agent')
+
+    filters = _permission_filters(actor, action, value)
+    if new_value is None:
+        filters.append(column.isnot(None))
+    else:
+        filters.append(db.or_(column.is_(None), column != new_value))
+
+    now = datetime.utcnow()
+    changed = []
+
+    for chunk in _chunks(ticket_ids):
+        rows = db.session.query(Ticket.id, column).filter(
+            Ticket.id.in_(chunk), *filters
+        ).with_for_update().all()
+        if not rows:
+            continue
+
+        ids = [row[0] for row in rows]
+        Ticket.query.filter(Ticket.id.in_(ids), *filters).update(
+            {column: new_value, Ticket.updated_at: now},
+            synchronize_session=False
+        )
+        changed.extend(rows)
+
+    # Assignment events store agent ids, so old and new values need no lookup
+    activities = [
+        activity_row(ticket_id, actor.id, activity_type, created_at=now, o=old_value, n=new_value, b=1)
+        for ticket_id, old_value in changed
+    ]
+
+    for chunk in _chunks(activities):
+        db.session.execute(TicketActivity.__table__.insert(), chunk)
+
+    if activity_type in ('status_changed', 'priority_changed'):
+        # Moving tickets on from 'open' counts as their first response
+        responded = {ticket_id for ticket_id, old_value in changed
+                     if activity_type == 'status_changed' and old_value == 'open' and new_value != 'open'}
+        refresh_sla(responded, first_response_at=now)
+        refresh_sla([ticket_id for ticket_id, _ in changed if ticket_id not in responded])
+
+    _queue_notifications(actor, activity_type, changed, new_value, agent, now)
+
+    db.session.commit()
+
+    return {
+        'updated': len(changed),
+        'skipped': len(ticket_ids) - len(changed),
+        'ticket_ids': [ticket_id for ticket_id, _ in changed],
+    }
+
+def _queue_notifications(actor, activity_type, changed, new_value, agent, now):
+    """Notify the same users and queue the same emails as the single-ticket endpoints, in the same transaction"""
+    if activity_type not in ('status_changed', 'assigned', 'unassigned') or not changed:
+        return
+
+    # Emails are rendered by the outbox workers, so only the creators' addresses are needed here
+    old_values = dict(changed)
+    for chunk in _chunks([ticket_id for ticket_id, _ in changed]):
+        tickets = db.session.query(Ticket.id, Ticket.user_id, Ticket.assigned_to, User.email).join(
+            User, Ticket.user_id == User.id
+        ).filter(Ticket.id.in_(chunk)).all()
+
+        notifications = []
+        for ticket_id, creator_id, assignee_id, creator_email in tickets:
+            old_value = old_values[ticket_id]
+            recipients = [creator_id, old_value] if activity_type == 'unassigned' else watchers(creator_id, assignee_id)
+            notifications.extend(notification_rows(ticket_id, actor.id, activity_type, recipients, now,
+                                                   o=old_value, n=new_value, b=1))
+
+            if activity_type == 'status_changed':
+                enqueue_email(ticket_id, 'status_changed', creator_email,
+                              old_status=old_value, new_status=new_value)
+            elif activity_type == 'assigned':
+                enqueue_email(ticket_id, 'assigned', creator_email, agent_name=agent.username)
+                if agent.id != actor.id:
+                    enqueue_email(ticket_id, 'assigned_to_you', agent.email, assigner_name=actor.username)
+        add_notifications(notifications)
@@ -0,0 +1,176 @@
+"""
+QuickDesk change feed
+
+Integrations and the front-end keep a copy of ticket state in sync by polling
+/api/changes?since=<cursor> instead of scraping the dashboards. Every ticket
+change writes a ticket_event row (creation, edits including tags, status,
+priority, assignment, escalation, new comments) and ticket_event ids only
+grow, so the cursor is simply the id of the last event a client has seen.
+
+Ids are taken when an event is inserted but become visible when its
+transaction commits, so on PostgreSQL or MySQL an event can appear after a
+higher id was already read. A batch therefore stops before a gap in ids
+until the event after the gap is GAP_GRACE_SECONDS old; by then the missing
+id is taken to be a rollback or a deleted ticket.
+
+- A poll reads at most `limit` events with id > since straight off the
+  primary key, so a poll with nothing new is one empty index range read.
+  A customer's poll reads the same window and keeps the events of their own
+  tickets, so it may return fewer than `limit` events (even none) while
+  has_more is true.
+- A batch carries the events plus the current state of every ticket and
+  comment they touch, each loaded with one query.
+- next_cursor is the last event id of the window, so it moves past other
+  users' events too; has_more says whether to poll again straight away.
+
+Omitting since returns the head cursor and no changes, for a client that has
+just loaded a full snapshot. Customers only see their own tickets and never
+internal notes. Deleted tickets take their events with them and are not
+reported.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import Comment, Tag, Ticket, TicketActivity, User, ticket_tags, db
+from activity_log import EVENT_NAMES, decode, referenced_user_ids, render
+
+# Largest batch a client may ask for
+MAX_BATCH = 500
+
+# Seconds before a gap in ticket_event ids is taken to be permanent (a rollback or deletion)
+GAP_GRACE_SECONDS = 5
+
+# Newest events read per step when looking for gaps
+GAP_SCAN_BATCH = 200
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def settled_cursor(since, last_id, now=None):
+    """Highest event id up to last_id that no still uncommitted event can precede
+
+    Walks back from last_id and stops at the first event older than the grace
+    period, so only the last few seconds of events are read.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=GAP_GRACE_SECONDS)
+    settled = last_id
+    above = None  # id of the young event just above the one being looked at
+    bound = last_id
+    while True:
+        rows = db.session.query(TicketActivity.id, TicketActivity.created_at).filter(
+            TicketActivity.id > since, TicketActivity.id <= bound
+        ).order_by(TicketActivity.id.desc()).limit(GAP_SCAN_BATCH).all()
+        for event_id, created_at in rows:
+            if above is not None and above != event_id + 1:
+                settled = event_id
+            if created_at is None or created_at <= cutoff:
+                return settled
+            above = event_id
+        if len(rows) < GAP_SCAN_BATCH:
+            break
+        bound = rows[-1].id - 1
+    if above is not None and above != since + 1:
+        settled = since
+    return settled
+
+def head_cursor():
+    """Cursor after the newest committed change"""
+    last_id = db.session.query(func.max(TicketActivity.id)).scalar() or 0
+    return settled_cursor(0, last_id) if last_id else 0
+
+def changes_since(since, limit=100, user_id=None, include_internal=True):
+    """One batch of changes after the cursor since
+
+    user_id limits the batch to that user's tickets; include_internal=False
+    leaves out internal notes.
+    """
+    rows = db.session.query(
+        TicketActivity.id, TicketActivity.ticket_id, TicketActivity.user_id,
+        TicketActivity.event, TicketActivity.data, TicketActivity.created_at
+    ).filter(TicketActivity.id > since).order_by(TicketActivity.id).limit(limit + 1).all()
+    has_more, rows = len(rows) > limit, rows[:limit]
+    next_cursor = since
+    if rows:
+        # Events after a recent gap wait for the next poll
+        next_cursor = settled_cursor(since, rows[-1].id)
+        if next_cursor < rows[-1].id:
+            rows = [row for row in rows if row.id <= next_cursor]
+            has_more = False
+
+    if user_id is not None and rows:
+        own_tickets = {ticket_id for (ticket_id,) in db.session.query(Ticket.id).filter(
+            Ticket.id.in_({row.ticket_id for row in rows}), Ticket.user_id == user_id
+        )}
+        rows = [row for row in rows if row.ticket_id in own_tickets]
+    if not include_internal:
+        rows = [row for row in rows if not decode(row.data).get('i')]
+    if not rows:
+        return {'changes': [], 'tickets': [], 'comments': [], 'next_cursor': next_cursor, 'has_more': has_more}
+
+    ticket_ids = {row.ticket_id for row in rows}
+    tickets = db.session.query(
+        Ticket.id, Ticket.subject, Ticket.description, Ticket.status, Ticket.priority,
+        Ticket.category_id, Ticket.user_id, Ticket.assigned_to, Ticket.created_at, Ticket.updated_at
+    ).filter(Ticket.id.in_(ticket_ids)).all()
+
+    tags = {}
+    for ticket_id, name in db.session.query(ticket_tags.c.ticket_id, Tag.name).join(
+        Tag, Tag.id == ticket_tags.c.tag_id
+    ).filter(ticket_tags.c.ticket_id.in_(ticket_ids)):
+        tags.setdefault(ticket_id, []).append(name)
+
+    comment_of = {row.id: decode(row.data).get('m') for row in rows if EVENT_NAMES.get(row.event) == 'commented'}
+    comment_ids = set(comment_of.values())
+    comment_ids.discard(None)
+    comments = db.session.query(
+        Comment.id, Comment.ticket_id, Comment.user_id, Comment.content, Comment.is_internal, Comment.created_at
+    ).filter(Comment.id.in_(comment_ids)).all() if comment_ids else []
+    if not include_internal:
+        comments = [comment for comment in comments if not comment.is_internal]
+
+    # Every user name the batch mentions, in one query
+    user_ids = {row.user_id for row in rows} | {comment.user_id for comment in comments}
+    user_ids.update(ticket.user_id for ticket in tickets)
+    user_ids.update(ticket.assigned_to for ticket in tickets if ticket.assigned_to)
+    for row in rows:
+        user_ids |= referenced_user_ids(row.event, row.data)
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)))
+
+    return {
+        'changes': [{
+            'id': row.id,
+            'ticket_id': row.ticket_id,
+            'event': EVENT_NAMES.get(row.event, 'other'),
+            'actor_id': row.user_id,
+            'comment_id': comment_of.get(row.id),
+            'description': render(row.event, row.data, usernames.get(row.user_id, 'unknown'),
+                                  username=usernames.get),
+            'created_at': _iso(row.created_at),
+        } for row in rows],
+        'tickets': [{
+            'id': ticket.id,
+            'subject': ticket.subject,
+            'description': ticket.description,
+            'status': ticket.status,
+            'priority': ticket.priority,
+            'category_id': ticket.category_id,
+            'tags': sorted(tags.get(ticket.id, [])),
+            'user_id': ticket.user_id,
+            'creator': usernames.get(ticket.user_id),
+            'assigned_to': ticket.assigned_to,
+            'assignee': usernames.get(ticket.assigned_to),
+            'created_at': _iso(ticket.created_at),
+            'updated_at': _iso(ticket.updated_at),
+        } for ticket in tickets],
+        'comments': [{
+            'id': comment.id,
+            'ticket_id': comment.ticket_id,
+            'user_id': comment.user_id,
+            'author': usernames.get(comment.user_id),
+            'content': comment.content,
+            'is_internal': comment.is_internal,
+            'created_at': _iso(comment.created_at),
+        } for comment in comments],
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
@@ -0,0 +1,97 @@
+"""
+QuickDesk response compression
+
+Gzip-encodes HTML and JSON responses for clients that accept it. Buffered
+responses are compressed in one pass once they exceed COMPRESS_MIN_SIZE;
+streamed responses are compressed chunk by chunk with a sync flush so each
+chunk reaches the client as soon as it is produced.
+"""
+
+import gzip
+import zlib
+from flask import request
+import metrics
+
+DEFAULT_MIMETYPES = [
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/xml',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+]
+
+def init_compression(app):
+    """Register the compression hook on the application"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESS_ENABLED'] or not _should_compress(response, app.config):
+            return response
+
+        level = app.config['COMPRESS_LEVEL']
+
+        if response.is_streamed:
+            response.response = _gzip_stream(response.response, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+
+            compressed = gzip.compress(data, compresslevel=level)
+            if len(compressed) >= len(data):
+                return response
+
+            response.set_data(compressed)
+            _record_savings(len(data), len(compressed))
+
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+def _should_compress(response, config):
+    """Check whether a response is eligible for gzip encoding"""
+    if not request.accept_encodings['gzip']:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    return response.mimetype in config['COMPRESS_MIMETYPES']
+
+def _gzip_stream(chunks, level):
+    """Compress an iterable of chunks, flushing after every chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    bytes_in = 0
+    bytes_out = 0
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            bytes_in += len(chunk)
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            bytes_out += len(data)
+            yield data
+
+        data = compressor.flush()
+        bytes_out += len(data)
+        yield data
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        _record_savings(bytes_in, bytes_out)
+
+def _record_savings(bytes_in, bytes_out):
+    metrics.increment('compression.responses')
+    metrics.increment('compression.bytes_in', bytes_in)
+    metrics.increment('compression.bytes_out', bytes_out)
+    metrics.increment('compression.bytes_saved', bytes_in - bytes_out)
@@ -0,0 +1,136 @@
+"""
+QuickDesk database engine profile
+
+Builds SQLALCHEMY_ENGINE_OPTIONS for the configured database and tunes every
+new SQLite connection for concurrent use:
+
+- journal_mode=WAL lets readers run while a writer commits;
+- busy_timeout makes writers wait for the lock instead of failing at once
+  with "database is locked";
+- synchronous=NORMAL skips the fsync on every commit (safe with WAL: a power
+  cut can lose the last transactions but never corrupts the database);
+- cache_size, mmap_size and temp_store keep hot pages and temporary b-trees
+  in memory.
+
+Server databases get a bounded, pre-pinged, recycled connection pool.
+SQLITE_PROFILE=default leaves SQLite at its stock settings.
+
+With SQLITE_WRITE_QUEUE enabled, a second "read" bind on the same database
+file holds a pool of query_only connections. RoutingSession sends plain
+SELECTs there until the transaction writes anything (a flush, DML or raw SQL);
+from then on the transaction stays on the primary engine so it reads its own
+writes. The same routing sends reads of @replica_reads views to the "replica"
+bind when REPLICA_DATABASE_URL is set (see replica.py).
+"""
+
+import sqlite3
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQLITE_PROFILES = ('production', 'default')
+
+# Bind keys of the read-only SQLite connection pool and of the read replica
+READ_BIND = 'sqlite_read'
+REPLICA_BIND = 'replica'
+
+class ReadOnlyConnection(sqlite3.Connection):
+    """sqlite3 connection class marking connections of the read pool"""
+
+def engine_options(database_uri, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for database_uri"""
+    if database_uri.startswith('sqlite'):
+        options = {
+            'connect_args': {
+                # Seconds the driver waits for a lock, matching busy_timeout
+                'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+                # Pooled connections are handed between request threads
+                'check_same_thread': False,
+            },
+        }
+        if ':memory:' not in database_uri and database_uri not in ('sqlite://', 'sqlite:///'):
+            options.update(
+                pool_size=config['DB_POOL_SIZE'],
+                max_overflow=config['DB_MAX_OVERFLOW'],
+                pool_timeout=config['DB_POOL_TIMEOUT'],
+            )
+        return options
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+def read_bind_options(database_uri, config):
+    """SQLALCHEMY_BINDS entry for the read-only SQLite pool"""
+    options = engine_options(database_uri, config)
+    options['connect_args'] = dict(options['connect_args'], factory=ReadOnlyConnection)
+    options.update(pool_size=config['SQLITE_READ_POOL_SIZE'], max_overflow=0)
+    return dict(options, url=database_uri)
+
+def replica_bind_options(replica_uri, config):
+    """SQLALCHEMY_BINDS entry for the read replica"""
+    options = engine_options(replica_uri, config)
+    if replica_uri.startswith('sqlite'):
+        # Only the copy job may write to a SQLite replica
+        options['connect_args'] = dict(options['connect_args'], factory=ReadOnlyConnection)
+    return dict(options, url=replica_uri)
+
+def sqlite_pragmas(config):
+    """PRAGMA statements run on every new SQLite connection"""
+    if config['SQLITE_PROFILE'] != 'production':
+        return []
+    return [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA temp_store={config['SQLITE_TEMP_STORE']}",
+    ]
+
+def init_engine_profile(app):
+    """Apply the SQLite pragmas to every connection opened by any engine"""
+    if app.config['SQLITE_PROFILE'] not in SQLITE_PROFILES:
+        raise ValueError(f"SQLITE_PROFILE must be one of {', '.join(SQLITE_PROFILES)}")
+    pragmas = sqlite_pragmas(app.config)
+
+    @event.listens_for(Engine, 'connect')
+    def _configure_sqlite(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        if isinstance(dbapi_connection, ReadOnlyConnection):
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+class RoutingSession(Session):
+    """Session sending reads to the replica or read pool until the transaction writes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self.info.get('primary_pinned'):
+            return engine
+
+        engines = self._db.engines
+        if engine is not engines.get(None) or (READ_BIND not in engines and REPLICA_BIND not in engines):
+            return engine
+        if not self._flushing and getattr(clause, 'is_select', False):
+            if REPLICA_BIND in engines and has_app_context() and g.get('use_replica'):
+                return engines[REPLICA_BIND]
+            return engines.get(READ_BIND, engine)
+
+        self.info['primary_pinned'] = True
+        return engine
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _unpin_primary(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('primary_pinned', None)
@@ -0,0 +1,125 @@
+"""
+QuickDesk cascading deletes
+
+Tickets and users are removed with a fixed set of DELETE ... WHERE ticket_id
+IN (...) statements per chunk of ticket ids, committing after every chunk so
+no single write transaction grows with the size of the data. Deleting a user
+with many tickets can run as a background job: the account is deactivated and
+marked pending deletion immediately, and progress is reported through
+get_deletion_progress().
+"""
+
+import threading
+from flask import current_app
+from models import (Ticket, Comment, Vote, Attachment, TicketActivity, TicketEscalation, InboundEmail,
+                    NotificationSettings, Notification, User, ticket_tags, agent_skills, db)
+from tag_index import adjust_tag_usage
+from notifications import discard_notifications
+import metrics
+
+# Rows that reference ticket.id, deleted before the tickets themselves
+TICKET_CHILD_TABLES = [
+    InboundEmail.__table__,
+    Comment.__table__,
+    Vote.__table__,
+    Attachment.__table__,
+    TicketActivity.__table__,
+    TicketEscalation.__table__,
+    ticket_tags,
+]
+
+_progress = {}
+_progress_lock = threading.Lock()
+
+def _set_progress(user_id, **values):
+    with _progress_lock:
+        _progress.setdefault(user_id, {}).update(values)
+
+def get_deletion_progress(user_id):
+    """Progress of a user deletion started in this process, or None"""
+    with _progress_lock:
+        progress = _progress.get(user_id)
+        return dict(progress) if progress else None
+
+def _delete_ticket_chunk(ticket_ids):
+    # Keep Tag.usage_count in step with the association rows about to go
+    tag_ids = [tag_id for (tag_id,) in db.session.query(ticket_tags.c.tag_id).filter(
+        ticket_tags.c.ticket_id.in_(ticket_ids)
+    )]
+    adjust_tag_usage(tag_ids, -1)
+    # Likewise the recipients' unread counters
+    discard_notifications(Notification.ticket_id.in_(ticket_ids))
+
+    for table in TICKET_CHILD_TABLES:
+        db.session.execute(table.delete().where(table.c.ticket_id.in_(ticket_ids)))
+    db.session.execute(Ticket.__table__.delete().where(Ticket.__table__.c.id.in_(ticket_ids)))
+
+def delete_tickets(ticket_ids, chunk_size=500, progress=None):
+    """Delete tickets and everything attached to them, one commit per chunk"""
+    ticket_ids = list(ticket_ids)
+    deleted = 0
+    for start in range(0, len(ticket_ids), chunk_size):
+        chunk = ticket_ids[start:start + chunk_size]
+        _delete_ticket_chunk(chunk)
+        db.session.commit()
+        deleted += len(chunk)
+        metrics.increment('deletion.tickets', len(chunk))
+        if progress:
+            progress(deleted, len(ticket_ids))
+    return deleted
+
+def delete_user(user_id, chunk_size=500):
+    """Delete a user, their tickets and their activity on other tickets"""
+    ticket_ids = [ticket_id for (ticket_id,) in db.session.query(Ticket.id).filter(
+        Ticket.user_id == user_id
+    ).order_by(Ticket.id)]
+    _set_progress(user_id, status='running', total=len(ticket_ids), done=0)
+
+    with metrics.timed('deletion.user'):
+        delete_tickets(ticket_ids, chunk_size=chunk_size,
+                       progress=lambda done, total: _set_progress(user_id, done=done))
+
+        # The user's footprint on other people's tickets
+        InboundEmail.query.filter(InboundEmail.comment_id.in_(
+            db.session.query(Comment.id).filter_by(user_id=user_id)
+        )).delete(synchronize_session=False)
+        Comment.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        Vote.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        TicketActivity.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        NotificationSettings.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        Notification.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        discard_notifications(Notification.actor_id == user_id)
+        TicketEscalation.query.filter_by(escalated_by=user_id).update(
+            {'escalated_by': None}, synchronize_session=False)
+        Ticket.query.filter_by(assigned_to=user_id).update(
+            {'assigned_to': None}, synchronize_session=False)
+        db.session.execute(agent_skills.delete().where(agent_skills.c.user_id == user_id))
+        User.query.filter_by(id=user_id).delete(synchronize_session=False)
+        # Bulk deletes skip mapper events, so tell the user directory directly
+        db.session.info['users_changed'] = True
+        db.session.commit()
+
+    _set_progress(user_id, status='completed')
+    return len(ticket_ids)
+
+def _delete_user_job(app, user_id, chunk_size):
+    with app.app_context():
+        try:
+            delete_user(user_id, chunk_size=chunk_size)
+        except Exception as e:
+            db.session.rollback()
+            _set_progress(user_id, status='failed', error=str(e))
+            app.logger.error(f'Background deletion of user {user_id} failed: {str(e)}')
+
+def delete_user_in_background(user, chunk_size=500):
+    """Deactivate user now and delete their data from a background thread"""
+    user.is_active = False
+    user.pending_deletion = True
+    db.session.commit()
+
+    _set_progress(user.id, status='queued', total=None, done=0)
+    threading.Thread(
+        target=_delete_user_job,
+        args=(current_app._get_current_object(), user.id, chunk_size),
+        daemon=True
+    ).start()
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+QuickDesk email-to-ticket ingestion
+
+Emails dropped into a local maildir (by the MTA, fetchmail or similar) or
+collected in an mbox file become tickets and comments without anyone
+re-typing them:
+
+- Messages are read one at a time and fed to the email parser as the bytes
+  are read, so memory use does not grow with the size of the mailbox.
+- A reply is added as a comment to the ticket it belongs to. It is matched by
+  the ticket number in its subject ("#123", as in notification subjects, or
+  "[#123]"), by the ticket-tagged Message-ID of the notification it answers,
+  or by In-Reply-To/References naming an email ingested earlier (even earlier
+  in the same batch). Only the ticket's creator and agents can comment by
+  email; anything else opens a new ticket. Quoted text is cut from replies.
+- The sender must be a QuickDesk user; unknown senders get a customer account
+  (no password until an administrator sets one) unless INBOUND_CREATE_USERS
+  is off, in which case their messages are skipped. Auto-replies and emails
+  from QuickDesk's own address are skipped to avoid mail loops.
+- Attachments with allowed extensions are stored like uploaded ones.
+- Messages are written INBOUND_BATCH_SIZE at a time: duplicates, senders and
+  thread targets are looked up with one query each, rows are inserted with
+  executemany, and the batch commits once. Every ingested Message-ID is kept
+  in inbound_email, so a mailbox can be ingested again without duplicates. A
+  batch that fails is retried one message at a time so one bad email does
+  not hold up the rest.
+
+With INBOUND_MAILDIR set, a scheduler job ingests its new/ directory every
+INBOUND_POLL_INTERVAL seconds and moves each message to cur/ once stored
+(flagged "F" if it could not be). Large imports can be run by hand:
+
+    python email_ingest.py --maildir /var/mail/support
+    python email_ingest.py --mbox archive.mbox --no-email
+"""
+
+import argparse
+import hashlib
+import html
+import os
+import re
+import secrets
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from email.header import decode_header, make_header
+from email.parser import BytesFeedParser
+from email.utils import parseaddr
+from flask import current_app
+from sqlalchemy import func
+from werkzeug.utils import secure_filename
+from models import Attachment, Category, Comment, InboundEmail, Ticket, TicketActivity, User, db
+from activity_log import activity_row
+from notifications import add_notifications, notification_rows, watchers
+from outbox import enqueue_email
+from sla import refresh_sla
+from utils import allowed_file
+import metrics
+
+# Bytes handed to the email parser at a time
+READ_CHUNK = 64 * 1024
+
+# "#123" after "Ticket" (notification subjects), or "[#123]" / "[QuickDesk #123]"
+SUBJECT_TAG = re.compile(r'\bticket\b[^#\n]{0,40}#(\d+)|\[(?:quickdesk\s*)?#(\d+)\]', re.IGNORECASE)
+
+# Message-IDs of notification emails name their ticket (see utils.build_notification_email)
+MESSAGE_ID_TAG = re.compile(r'\.quickdesk-ticket-(\d+)@')
+MESSAGE_ID = re.compile(r'<[^<>\s]+>')
+
+# Where the quoted original starts in a reply
+QUOTE_HEADER = re.compile(
+    r'^(?:On\s[^\n]{1,200}(?:\n[^\n]{1,100})?\swrote:\s*$|-{2,}\s*Original Message\s*-{2,}|From:\s.*\n(?:Sent|Date):\s)',
+    re.MULTILINE | re.IGNORECASE
+)
+
+AUTO_PRECEDENCE = ('bulk', 'junk', 'auto_reply')
+
+def _message_ids(value):
+    return MESSAGE_ID.findall(str(value or ''))
+
+class MboxSource:
+    """Messages of an mbox file, parsed line by line as the file is read"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        """Yield (key, message, sha256 hex digest of its bytes, size in bytes)"""
+        parser = None
+        lines = []
+        buffered = 0
+        previous_blank = True
+        with open(self.path, 'rb') as mailbox:
+            for line in mailbox:
+                # A "From " line after a blank line (or at the top) starts the next message
+                if previous_blank and line.startswith(b'From '):
+                    if parser is not None:
+                        yield None, self._close(parser, digest, lines), digest.hexdigest(), size
+                    parser, digest, size = BytesFeedParser(), hashlib.sha256(), 0
+                    lines, buffered = [], 0
+                    previous_blank = False
+                    continue
+                previous_blank = line in (b'\n', b'\r\n')
+                if parser is None:
+                    continue
+                if line.startswith(b'>') and line.lstrip(b'>').startswith(b'From '):
+                    # Body lines escaped as ">From " when the mailbox was written
+                    line = line[1:]
+                lines.append(line)
+                buffered += len(line)
+                size += len(line)
+                # The parser is fed in chunks rather than line by line
+                if buffered >= READ_CHUNK:
+                    self._feed(parser, digest, lines)
+                    lines, buffered = [], 0
+        if parser is not None:
+            yield None, self._close(parser, digest, lines), digest.hexdigest(), size
+
+    @staticmethod
+    def _feed(parser, digest, lines):
+        chunk = b''.join(lines)
+        parser.feed(chunk)
+        digest.update(chunk)
+
+    def _close(self, parser, digest, lines):
+        self._feed(parser, digest, lines)
+        return parser.close()
+
+    def done(self, keys, flags='S'):
+        # An mbox is left as it is; inbound_email keeps a re-run from duplicating anything
+        pass
+
+class MaildirSource:
+    """Messages delivered to a maildir's new/ directory, oldest first
+
+    done() moves handled messages to cur/ with the given maildir flags, so
+    each message is picked up once.
+    """
+
+    def __init__(self, path, limit=None):
+        self.path = path
+        self.limit = limit
+
+    def __iter__(self):
+        """Yield (file name, message, sha256 hex digest of its bytes, size in bytes)"""
+        new = os.path.join(self.path, 'new')
+        # Maildir names start with the delivery time
+        names = sorted(entry.name for entry in os.scandir(new) if entry.is_file() and not entry.name.startswith('.'))
+        for name in names[:self.limit]:
+            parser, digest, size = BytesFeedParser(), hashlib.sha256(), 0
+            try:
+                with open(os.path.join(new, name), 'rb') as message_file:
+                    for chunk in iter(lambda: message_file.read(READ_CHUNK), b''):
+                        parser.feed(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+            except FileNotFoundError:
+                # Taken by another reader
+                continue
+            yield name, parser.close(), digest.hexdigest(), size
+
+    def done(self, keys, flags='S'):
+        for name in keys:
+            try:
+                os.replace(os.path.join(self.path, 'new', name), os.path.join(self.path, 'cur', f'{name}:2,{flags}'))
+            except FileNotFoundError:
+                pass
+
+def html_to_text(value):
+    """Rough plain text of an HTML email body"""
+    value = re.sub(r'<(script|style)\b.*?</\1\s*>', '', value, flags=re.IGNORECASE | re.DOTALL)
+    value = re.sub(r'<br\s*/?>|</(p|div|li|tr|h\d)\s*>', '\n', value, flags=re.IGNORECASE)
+    value = html.unescape(re.sub(r'<[^>]+>', '', value))
+    return re.sub(r'\n[ \t]*\n(\s*\n)+', '\n\n', value)
+
+def strip_quoted(text):
+    """A reply without the message it quotes"""
+    match = QUOTE_HEADER.search(text)
+    if match:
+        text = text[:match.start()]
+    lines = text.rstrip().splitlines()
+    # Trailing "> ..." lines quoted without a header
+    while lines and (lines[-1].startswith('>') or not lines[-1].strip()):
+        lines.pop()
+    return '\n'.join(lines).strip() or text.strip()
+
+def _header(message, name):
+    """A header as text, with RFC 2047 encoded words decoded"""
+    value = message.get(name)
+    if value is None:
+        return ''
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, ValueError, UnicodeError):
+        return str(value)
+
+def _text(part):
+    payload = part.get_payload(decode=True) or b''
+    try:
+        return payload.decode(part.get_content_charset() or 'utf-8', 'replace')
+    except LookupError:
+        # Unknown charset
+        return payload.decode('utf-8', 'replace')
+
+def _is_attachment(part):
+    return str(part.get('Content-Disposition', '')).strip().lower().startswith('attachment')
+
+def _body_text(message):
+    """The plain text body, or the HTML one as text"""
+    html_part = None
+    for part in message.walk():
+        if part.is_multipart() or _is_attachment(part):
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            return _text(part).replace('\r\n', '\n').strip()
+        if content_type == 'text/html' and html_part is None:
+            html_part = part
+    return html_to_text(_text(html_part)).replace('\r\n', '\n').strip() if html_part is not None else ''
+
+def _is_automatic(message):
+    """Whether a message was sent by a machine: auto-replies, bounces, bulk mail"""
+    return (str(message.get('Auto-Submitted', 'no')).strip().lower() != 'no'
+            or str(message.get('Precedence', '')).strip().lower() in AUTO_PRECEDENCE
+            or 'X-Autoreply' in message or 'X-Autorespond' in message)
+
+def _priority(message):
+    urgent = str(message.get('X-Priority', '')).strip()[:1] in ('1', '2')
+    return 'high' if urgent or str(message.get('Importance', '')).strip().lower() == 'high' else 'medium'
+
+def parse_message(key, message, digest):
+    """The parts of an email ingestion needs, as a dict"""
+    message_ids = _message_ids(message.get('Message-ID'))
+    references = _message_ids(message.get('In-Reply-To')) + _message_ids(message.get('References'))
+    subject = ' '.join(_header(message, 'Subject').split())
+
+    ticket_ids = [int(next(group for group in match if group)) for match in SUBJECT_TAG.findall(subject)]
+    ticket_ids += [int(match) for reference in references for match in MESSAGE_ID_TAG.findall(reference)]
+
+    attachments = []
+    for part in message.walk():
+        filename = part.get_filename()
+        if part.is_multipart() or not filename:
+            continue
+        if allowed_file(filename):
+            attachments.append((filename, part.get_content_type(), part.get_payload(decode=True) or b''))
+
+    return {
+        'key': key,
+        'message_id': message_ids[0][:255] if message_ids else f'sha256:{digest}',
+        'references': list(dict.fromkeys(reference[:255] for reference in references)),
+        'ticket_ids': list(dict.fromkeys(ticket_ids)),
+        'sender': parseaddr(str(message.get('From', '')))[1].strip(),
+        'subject': subject,
+        'body': _body_text(message),
+        'attachments': attachments,
+        'priority': _priority(message),
+        'automatic': _is_automatic(message),
+    }
+
+def _username(email):
+    local = re.sub(r'[^a-z0-9._-]', '', email.split('@')[0].lower())[:60]
+    return local if len(local) >= 4 else f'{local}{secrets.token_hex(2)}'
+
+def _insert_ids(table, rows):
+    """Insert rows into table and return their new ids in the order given
+
+    One statement with RETURNING where the database supports it for many rows
+    (SQLite, PostgreSQL); row by row elsewhere, as MySQL has no RETURNING.
+    """
+    if not rows:
+        return []
+    if db.engine.dialect.insert_executemany_returning:
+        result = db.session.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows)
+        return [row_id for (row_id,) in result]
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+class EmailIngester:
+    """Stores parsed emails as tickets and comments, one transaction per batch"""
+
+    def __init__(self, batch_size=None, send_email=True):
+        config = current_app.config
+        self.batch_size = batch_size or config.get('INBOUND_BATCH_SIZE', 200)
+        self.send_email = send_email
+        self.create_users = config.get('INBOUND_CREATE_USERS', True)
+        self.category_name = config.get('INBOUND_CATEGORY')
+        self.max_attachment = config.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024
+        self.own_addresses = {str(address).lower() for address in
+                              (config.get('MAIL_USERNAME'), config.get('MAIL_DEFAULT_SENDER')) if address}
+        self.report = Counter()
+        self._written = []
+
+    def ingest(self, source):
+        """Ingest every message of source; returns the report Counter"""
+        started = time.perf_counter()
+        batch = []
+        for key, message, digest, size in source:
+            self.report['messages'] += 1
+            self.report['bytes'] += size
+            try:
+                batch.append(parse_message(key, message, digest))
+            except Exception as e:
+                self._failed(source, key, f'unreadable message: {e}')
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(source, batch)
+                batch = []
+        if batch:
+            self._flush(source, batch)
+        self.report['seconds'] += time.perf_counter() - started
+        metrics.increment('inbound.messages', self.report['messages'])
+        return self.report
+
+    def _failed(self, source, key, error):
+        self.report['failed'] += 1
+        metrics.increment('inbound.failed')
+        current_app.logger.error(f'Inbound email {key or ""} not ingested: {error}')
+        if key:
+            source.done([key], flags='F')
+
+    def _flush(self, source, batch):
+        try:
+            with metrics.timed('inbound.batch'):
+                counts = self._store(batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for path in self._written:
+                os.remove(path)
+            self._written = []
+            if len(batch) == 1:
+                self._failed(source, batch[0]['key'], e)
+                return
+            # Find the bad message: the others go in one per transaction
+            for item in batch:
+                self._flush(source, [item])
+            return
+
+        self._written = []
+        self.report.update(counts)
+        source.done([item['key'] for item in batch if item['key']])
+
+    def _category_id(self):
+        query = db.session.query(Category.id).filter(Category.is_active.is_(True))
+        if self.category_name:
+            query = query.filter(Category.name == self.category_name)
+        category_id = query.order_by(Category.id).limit(1).scalar()
+        if category_id is None:
+            raise RuntimeError(f'No active category {self.category_name or ""} for inbound tickets')
+        return category_id
+
+    def _senders(self, addresses, now, counts):
+        """{lowercased address: (user id, role, email)} for active users, creating missing ones"""
+        users = {}
+        lowered = {address.lower() for address in addresses}
+        # Addresses are case-insensitive on both sides: Alice@Example.com is alice@example.com
+        for user_id, role, email, is_active in db.session.query(
+            User.id, User.role, User.email, User.is_active
+        ).filter(func.lower(User.email).in_(lowered)):
+            users[email.lower()] = users.get(email.lower()) or ((user_id, role, email) if is_active else None)
+
+        missing = sorted(lowered - users.keys())
+        if missing and self.create_users:
+            names = {address: _username(address) for address in missing}
+            taken = {name for (name,) in db.session.query(User.username).filter(User.username.in_(names.values()))}
+            rows = []
+            for address in missing:
+                name = names[address]
+                if name in taken:
+                    name = f'{name}-{secrets.token_hex(3)}'
+                taken.add(name)
+                # '!' matches no password: the account cannot sign in until one is set
+                rows.append({'username': name, 'email': address, 'password_hash': '!', 'role': 'user',
+                             'is_active': True, 'created_at': now, 'updated_at': now})
+            for address, user_id in zip(missing, _insert_ids(User.__table__, rows)):
+                users[address] = (user_id, 'user', address)
+            counts['users_created'] += len(rows)
+            db.session.info['users_changed'] = True
+        return users
+
+    def _store(self, batch):
+        """Write one batch of parsed emails in the current transaction; returns the counts"""
+        counts = Counter()
+        now = datetime.utcnow()
+
+        # Already ingested, or twice in this batch
+        known = {message_id for (message_id,) in db.session.query(InboundEmail.message_id).filter(
+            InboundEmail.message_id.in_([item['message_id'] for item in batch])
+        )}
+        items = []
+        for item in batch:
+            if item['message_id'] in known:
+                counts['duplicates'] += 1
+            elif item['automatic'] or not item['sender'] or item['sender'].lower() in self.own_addresses:
+                counts['skipped'] += 1
+            else:
+                known.add(item['message_id'])
+                items.append(item)
+        if not items:
+            return counts
+
+        users = self._senders({item['sender'] for item in items}, now, counts)
+
+        # Every ticket the batch may reply to, with one query each
+        references = {reference for item in items for reference in item['references']}
+        threads = dict(db.session.query(InboundEmail.message_id, InboundEmail.ticket_id).filter(
+            InboundEmail.message_id.in_(references)
+        )) if references else {}
+        candidate_ids = {ticket_id for item in items for ticket_id in item['ticket_ids']} | set(threads.values())
+        tickets = {}
+        if candidate_ids:
+            for ticket_id, creator_id, assigned_to, creator_email in db.session.query(
+                Ticket.id, Ticket.user_id, Ticket.assigned_to, User.email
+            ).join(User, Ticket.user_id == User.id).filter(Ticket.id.in_(candidate_ids)):
+                tickets[ticket_id] = (creator_id, assigned_to, creator_email)
+
+        # Decide in mailbox order, so a reply can follow a message earlier in the batch
+        new_tickets = []
+        replies = []
+        local = {}  # Message-ID in this batch -> ('ticket', id) or ('new', index in new_tickets)
+        for item in items:
+            user = users.get(item['sender'].lower())
+            if user is None:
+                counts['unknown_senders'] += 1
+                continue
+            target = self._thread(item, user, tickets, threads, local, new_tickets)
+            if target is None:
+                target = ('new', len(new_tickets))
+                new_tickets.append((item, user))
+            else:
+                replies.append((item, user, target))
+            local[item['message_id']] = target
+
+        ticket_table = Ticket.__table__
+        category_id = self._category_id() if new_tickets else None
+        new_ids = _insert_ids(ticket_table, [{
+            'subject': (item['subject'] or '(no subject)')[:200],
+            'description': item['body'] or '(no content)',
+            'status': 'open', 'priority': item['priority'],
+            'user_id': user[0], 'category_id': category_id,
+            'created_at': now, 'updated_at': now,
+        } for item, user in new_tickets])
+        for (item, user), ticket_id in zip(new_tickets, new_ids):
+            tickets[ticket_id] = (user[0], None, user[2])
+
+        def ticket_of(target):
+            kind, value = target
+            return new_ids[value] if kind == 'new' else value
+
+        comment_ids = _insert_ids(Comment.__table__, [{
+            'content': strip_quoted(item['body']) or '(no content)', 'is_internal': False,
+            'ticket_id': ticket_of(target), 'user_id': user[0], 'created_at': now,
+        } for item, user, target in replies])
+
+        activities = [activity_row(ticket_id, user[0], 'created', created_at=now)
+                      for (item, user), ticket_id in zip(new_tickets, new_ids)]
+        notifications = []
+        inbound = [{'message_id': item['message_id'], 'ticket_id': ticket_id, 'comment_id': None, 'created_at': now}
+                   for (item, user), ticket_id in zip(new_tickets, new_ids)]
+        attachments = [(item, user, ticket_id) for (item, user), ticket_id in zip(new_tickets, new_ids)]
+        first_responses = set()
+        for (item, user, target), comment_id in zip(replies, comment_ids):
+            ticket_id = ticket_of(target)
+            creator_id, assigned_to, creator_email = tickets[ticket_id]
+            activities.append(activity_row(ticket_id, user[0], 'commented', created_at=now, m=comment_id))
+            notifications += notification_rows(ticket_id, user[0], 'commented', watchers(creator_id, assigned_to),
+                                               now, m=comment_id)
+            inbound.append({'message_id': item['message_id'], 'ticket_id': ticket_id, 'comment_id': comment_id,
+                            'created_at': now})
+            attachments.append((item, user, ticket_id))
+            if user[1] in ('agent', 'admin') and user[0] != creator_id:
+                first_responses.add(ticket_id)
+            if self.send_email and user[0] != creator_id:
+                enqueue_email(ticket_id, 'commented', creator_email)
+        if self.send_email:
+            for (item, user), ticket_id in zip(new_tickets, new_ids):
+                enqueue_email(ticket_id, 'created', user[2])
+
+        db.session.execute(TicketActivity.__table__.insert(), activities)
+        db.session.execute(InboundEmail.__table__.insert(), inbound)
+        if notifications:
+            add_notifications(notifications)
+        attachment_rows = self._save_attachments(attachments, now, counts)
+        if attachment_rows:
+            db.session.execute(Attachment.__table__.insert(), attachment_rows)
+
+        if new_ids:
+            refresh_sla(new_ids)
+        if first_responses:
+            # An agent's emailed reply is their first response, as in the web form
+            refresh_sla(first_responses, first_response_at=now)
+        commented = {ticket_of(target) for _, _, target in replies} - set(new_ids)
+        if commented:
+            db.session.execute(ticket_table.update().where(ticket_table.c.id.in_(commented)).values(updated_at=now))
+
+        counts['tickets'] += len(new_ids)
+        counts['comments'] += len(comment_ids)
+        metrics.increment('inbound.tickets', len(new_ids))
+        metrics.increment('inbound.comments', len(comment_ids))
+        return counts
+
+    def _thread(self, item, user, tickets, threads, local, new_tickets):
+        """The ticket a message replies to, if its sender may comment there"""
+        user_id, role, _ = user
+        is_agent = role in ('agent', 'admin')
+        targets = [('ticket', ticket_id) for ticket_id in item['ticket_ids']]
+        for reference in item['references']:
+            if reference in local:
+                targets.append(local[reference])
+            elif reference in threads:
+                targets.append(('ticket', threads[reference]))
+
+        for kind, value in targets:
+            if kind == 'new':
+                creator_id = new_tickets[value][1][0]
+            elif value in tickets:
+                creator_id = tickets[value][0]
+            else:
+                continue
+            if is_agent or creator_id == user_id:
+                return kind, value
+        return None
+
+    def _save_attachments(self, attachments, now, counts):
+        """Write attachment files to the upload folder; returns their Attachment rows"""
+        folder = current_app.config['UPLOAD_FOLDER']
+        rows = []
+        for item, user, ticket_id in attachments:
+            for filename, content_type, data in item['attachments']:
+                if len(data) > self.max_attachment:
+                    counts['attachments_skipped'] += 1
+                    continue
+                extension = filename.rsplit('.', 1)[1].lower()
+                stored = f'{uuid.uuid4()}_{secure_filename(filename) or "attachment." + extension}'
+                path = os.path.join(folder, stored)
+                with open(path, 'wb') as attachment_file:
+                    attachment_file.write(data)
+                self._written.append(path)
+                rows.append({'filename': stored, 'original_filename': filename[:255], 'file_size': len(data),
+                             'mime_type': content_type[:100], 'ticket_id': ticket_id, 'user_id': user[0],
+                             'created_at': now})
+        counts['attachments'] += len(rows)
+        return rows
+
+def summary(report):
+    """One-line description of an ingestion report"""
+    seconds = report['seconds'] or 1e-9
+    return (f"{report['messages']} message(s) in {report['seconds']:.1f}s "
+            f"({report['messages'] / seconds:.0f} msgs/sec, {report['bytes'] / seconds / 1e6:.1f} MB/s): "
+            f"{report['tickets']} ticket(s), {report['comments']} comment(s), "
+            f"{report['attachments']} attachment(s), {report['users_created']} new user(s); "
+            f"{report['duplicates']} duplicate(s), {report['skipped']} automatic, "
+            f"{report['unknown_senders']} from unknown senders, {report['failed']} failed")
+
+def ingest_maildir():
+    """Scheduler job: ingest what has been delivered to INBOUND_MAILDIR"""
+    report = EmailIngester().ingest(MaildirSource(current_app.config['INBOUND_MAILDIR']))
+    return summary(report) if report['messages'] else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Turn emails into QuickDesk tickets and comments')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--maildir', help='Maildir to ingest (default INBOUND_MAILDIR)')
+    source.add_argument('--mbox', help='mbox file to ingest')
+    parser.add_argument('--batch-size', type=int, help='Messages per transaction (default INBOUND_BATCH_SIZE)')
+    parser.add_argument('--no-email', action='store_true', help='Do not email the ticket creators, e.g. for an import')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.mbox:
+            source = MboxSource(args.mbox)
+        elif args.maildir or app.config['INBOUND_MAILDIR']:
+            source = MaildirSource(args.maildir or app.config['INBOUND_MAILDIR'])
+        else:
+            parser.error('give --maildir or --mbox, or set INBOUND_MAILDIR')
+        report = EmailIngester(batch_size=args.batch_size, send_email=not args.no_email).ingest(source)
+        print(f'Ingested {summary(report)}')
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, TextAreaField, PasswordField, SelectField, BooleanField, SubmitField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, Optional
+from wtforms import FloatField, StringField, TextAreaField, PasswordField, SelectField, SelectMultipleField, BooleanField, SubmitField, HiddenField
+from wtforms.validators import DataRequired, Email, Length, EqualTo, Optional, AnyOf, NumberRange, URL
 from wtforms.widgets import TextArea
 
 class LoginForm(FlaskForm):
@@ -55,8 +55,22 @@ class CategoryForm(FlaskForm):
     description = TextAreaField('Description', validators=[Optional()], 
                                widget=TextArea(), render_kw={"rows": 3})
     is_active = BooleanField('Active', default=True)
+    sla_first_response_hours = FloatField('First Response SLA (hours)', validators=[Optional(), NumberRange(min=0.1)])
+    sla_resolution_hours = FloatField('Resolution SLA (hours)', validators=[Optional(), NumberRange(min=0.1)])
     submit = SubmitField('Save Category')
 
+class WebhookForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired(), Length(max=100)])
+    url = StringField('Endpoint URL', validators=[DataRequired(), URL(require_tld=False), Length(max=500)])
+    events = SelectMultipleField('Events',
+                                 choices=[('created', 'Ticket created'), ('assigned', 'Assignment changed'),
+                                          ('status_changed', 'Status changed'), ('escalated', 'Escalated'),
+                                          ('commented', 'New comment')],
+                                 default=['created', 'assigned', 'status_changed', 'escalated', 'commented'],
+                                 validators=[DataRequired()])
+    is_active = BooleanField('Active', default=True)
+    submit = SubmitField('Add Webhook')
+
 class UserForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=20)])
     email = StringField('Email', validators=[DataRequired(), Email()])
@@ -65,6 +79,7 @@ class UserForm(FlaskForm):
                       choices=[('user', 'User'), ('agent', 'Agent'), ('admin', 'Admin')],
                       default='user')
     is_active = BooleanField('Active', default=True)
+    skills = SelectMultipleField('Category Skills', coerce=int, validators=[Optional()])
     submit = SubmitField('Save User')
 
 class SearchForm(FlaskForm):
@@ -112,6 +127,8 @@ class NotificationSettingsForm(FlaskForm):
     email_on_comment_added = BooleanField('New comment added')
     email_on_status_changed = BooleanField('Status changed')
     email_on_assignment = BooleanField('Ticket assigned to me')
+    digest_frequency = HiddenField('Email Digest', default='immediate',
+                                   validators=[AnyOf(['immediate', 'daily', 'weekly', 'never'])])
     submit = SubmitField('Save Settings')
 
 # Video call form removed as requested
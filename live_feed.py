@@ -0,0 +1,288 @@
+"""
+QuickDesk live dashboard feed
+
+The agent dashboard holds a Server-Sent Events stream (/api/live-feed) and
+patches the ticket cards and counters that changed, instead of reloading the
+whole page on a timer.
+
+One poller thread per process reads new ticket_event rows every
+LIVE_FEED_POLL_INTERVAL seconds, together with the current state of their
+tickets, and recomputes the dashboard counters once per batch of changes.
+Every connected client is fed from that one read, so the database sees the
+same few queries per interval however many dashboards are open, and none at
+all while nobody is connected.
+
+- Agents and admins receive every event plus the counters; other users only
+  receive events on their own tickets, without internal notes.
+- Events carry their ticket_event id. The last BUFFER_SIZE events are kept in
+  memory, so a browser reconnecting with Last-Event-ID catches up without a
+  query; one that fell further behind is told to reload.
+- A client that stops reading (a stalled connection) is cut off once its
+  queue fills, and reconnects.
+- Streams end after LIVE_FEED_STREAM_SECONDS and the browser reconnects, so a
+  worker thread is never held by one connection indefinitely. Each open
+  stream does occupy a worker thread, so run a threaded server.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import and_, case, func
+from models import Ticket, TicketActivity, User, db
+from activity_log import EVENT_NAMES, decode, referenced_user_ids, render
+import metrics
+
+OPEN_STATUSES = ('open', 'in_progress')
+
+# Events kept in memory for reconnecting clients
+BUFFER_SIZE = 500
+
+# Events read per poll
+POLL_BATCH = 500
+
+# Ids just below the newest one seen are re-checked on every poll, so an event
+# whose transaction committed after a later id was already read is not missed
+ID_OVERLAP = 50
+
+# Messages queued for one client before it is considered stalled
+CLIENT_QUEUE_SIZE = 200
+
+# Browser reconnect delay, in milliseconds
+RECONNECT_MS = 3000
+
+def dashboard_counts():
+    """The agent dashboard counters shared by every agent, in one query"""
+    is_open = Ticket.status.in_(OPEN_STATUSES)
+    total, open_tickets, unassigned, resolved_today, urgent = db.session.query(
+        func.count(Ticket.id),
+        func.sum(case((is_open, 1), else_=0)),
+        func.sum(case((Ticket.assigned_to.is_(None), 1), else_=0)),
+        func.sum(case((and_(Ticket.status == 'resolved', Ticket.updated_at >= datetime.utcnow().date()), 1), else_=0)),
+        func.sum(case((and_(Ticket.priority == 'urgent', is_open), 1), else_=0)),
+    ).one()
+    return {
+        'total_tickets': total,
+        'open_tickets': open_tickets or 0,
+        'unassigned': unassigned or 0,
+        'resolved_today': resolved_today or 0,
+        'urgent_tickets': urgent or 0,
+    }
+
+def assigned_counts(agent_ids):
+    """Tickets assigned to each agent id (the "My Assigned" counter)"""
+    counts = dict(db.session.query(Ticket.assigned_to, func.count(Ticket.id)).filter(
+        Ticket.assigned_to.in_(agent_ids)
+    ).group_by(Ticket.assigned_to).all()) if agent_ids else {}
+    return {agent_id: counts.get(agent_id, 0) for agent_id in agent_ids}
+
+def _message(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, separators=(",", ":"))}']
+    return '\n'.join(lines) + '\n\n'
+
+class _Client:
+    __slots__ = ('user_id', 'is_agent', 'queue')
+
+    def __init__(self, user_id, is_agent):
+        self.user_id = user_id
+        self.is_agent = is_agent
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+
+    def sees(self, audience_id):
+        return self.is_agent or self.user_id == audience_id
+
+class LiveFeed:
+    """Shared poller fanning new ticket events out to connected streams"""
+
+    def __init__(self):
+        self._app = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._clients = set()
+        self._recent = deque()  # (event id, non-agent user who may see it, message), oldest first
+        self._published = set()  # ids read within the overlap window
+        self._first_id = None  # events up to this id predate the feed
+        self._evicted_id = 0  # newest event dropped from _recent
+        self._last_id = None
+        self._stats = None
+
+    def init_app(self, app):
+        self._app = app
+        metrics.register_gauge('live_feed.clients', lambda: len(self._clients))
+
+    def _start(self):
+        """Start the poller once per process"""
+        # Started lazily so each forked worker process gets its own poller
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._first_id = self._last_id = db.session.query(func.max(TicketActivity.id)).scalar() or 0
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='live-feed', daemon=True).start()
+
+    def subscribe(self, user_id, is_agent, last_event_id=None):
+        """Register a client; returns it with the messages it missed since last_event_id"""
+        self._start()
+        client = _Client(user_id, is_agent)
+        backlog = []
+        with self._lock:
+            if last_event_id is not None and last_event_id < self._last_id:
+                if last_event_id < max(self._first_id, self._evicted_id):
+                    # Missed events that are no longer (or never were) buffered: reload instead
+                    backlog.append(_message('resync', {}))
+                else:
+                    backlog.extend(message for event_id, audience_id, message in self._recent
+                                   if event_id > last_event_id and client.sees(audience_id))
+                    if is_agent and self._stats:
+                        backlog.append(_message('stats', self._stats))
+            self._clients.add(client)
+        self._wakeup.set()
+        metrics.increment('live_feed.connections')
+        return client, backlog
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def stream(self, client, backlog):
+        """Server-Sent Events for one client, ending after LIVE_FEED_STREAM_SECONDS"""
+        config = self._app.config
+        heartbeat = config.get('LIVE_FEED_HEARTBEAT', 15)
+        deadline = time.monotonic() + config.get('LIVE_FEED_STREAM_SECONDS', 300)
+        try:
+            yield f'retry: {RECONNECT_MS}\n\n'
+            for message in backlog:
+                yield message
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    message = client.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(client)
+
+    def _send(self, client, message):
+        try:
+            client.queue.put_nowait(message)
+        except queue.Full:
+            # Stalled client: drop what it has not read and end its stream, so it
+            # reconnects and catches up from the buffer
+            self.unsubscribe(client)
+            try:
+                while True:
+                    client.queue.get_nowait()
+            except queue.Empty:
+                pass
+            client.queue.put_nowait(None)
+            metrics.increment('live_feed.dropped_clients')
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                if not self._clients:
+                    # Nobody is listening: no polling until someone subscribes
+                    self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+                try:
+                    self.poll()
+                except Exception as e:
+                    self._app.logger.error(f'Live feed poll failed: {str(e)}')
+                finally:
+                    # Do not hold a pooled connection between polls
+                    db.session.remove()
+                time.sleep(self._app.config.get('LIVE_FEED_POLL_INTERVAL', 2))
+
+    def poll(self):
+        """Read new events once and publish them to every client; returns how many"""
+        floor = max(self._last_id - ID_OVERLAP, self._first_id)
+        new_ids = [event_id for (event_id,) in db.session.query(TicketActivity.id).filter(
+            TicketActivity.id > floor
+        ).order_by(TicketActivity.id).limit(POLL_BATCH + ID_OVERLAP) if event_id not in self._published]
+        if not new_ids:
+            return 0
+
+        with metrics.timed('live_feed.poll'):
+            rows = db.session.query(
+                TicketActivity.id, TicketActivity.event, TicketActivity.data, TicketActivity.created_at,
+                User.username, Ticket.id, Ticket.subject, Ticket.status, Ticket.priority, Ticket.assigned_to,
+                Ticket.user_id, Ticket.category_id, Ticket.updated_at
+            ).join(User, TicketActivity.user_id == User.id).join(
+                Ticket, TicketActivity.ticket_id == Ticket.id
+            ).filter(TicketActivity.id.in_(new_ids)).order_by(TicketActivity.id).all()
+
+            user_ids = set().union(*(referenced_user_ids(row[1], row[2]) for row in rows))
+            user_ids.update(row[9] for row in rows if row[9])
+            usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+
+            events = []
+            for (event_id, event, data, created_at, actor, ticket_id, subject, status, priority,
+                 assigned_to, owner_id, category_id, updated_at) in rows:
+                # Internal notes are for agents only
+                audience_id = None if decode(data).get('i') else owner_id
+                events.append((event_id, audience_id, _message('activity', {
+                    'id': event_id,
+                    'event': EVENT_NAMES.get(event, 'other'),
+                    'description': render(event, data, actor, username=usernames.get),
+                    'actor': actor,
+                    'created_at': created_at.isoformat() if created_at else None,
+                    'ticket': {
+                        'id': ticket_id,
+                        'subject': subject,
+                        'status': status,
+                        'priority': priority,
+                        'assigned_to': assigned_to,
+                        'assignee': usernames.get(assigned_to),
+                        'category_id': category_id,
+                        'updated_at': updated_at.isoformat() if updated_at else None,
+                    },
+                }, event_id)))
+
+            with self._lock:
+                clients = list(self._clients)
+            agents = [client for client in clients if client.is_agent]
+            stats = dashboard_counts() if agents else None
+            mine = assigned_counts({client.user_id for client in agents}) if agents else {}
+
+        with self._lock:
+            for event in events:
+                if len(self._recent) == BUFFER_SIZE:
+                    self._evicted_id = max(self._evicted_id, self._recent.popleft()[0])
+                self._recent.append(event)
+            self._last_id = max(self._last_id, new_ids[-1])
+            floor = self._last_id - ID_OVERLAP
+            self._published = {event_id for event_id in self._published.union(new_ids) if event_id > floor}
+            if stats:
+                self._stats = stats
+
+        for client in clients:
+            for event_id, audience_id, message in events:
+                if client.sees(audience_id):
+                    self._send(client, message)
+            if client.is_agent:
+                self._send(client, _message('stats', dict(stats, my_assigned=mine[client.user_id])))
+
+        metrics.increment('live_feed.events', len(events))
+        return len(events)
+
+live_feed = LiveFeed()
+
+def init_live_feed(app):
+    """Attach the process-wide live feed to app"""
+    live_feed.init_app(app)
@@ -0,0 +1,138 @@
+"""
+QuickDesk pooled SMTP transport
+
+Flask-Mail's mail.send() opens a new SMTP connection for every message:
+TCP connect, EHLO, STARTTLS and login, then QUIT. SMTPPool keeps
+authenticated connections open and hands them out again, so a burst of
+notification emails (bulk actions, auto-assignment) pays the handshake once
+per connection rather than once per message.
+
+- Connections are checked out by one thread at a time and returned after
+  use; at most MAIL_POOL_SIZE idle connections are kept.
+- A connection idle for longer than MAIL_POOL_IDLE_TIMEOUT seconds is closed
+  instead of reused, since servers drop quiet clients.
+- send_batch() sends a list of messages over one connection. If the server
+  has dropped the connection, it reconnects and retries the message once.
+  Other errors (a refused recipient, a 4xx/5xx reply to DATA) fail only that
+  message, and the connection stays in use.
+- MAIL_MAX_EMAILS, if set, still makes Flask-Mail reconnect after that many
+  messages on one connection.
+"""
+
+import atexit
+import smtplib
+import threading
+import time
+from flask import current_app
+from flask_mail import Connection
+import metrics
+
+# Errors meaning the connection itself is unusable; the message is retried once
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+class SMTPPool:
+    """Pool of open, authenticated Flask-Mail connections"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []  # (connection, returned_at), most recently used last
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        metrics.register_gauge('smtp.idle_connections', lambda: len(self._idle))
+        atexit.register(self.close_all)
+
+    def _config(self, name, default):
+        return (self._app or current_app).config.get(name, default)
+
+    def _open(self):
+        app = self._app or current_app._get_current_object()
+        connection = Connection(app.extensions['mail'])
+        with metrics.timed('smtp.connect'):
+            connection.__enter__()
+        metrics.increment('smtp.connections_opened')
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            # The server may already have dropped it
+            pass
+
+    def acquire(self):
+        """Check out an open connection, reusing an idle one when possible"""
+        idle_timeout = self._config('MAIL_POOL_IDLE_TIMEOUT', 60)
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, returned_at = self._idle.pop()
+            if time.monotonic() - returned_at <= idle_timeout:
+                metrics.increment('smtp.connections_reused')
+                return connection
+            self._close(connection)
+        return self._open()
+
+    def release(self, connection):
+        """Return a healthy connection to the pool"""
+        with self._lock:
+            if len(self._idle) < self._config('MAIL_POOL_SIZE', 4):
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def send_batch(self, messages):
+        """Send messages over one pooled connection; returns one error (or None) per message"""
+        errors = []
+        connection = None
+        try:
+            for message in messages:
+                started = time.perf_counter()
+                for attempt in (1, 2):
+                    try:
+                        if connection is None:
+                            connection = self.acquire()
+                        connection.send(message)
+                        error = None
+                    except CONNECTION_ERRORS as e:
+                        # Stale or dropped connection: reconnect and retry once
+                        if connection is not None:
+                            self._close(connection)
+                            connection = None
+                        error = e
+                        if attempt == 1:
+                            metrics.increment('smtp.reconnects')
+                            continue
+                    except Exception as e:
+                        error = e
+                    break
+                metrics.record_timing('smtp.send', time.perf_counter() - started)
+                metrics.increment('smtp.errors' if error else 'smtp.messages')
+                errors.append(error)
+        except BaseException:
+            if connection is not None:
+                self._close(connection)
+            raise
+        if connection is not None:
+            self.release(connection)
+        return errors
+
+    def send(self, message):
+        """Send one message over a pooled connection, raising on failure"""
+        error = self.send_batch([message])[0]
+        if error is not None:
+            raise error
+
+smtp_pool = SMTPPool()
+
+def init_mail_transport(app):
+    """Attach the process-wide SMTP connection pool to app"""
+    smtp_pool.init_app(app)
@@ -0,0 +1,77 @@
+"""
+QuickDesk in-process metrics
+
+A small, dependency-free registry of counters, gauges and timings. Values live
+in memory for the lifetime of the worker process and are exposed to
+administrators through the /admin/api/metrics endpoint.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_gauge_callbacks = {}
+_timings = {}
+
+def increment(name, value=1):
+    """Increase a counter by value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def set_gauge(name, value):
+    """Record the current value of a gauge"""
+    with _lock:
+        _gauges[name] = value
+
+def register_gauge(name, callback):
+    """Register a callable evaluated whenever a snapshot is taken"""
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+def record_timing(name, seconds):
+    """Record a duration in seconds"""
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['last'] = seconds
+        if seconds > timing['max']:
+            timing['max'] = seconds
+
+@contextmanager
+def timed(name):
+    """Context manager recording the duration of the enclosed block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+def snapshot():
+    """Return a JSON-serialisable copy of all metrics"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        timings = {
+            name: dict(values, avg=values['total'] / values['count'] if values['count'] else 0.0)
+            for name, values in _timings.items()
+        }
+
+    for name, callback in callbacks.items():
+        try:
+            gauges[name] = callback()
+        except Exception:
+            gauges[name] = None
+
+    return {'counters': counters, 'gauges': gauges, 'timings': timings}
+
+def reset():
+    """Clear all recorded values (registered gauge callbacks are kept)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+QuickDesk Database Migration
+Brings an existing database up to date with the current models.
+
+db.create_all() only creates missing tables, so columns and indexes added to
+existing tables are applied here. Every step is idempotent and safe to re-run.
+"""
+
+import sys
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from app import app, db
+from models import Comment, Ticket, TicketActivity, User
+from activity_log import convert_legacy
+from sla import TRACKED_STATUSES, refresh_sla
+
+# Legacy activity rows moved per transaction, so the app keeps running meanwhile
+ACTIVITY_BATCH_SIZE = 5000
+
+def _has_column(table, column):
+    return column in {c['name'] for c in inspect(db.engine).get_columns(table)}
+
+def _has_index(table, index):
+    return index in {i['name'] for i in inspect(db.engine).get_indexes(table)}
+
+def _add_column(table, column):
+    """ALTER TABLE ... ADD COLUMN, with the table name quoted and the column compiled for the current dialect
+
+    `user` is a reserved word on PostgreSQL, and boolean defaults differ between dialects.
+    """
+    dialect = db.engine.dialect
+    column_ddl = CreateColumn(column).compile(dialect=dialect)
+    db.session.execute(text(f'ALTER TABLE {dialect.identifier_preparer.quote(table)} ADD COLUMN {column_ddl}'))
+
+def add_tag_usage_count():
+    """Add Tag.usage_count and backfill it from ticket_tags"""
+    if not _has_column('tag', 'usage_count'):
+        db.session.execute(text('ALTER TABLE tag ADD COLUMN usage_count INTEGER NOT NULL DEFAULT 0'))
+        db.session.execute(text(
+            'UPDATE tag SET usage_count = '
+            '(SELECT COUNT(*) FROM ticket_tags WHERE ticket_tags.tag_id = tag.id)'
+        ))
+        print("  + tag.usage_count")
+    if not _has_index('tag', 'ix_tag_usage_count'):
+        db.session.execute(text('CREATE INDEX ix_tag_usage_count ON tag (usage_count)'))
+        print("  + ix_tag_usage_count")
+
+def add_user_pending_deletion():
+    """Add User.pending_deletion for background account deletion"""
+    if not _has_column('user', 'pending_deletion'):
+        _add_column('user', sa.Column('pending_deletion', sa.Boolean, nullable=False, server_default=sa.false()))
+        print("  + user.pending_deletion")
+
+def add_user_unread_notifications():
+    """Add the User.unread_notifications counter behind the navbar badge"""
+    if not _has_column('user', 'unread_notifications'):
+        _add_column('user', sa.Column('unread_notifications', sa.Integer, nullable=False, server_default='0'))
+        print("  + user.unread_notifications")
+
+def add_ticket_queue_index():
+    """Index unassigned tickets by priority and age for the work queue"""
+    if not _has_index('ticket', 'ix_ticket_queue'):
+        db.session.execute(text('CREATE INDEX ix_ticket_queue ON ticket (assigned_to, priority, created_at)'))
+        print("  + ix_ticket_queue")
+
+def add_notification_digests():
+    """Add digest frequency to NotificationSettings and digest claiming to the email outbox"""
+    if not _has_column('notification_settings', 'digest_frequency'):
+        db.session.execute(text(
+            "ALTER TABLE notification_settings ADD COLUMN digest_frequency VARCHAR(20) NOT NULL DEFAULT 'immediate'"
+        ))
+        print("  + notification_settings.digest_frequency")
+    if not _has_column('email_outbox', 'digest'):
+        _add_column('email_outbox', sa.Column('digest', sa.Boolean, nullable=False, server_default=sa.false()))
+        print("  + email_outbox.digest")
+    if not _has_column('email_outbox', 'claim_token'):
+        db.session.execute(text('ALTER TABLE email_outbox ADD COLUMN claim_token VARCHAR(32)'))
+        print("  + email_outbox.claim_token")
+    if not _has_index('email_outbox', 'ix_email_outbox_claim_token'):
+        db.session.execute(text('CREATE INDEX ix_email_outbox_claim_token ON email_outbox (claim_token)'))
+        print("  + ix_email_outbox_claim_token")
+    if not _has_index('email_outbox', 'ix_email_outbox_recipient'):
+        db.session.execute(text('CREATE INDEX ix_email_outbox_recipient ON email_outbox (recipient, status)'))
+        print("  + ix_email_outbox_recipient")
+
+def add_ticket_sla():
+    """Add the SLA tracking columns and index, and compute deadlines for open tickets"""
+    ticket_table = Ticket.__table__
+    for table, column in (
+        ('category', sa.Column('sla_first_response_hours', sa.Float)),
+        ('category', sa.Column('sla_resolution_hours', sa.Float)),
+        ('ticket', sa.Column('sla_stage', sa.String(20))),
+        ('ticket', sa.Column('sla_due_at', sa.DateTime)),
+        ('ticket', sa.Column('sla_started_at', sa.DateTime)),
+    ):
+        if not _has_column(table, column.name):
+            _add_column(table, column)
+            print(f"  + {table}.{column.name}")
+
+    if not _has_column('ticket', 'first_response_at'):
+        _add_column('ticket', sa.Column('first_response_at', sa.DateTime))
+        # An agent's first public comment, or failing that the last update of a ticket moved on from 'open'
+        first_agent_comment = sa.select(sa.func.min(Comment.created_at)).join(
+            User, User.id == Comment.user_id
+        ).where(
+            Comment.ticket_id == ticket_table.c.id,
+            Comment.is_internal.is_(False),
+            Comment.user_id != ticket_table.c.user_id,
+            User.role.in_(('agent', 'admin')),
+        ).scalar_subquery()
+        # updated_at is set to itself, or its onupdate default would stamp every ticket
+        db.session.execute(ticket_table.update().values(
+            first_response_at=first_agent_comment, updated_at=ticket_table.c.updated_at
+        ))
+        db.session.execute(ticket_table.update().where(
+            ticket_table.c.first_response_at.is_(None), ticket_table.c.status != 'open'
+        ).values(first_response_at=ticket_table.c.updated_at, updated_at=ticket_table.c.updated_at))
+        print("  + ticket.first_response_at")
+
+    if not _has_index('ticket', 'ix_ticket_sla_due'):
+        db.session.execute(text('CREATE INDEX ix_ticket_sla_due ON ticket (sla_due_at)'))
+        print("  + ix_ticket_sla_due")
+
+    # Resolved and closed tickets restart their clock if they are reopened
+    db.session.execute(ticket_table.update().where(
+        ticket_table.c.status.notin_(TRACKED_STATUSES), ticket_table.c.sla_stage.is_(None)
+    ).values(sla_stage='paused', updated_at=ticket_table.c.updated_at))
+
+    ticket_ids = [ticket_id for (ticket_id,) in db.session.query(Ticket.id).filter(
+        Ticket.status.in_(TRACKED_STATUSES), Ticket.sla_stage.is_(None)
+    )]
+    if ticket_ids:
+        refresh_sla(ticket_ids)
+        print(f"  ~ SLA deadlines computed for {len(ticket_ids)} open ticket(s)")
+
+def _legacy_activity_bytes():
+    """Row count and bytes of the free-text activity columns"""
+    return db.session.execute(text(
+        'SELECT COUNT(*), COALESCE(SUM(LENGTH(activity_type) + COALESCE(LENGTH(description), 0) + '
+        'COALESCE(LENGTH(old_value), 0) + COALESCE(LENGTH(new_value), 0)), 0) FROM ticket_activity'
+    )).one()
+
+def compact_activity_bytes():
+    """Row count and bytes of the compact event columns (2 bytes per event code)"""
+    return db.session.execute(text(
+        'SELECT COUNT(*), COALESCE(SUM(2 + COALESCE(LENGTH(data), 0)), 0) FROM ticket_event'
+    )).one()
+
+def compact_ticket_activity():
+    """Move free-text ticket_activity rows into the compact ticket_event table"""
+    if not inspect(db.engine).has_table('ticket_activity'):
+        return
+
+    legacy_rows, legacy_bytes = _legacy_activity_bytes()
+    compact_before = compact_activity_bytes()
+    user_ids = dict(db.session.query(User.username, User.id).all())
+    moved = 0
+
+    # Each batch is copied and deleted in one short transaction, so the move is
+    # resumable and other requests keep writing between batches
+    while True:
+        rows = db.session.execute(text(
+            'SELECT a.id, a.ticket_id, a.user_id, a.activity_type, a.description, a.old_value, a.new_value, a.created_at '
+            'FROM ticket_activity a ORDER BY a.id LIMIT :limit'
+        ).columns(created_at=db.DateTime), {'limit': ACTIVITY_BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        events = []
+        for row in rows:
+            event, data = convert_legacy(row.activity_type, row.description, row.old_value, row.new_value, user_ids)
+            events.append({'ticket_id': row.ticket_id, 'user_id': row.user_id, 'event': event,
+                           'data': data, 'created_at': row.created_at})
+        db.session.execute(TicketActivity.__table__.insert(), events)
+        db.session.execute(text('DELETE FROM ticket_activity WHERE id <= :last_id'), {'last_id': rows[-1].id})
+        db.session.commit()
+        moved += len(rows)
+        print(f"  ticket_activity -> ticket_event: {moved}/{legacy_rows}")
+
+    db.session.execute(text('DROP TABLE ticket_activity'))
+    db.session.commit()
+
+    compact_bytes = compact_activity_bytes()[1] - compact_before[1]
+    if legacy_rows:
+        print(f"  activity size: {legacy_bytes:,} -> {compact_bytes:,} payload bytes for {legacy_rows:,} rows "
+              f"({legacy_bytes / legacy_rows:.0f} -> {compact_bytes / legacy_rows:.0f} bytes/row, "
+              f"{100 * (1 - compact_bytes / legacy_bytes) if legacy_bytes else 0:.0f}% smaller)")
+        if db.engine.dialect.name == 'sqlite':
+            print("  run VACUUM to return the freed pages to the filesystem")
+
+def add_ticket_event_autoincrement():
+    """Rebuild ticket_event with AUTOINCREMENT so SQLite never reuses the id of a deleted event
+
+    Event ids are the change feed's and webhooks' cursors; a reused id would be skipped by them.
+    Other databases never reuse sequence values.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    table_sql = db.session.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'ticket_event'"
+    )).scalar()
+    if not table_sql or 'AUTOINCREMENT' in table_sql.upper():
+        return
+
+    table = TicketActivity.__table__
+    columns = ', '.join(column.name for column in table.columns)
+    db.session.execute(text('ALTER TABLE ticket_event RENAME TO ticket_event_old'))
+    for index in table.indexes:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    table.create(db.session.connection())
+    # Copying the rows with their ids also sets the AUTOINCREMENT counter past the newest one
+    db.session.execute(text(f'INSERT INTO ticket_event ({columns}) SELECT {columns} FROM ticket_event_old'))
+    db.session.execute(text('DROP TABLE ticket_event_old'))
+    db.session.commit()
+    print("  ~ ticket_event ids no longer reused")
+
+# Applied in order
+MIGRATIONS = [
+    add_tag_usage_count,
+    add_user_pending_deletion,
+    add_ticket_queue_index,
+    compact_ticket_activity,
+    add_notification_digests,
+    add_user_unread_notifications,
+    add_ticket_event_autoincrement,
+    add_ticket_sla,
+]
+
+def upgrade_schema():
+    """Create missing tables and apply all pending column/index migrations"""
+    db.create_all()
+    for migration in MIGRATIONS:
+        migration()
+    db.session.commit()
+
+def main():
+    print("Migrating QuickDesk database...")
+    try:
+        with app.app_context():
+            upgrade_schema()
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    print("Database is up to date.")
+
+if __name__ == '__main__':
+    main()
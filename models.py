@@ -2,9 +2,11 @@ from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from db_engine import RoutingSession
+from activity_log import EVENT_NAMES, referenced_category_ids, referenced_user_ids, render as render_activity
 
 # Initialize db here, will be configured in app.py
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Association table for many-to-many relationship between tickets and tags
 ticket_tags = db.Table('ticket_tags',
@@ -12,6 +14,12 @@ ticket_tags = db.Table('ticket_tags',
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
 )
 
+# Association table for the ticket categories an agent is skilled in (used by auto-assignment)
+agent_skills = db.Table('agent_skills',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True)
+)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -29,12 +37,15 @@ class User(UserMixin, db.Model):
     last_login = db.Column(db.DateTime)
     email_notifications = db.Column(db.Boolean, default=True)
     dark_mode = db.Column(db.Boolean, default=False)
+    pending_deletion = db.Column(db.Boolean, default=False, nullable=False)
+    unread_notifications = db.Column(db.Integer, default=0, nullable=False)  # Unread Notification rows, maintained on write
     
     # Relationships
     tickets = db.relationship('Ticket', backref='creator', lazy=True, foreign_keys='Ticket.user_id')
     assigned_tickets = db.relationship('Ticket', backref='assignee', lazy=True, foreign_keys='Ticket.assigned_to')
     comments = db.relationship('Comment', backref='author', lazy=True)
     votes = db.relationship('Vote', backref='user', lazy=True)
+    skills = db.relationship('Category', secondary=agent_skills, lazy=True)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -57,6 +68,10 @@ class Category(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+
+    # Optional SLA targets in hours, tightening the per-priority defaults (see sla.py)
+    sla_first_response_hours = db.Column(db.Float)
+    sla_resolution_hours = db.Column(db.Float)
     
     # Relationships
     tickets = db.relationship('Ticket', backref='category', lazy=True)
@@ -72,6 +87,12 @@ class Ticket(db.Model):
     priority = db.Column(db.String(20), default='medium')  # low, medium, high, urgent
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # SLA tracking (see sla.py): the deadline being tracked and when it passes
+    first_response_at = db.Column(db.DateTime)
+    sla_stage = db.Column(db.String(20))  # response, resolution, breached, paused
+    sla_due_at = db.Column(db.DateTime)
+    sla_started_at = db.Column(db.DateTime)  # When the ticket was last reopened; NULL counts from created_at
     
     # Foreign Keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -83,6 +104,13 @@ class Ticket(db.Model):
     votes = db.relationship('Vote', backref='ticket', lazy=True, cascade='all, delete-orphan')
     attachments = db.relationship('Attachment', backref='ticket', lazy=True, cascade='all, delete-orphan')
     tags = db.relationship('Tag', secondary=ticket_tags, lazy='subquery', backref=db.backref('tickets', lazy=True))
+
+    __table_args__ = (
+        # Serves the agent work queue: unassigned tickets by priority, oldest first
+        db.Index('ix_ticket_queue', 'assigned_to', 'priority', 'created_at'),
+        # Serves the SLA scanner: tickets past their deadline, most overdue first
+        db.Index('ix_ticket_sla_due', 'sla_due_at'),
+    )
     
     @property
     def vote_score(self):
@@ -143,6 +171,7 @@ class Tag(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    usage_count = db.Column(db.Integer, default=0, nullable=False, index=True)  # Tickets using this tag, maintained on write
 
     def __repr__(self):
         return f'<Tag {self.name}>'
@@ -170,6 +199,8 @@ class NotificationSettings(db.Model):
     email_on_comment_added = db.Column(db.Boolean, default=True)
     email_on_status_changed = db.Column(db.Boolean, default=True)
     email_on_assignment = db.Column(db.Boolean, default=True)
+    # immediate (bursts coalesced), daily, weekly or never; see outbox.py
+    digest_frequency = db.Column(db.String(20), nullable=False, default='immediate')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -179,18 +210,185 @@ class NotificationSettings(db.Model):
         return f'<NotificationSettings {self.user_id}>'
 
 class TicketActivity(db.Model):
+    # Compact encoding (see activity_log.py); rows of the old free-text
+    # ticket_activity table are moved here by migrate_database.py
+    __tablename__ = 'ticket_event'
+
     id = db.Column(db.Integer, primary_key=True)
-    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    activity_type = db.Column(db.String(50), nullable=False)  # created, updated, commented, assigned, etc.
-    description = db.Column(db.Text)
-    old_value = db.Column(db.Text)
-    new_value = db.Column(db.Text)
+    event = db.Column(db.SmallInteger, nullable=False)  # activity_log.EVENTS code
+    data = db.Column(db.Text)  # compact JSON of structured old/new values
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Ids are cursors for the change feed and webhooks, so SQLite must never
+    # hand out the id of a deleted newest row again
+    __table_args__ = {'sqlite_autoincrement': True}
+
     # Relationships
-    ticket = db.relationship('Ticket', backref='activities')
+    ticket = db.relationship('Ticket', backref=db.backref(
+        'activities', order_by='(TicketActivity.created_at, TicketActivity.id)'))
     user = db.relationship('User', backref='activities')
 
+    @property
+    def activity_type(self):
+        return EVENT_NAMES.get(self.event, 'other')
+
+    @staticmethod
+    def resolve_names(activities):
+        """Look up the users and categories that rows' descriptions mention, in one query each"""
+        activities = list(activities)
+        user_ids = {activity.user_id for activity in activities}.union(
+            *(referenced_user_ids(activity.event, activity.data) for activity in activities))
+        category_ids = set().union(*(referenced_category_ids(activity.event, activity.data) for activity in activities))
+        usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+        category_names = dict(db.session.query(Category.id, Category.name).filter(
+            Category.id.in_(category_ids))) if category_ids else {}
+        for activity in activities:
+            activity._names = (usernames, category_names)
+        return activities
+
+    @property
+    def description(self):
+        """Sentence rendered from the event code and payload
+
+        Lists of rows should go through resolve_names() first; otherwise each row looks up its own names.
+        """
+        if getattr(self, '_names', None) is None:
+            TicketActivity.resolve_names([self])
+        usernames, category_names = self._names
+        return render_activity(self.event, self.data, usernames.get(self.user_id, 'unknown'),
+                               username=usernames.get, category_name=category_names.get)
+
     def __repr__(self):
         return f'<TicketActivity {self.activity_type}>'
+
+class Notification(db.Model):
+    # In-app notification, one row per recipient per event (see notifications.py);
+    # event and data use the same codes and payloads as TicketActivity
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Recipient
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False, index=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event = db.Column(db.SmallInteger, nullable=False)  # activity_log.EVENTS code
+    data = db.Column(db.Text)  # compact JSON of structured old/new values
+    read_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Inbox pages walk a user's rows newest first by id
+        db.Index('ix_notification_inbox', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Notification {EVENT_NAMES.get(self.event, "other")} for {self.user_id}>'
+
+class EmailOutbox(db.Model):
+    # Notification emails waiting to be sent (see outbox.py); rows are added in
+    # the same transaction as the ticket change and removed once delivered
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: a queued email must not block deleting its ticket
+    ticket_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    params = db.Column(db.Text)  # JSON keyword arguments for build_notification_email
+    base_url = db.Column(db.String(255))  # Host of the originating request, for links
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    digest = db.Column(db.Boolean, nullable=False, default=False)  # Held for the recipient's daily/weekly digest
+    claim_token = db.Column(db.String(32), index=True)  # Identifies the worker claim that owns the row
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_recipient', 'recipient', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.event_type} to {self.recipient}>'
+
+class JobLease(db.Model):
+    # Which process runs a periodic job (see scheduler.py); one row per job, taken
+    # over by another process once expires_at passes without a renewal
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))  # host:pid:token of the process holding the lease
+    expires_at = db.Column(db.DateTime, nullable=False)
+    last_run_at = db.Column(db.DateTime)  # When the last run started, on whichever process
+
+    def __repr__(self):
+        return f'<JobLease {self.name} held by {self.holder}>'
+
+class JobRun(db.Model):
+    # Run history of periodic jobs, pruned after SCHEDULER_HISTORY_DAYS
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    holder = db.Column(db.String(100), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Float, nullable=False)  # Seconds
+    status = db.Column(db.String(20), nullable=False)  # succeeded, failed
+    result = db.Column(db.String(255))
+    error = db.Column(db.Text)
+
+    __table_args__ = (
+        # Latest runs of one job, newest first
+        db.Index('ix_job_run_job', 'job', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<JobRun {self.job} {self.status}>'
+
+class WebhookSubscription(db.Model):
+    # An endpoint receiving ticket events (see webhooks.py)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False)  # HMAC-SHA256 signing key
+    events = db.Column(db.String(255), nullable=False)  # Comma-separated webhook event types
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # Newest ticket_event queued for it
+    claim_token = db.Column(db.String(32))  # Dispatcher worker currently delivering to it
+    claimed_until = db.Column(db.DateTime)
+    retry_at = db.Column(db.DateTime)  # Backing off after a failed delivery
+    failures = db.Column(db.Integer, nullable=False, default=0)  # Consecutive failed deliveries
+    last_error = db.Column(db.Text)
+    last_delivery_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def event_types(self):
+        return [name for name in self.events.split(',') if name]
+
+    def __repr__(self):
+        return f'<WebhookSubscription {self.name}>'
+
+class WebhookDelivery(db.Model):
+    # Queued webhook events, removed once delivered (see webhooks.py)
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('webhook_subscription.id'), nullable=False)
+    event_id = db.Column(db.Integer, nullable=False)  # ticket_event id, the consumer's idempotency key
+    payload = db.Column(db.Text, nullable=False)  # JSON of the event as delivered
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # A subscription's queue, oldest first
+        db.Index('ix_webhook_delivery_queue', 'subscription_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<WebhookDelivery {self.event_id} to {self.subscription_id}>'
+
+class InboundEmail(db.Model):
+    # Emails turned into tickets and comments (see email_ingest.py), found by Message-ID
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.String(255), unique=True, nullable=False)  # Or a digest, for messages without one
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comment.id'))  # None for the email that opened the ticket
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InboundEmail {self.message_id}>'
@@ -0,0 +1,120 @@
+"""
+QuickDesk in-app notifications
+
+Notifications are fanned out on write: the handlers that record a ticket
+event (assignment, status change, escalation, a new comment) also insert one
+Notification row per interested user in the same transaction, so reading a
+user's inbox is a single indexed range scan on (user_id, id).
+
+Who is notified:
+    - the ticket creator, for every event on their ticket except internal notes
+    - the assigned agent, for events on tickets assigned to them
+    - the newly assigned agent, and the previous one when a ticket is unassigned
+The user who caused the event is never notified of it.
+
+User.unread_notifications is a per-user counter kept in step with the unread
+rows by atomic UPDATEs (incremented on fan-out, decremented when rows are
+marked read or deleted). The current user is loaded on every request anyway,
+so the navbar badge reads the counter without an extra query.
+
+Inbox pages are keyed by notification id: a page holds the newest rows with
+id < before, and the last id on the page is the cursor for the next one, so
+paging stays cheap however deep the user goes.
+"""
+
+from collections import Counter
+from datetime import datetime
+from models import Notification, Ticket, User, db
+from activity_log import EVENT_NAMES, activity_row, referenced_user_ids, render
+
+# Rows inserted per statement when fanning out bulk changes
+CHUNK_SIZE = 500
+
+def watchers(creator_id, assignee_id, internal=False):
+    """Users following a ticket: its creator (unless internal) and its assignee"""
+    recipients = [] if internal else [creator_id]
+    if assignee_id:
+        recipients.append(assignee_id)
+    return recipients
+
+def notification_rows(ticket_id, actor_id, event, recipient_ids, created_at=None, **values):
+    """Notification column values for each recipient other than the actor"""
+    row = activity_row(ticket_id, actor_id, event, created_at=created_at or datetime.utcnow(), **values)
+    del row['user_id']
+    row['actor_id'] = actor_id
+    return [dict(row, user_id=user_id) for user_id in dict.fromkeys(recipient_ids)
+            if user_id and user_id != actor_id]
+
+def add_notifications(rows):
+    """Insert notification rows and bump their recipients' unread counters"""
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(Notification.__table__.insert(), rows[start:start + CHUNK_SIZE])
+    adjust_unread([row['user_id'] for row in rows], 1)
+
+def notify(ticket_id, actor_id, event, recipient_ids, created_at=None, **values):
+    """Fan one ticket event out to recipient_ids in the current transaction"""
+    add_notifications(notification_rows(ticket_id, actor_id, event, recipient_ids, created_at, **values))
+
+def adjust_unread(user_ids, delta):
+    """Add delta to unread_notifications for each user id (ids may repeat)"""
+    counts = Counter(user_ids)
+
+    # One UPDATE per distinct multiplicity, usually exactly one
+    by_multiplicity = {}
+    for user_id, times in counts.items():
+        by_multiplicity.setdefault(times, []).append(user_id)
+
+    for times, ids in by_multiplicity.items():
+        for start in range(0, len(ids), CHUNK_SIZE):
+            User.query.filter(User.id.in_(ids[start:start + CHUNK_SIZE])).update({
+                User.unread_notifications: User.unread_notifications + delta * times,
+                # A notification is not a profile change
+                User.updated_at: User.updated_at,
+            }, synchronize_session=False)
+
+def discard_notifications(*conditions):
+    """Delete the notifications matching conditions, keeping unread counters in step"""
+    unread = db.session.query(Notification.user_id).filter(*conditions, Notification.read_at.is_(None))
+    adjust_unread([user_id for (user_id,) in unread], -1)
+    Notification.query.filter(*conditions).delete(synchronize_session=False)
+
+def mark_read(user_id, ids=None):
+    """Mark the user's notifications (all, or only ids) read; returns the unread count"""
+    query = Notification.query.filter(Notification.user_id == user_id, Notification.read_at.is_(None))
+    if ids is not None:
+        query = query.filter(Notification.id.in_(ids))
+    marked = query.update({Notification.read_at: datetime.utcnow()}, synchronize_session=False)
+    if marked:
+        adjust_unread([user_id], -marked)
+    db.session.commit()
+    return db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+
+def inbox_page(user_id, before=None, limit=20, unread_only=False):
+    """(notifications, next cursor) for one page of the user's inbox, newest first"""
+    query = db.session.query(
+        Notification.id, Notification.ticket_id, Notification.event, Notification.data,
+        Notification.read_at, Notification.created_at, User.username, Ticket.subject
+    ).join(User, Notification.actor_id == User.id).join(
+        Ticket, Notification.ticket_id == Ticket.id
+    ).filter(Notification.user_id == user_id)
+    if before:
+        query = query.filter(Notification.id < before)
+    if unread_only:
+        query = query.filter(Notification.read_at.is_(None))
+    rows = query.order_by(Notification.id.desc()).limit(limit + 1).all()
+    more, rows = len(rows) > limit, rows[:limit]
+
+    # Resolve the agent ids referenced by assignment events in one query
+    agent_ids = set().union(*(referenced_user_ids(row.event, row.data) for row in rows))
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(agent_ids))) if agent_ids else {}
+
+    notifications = [{
+        'id': row.id,
+        'ticket_id': row.ticket_id,
+        'ticket_subject': row.subject,
+        'event': EVENT_NAMES.get(row.event, 'other'),
+        'message': render(row.event, row.data, row.username, username=usernames.get),
+        'read': row.read_at is not None,
+        'created_at': row.created_at,
+    } for row in rows]
+    return notifications, rows[-1].id if more else None
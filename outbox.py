@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+QuickDesk email outbox
+
+Ticket changes no longer talk to the mail server inside the request.
+queue_notification_email() adds an EmailOutbox row to the current
+transaction, so the email is queued if and only if the ticket change commits.
+A pool of EMAIL_WORKERS background threads claims due rows, renders them
+with build_notification_email() and sends each claimed batch over one pooled
+SMTP connection (see mail_transport.py).
+
+Rows wait NOTIFICATION_COALESCE_SECONDS before they are due. Workers claim by
+recipient: once a recipient's oldest email is due, every fresh email queued
+for them since is claimed with it, and the burst goes out as one digest.
+Recipients' NotificationSettings are loaded in one query per claim:
+
+- emails for events the recipient switched off are dropped;
+- 'daily' and 'weekly' recipients have their emails held (digest=True) until
+  DIGEST_HOUR (UTC; on DIGEST_WEEKDAY for weekly), then sent as one digest;
+- 'never' drops every email for the recipient.
+
+Delivery guarantees:
+
+- Rows are claimed with a compare-and-set UPDATE per recipient, so several
+  worker threads (or processes) never send the same email twice. The claim
+  doubles as a lease: a row left in 'sending' by a crashed worker is picked
+  up again once CLAIM_LEASE_SECONDS have passed.
+- A failed send is retried with exponential backoff (EMAIL_RETRY_BASE
+  seconds, doubling per attempt, capped at EMAIL_RETRY_MAX). After
+  EMAIL_MAX_ATTEMPTS attempts the row is dead-lettered: it stays in the
+  table with status 'dead' and its last error until an administrator
+  requeues it.
+- Delivered rows are deleted, so the table only ever holds undelivered mail.
+
+Queue depth, dead letters and delivery lag are exposed through
+/admin/api/metrics. Web processes can run with EMAIL_WORKERS=0 and leave the
+sending to a dedicated process:
+
+    python outbox.py            # run the worker pool in the foreground
+    python outbox.py --retry-dead
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context, request
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+from models import EmailOutbox, NotificationSettings, Ticket, User, db
+from utils import build_digest_email, build_notification_email
+from mail_transport import smtp_pool
+import metrics
+
+CLAIMABLE = ('pending', 'sending')
+
+# Recipients claimed per worker round trip, and how long a claim is honoured
+CLAIM_BATCH = 10
+CLAIM_LEASE_SECONDS = 300
+
+# NotificationSettings switch consulted for each event type
+EVENT_SETTINGS = {
+    'created': 'email_on_ticket_created',
+    'commented': 'email_on_comment_added',
+    'comment_added': 'email_on_comment_added',
+    'status_changed': 'email_on_status_changed',
+    'assigned': 'email_on_assignment',
+    'assigned_to_you': 'email_on_assignment',
+    'agent_accepted': 'email_on_assignment',
+}
+DIGEST_FREQUENCIES = ('immediate', 'daily', 'weekly', 'never')
+
+def enqueue_email(ticket_id, event_type, recipient_email, base_url=None, **kwargs):
+    """Add a notification email to the current transaction; it is sent after commit
+
+    Takes plain values so it can also be called from write-queue jobs.
+    Returns the EmailOutbox row, or None when email is not configured.
+    """
+    if not current_app.config.get('MAIL_USERNAME') or not current_app.extensions.get('mail'):
+        return None
+    if base_url is None and has_request_context():
+        base_url = request.url_root
+
+    window = current_app.config.get('NOTIFICATION_COALESCE_SECONDS', 60)
+    row = EmailOutbox(
+        ticket_id=ticket_id,
+        event_type=event_type,
+        recipient=recipient_email,
+        params=json.dumps(kwargs) if kwargs else None,
+        base_url=base_url,
+        next_attempt_at=datetime.utcnow() + timedelta(seconds=window)
+    )
+    db.session.add(row)
+    db.session.info['outbox_added'] = True
+    email_outbox.start()
+    return row
+
+def load_preferences(recipients):
+    """Map recipient email -> NotificationSettings (None for defaults) in one query"""
+    preferences = dict.fromkeys(recipients)
+    for email, settings in db.session.query(User.email, NotificationSettings).outerjoin(
+        NotificationSettings, NotificationSettings.user_id == User.id
+    ).filter(User.email.in_(list(recipients))):
+        preferences[email] = settings
+    return preferences
+
+def wants_email(settings, event_type):
+    """Whether these settings allow an email for event_type (no settings = everything)"""
+    if settings is None:
+        return True
+    if settings.digest_frequency == 'never':
+        return False
+    enabled = getattr(settings, EVENT_SETTINGS.get(event_type, 'email_on_ticket_updated'))
+    return enabled is not False
+
+def next_digest_at(frequency, now, config):
+    """When the next daily or weekly digest goes out"""
+    at = now.replace(hour=config.get('DIGEST_HOUR', 8), minute=0, second=0, microsecond=0)
+    if frequency == 'weekly':
+        at += timedelta(days=(config.get('DIGEST_WEEKDAY', 0) - at.weekday()) % 7)
+    if at <= now:
+        at += timedelta(days=7 if frequency == 'weekly' else 1)
+    return at
+
+def retry_delay(attempts, config):
+    """Seconds to wait before the next attempt after attempts failures"""
+    delay = min(config['EMAIL_RETRY_BASE'] * 2 ** (attempts - 1), config['EMAIL_RETRY_MAX'])
+    # Up to 10% jitter so a burst of failures does not retry in lockstep
+    return delay * (1 + random.random() / 10)
+
+class EmailOutboxWorkers:
+    """Pool of threads delivering EmailOutbox rows"""
+
+    def __init__(self):
+        self._app = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+        # Pick up rows left over from before a restart without waiting for a new one
+        app.before_request(self.start)
+        metrics.register_gauge('email_outbox.depth', lambda: self._count(CLAIMABLE))
+        metrics.register_gauge('email_outbox.dead', lambda: self._count(('dead',)))
+
+    def _count(self, statuses):
+        return EmailOutbox.query.filter(EmailOutbox.status.in_(statuses)).count()
+
+    def start(self, workers=None):
+        """Start the worker threads once per process (none with EMAIL_WORKERS=0)"""
+        # Started lazily so each forked worker process gets its own pool
+        if self._app is None or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if workers is None:
+                workers = self._app.config.get('EMAIL_WORKERS', 2)
+            for number in range(workers):
+                threading.Thread(target=self._run, name=f'email-outbox-{number}', daemon=True).start()
+
+    def notify(self):
+        """Wake the workers because new rows were committed"""
+        self._wakeup.set()
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                try:
+                    sent = self.process_due()
+                except Exception as e:
+                    db.session.rollback()
+                    self._app.logger.error(f'Email outbox worker failed: {str(e)}')
+                    sent = 0
+                if not sent:
+                    self._wakeup.wait(self._app.config.get('EMAIL_POLL_INTERVAL', 5))
+                    self._wakeup.clear()
+
+    def claim(self, limit=CLAIM_BATCH):
+        """Claim the queued emails of up to limit recipients with something due"""
+        now = datetime.utcnow()
+        recipients = [recipient for (recipient,) in db.session.query(EmailOutbox.recipient).filter(
+            EmailOutbox.status.in_(CLAIMABLE), EmailOutbox.next_attempt_at <= now
+        ).group_by(EmailOutbox.recipient).order_by(func.min(EmailOutbox.next_attempt_at)).limit(limit)]
+
+        table = EmailOutbox.__table__
+        token = uuid.uuid4().hex
+        for recipient in recipients:
+            # Only claims rows no other worker claimed since they were read
+            result = db.session.execute(table.update().where(
+                table.c.recipient == recipient,
+                table.c.status.in_(CLAIMABLE),
+                or_(
+                    table.c.next_attempt_at <= now,
+                    # Fresh emails still inside their coalescing window join the burst
+                    and_(table.c.status == 'pending', table.c.attempts == 0, table.c.digest.is_(False))
+                )
+            ).values(
+                status='sending',
+                attempts=table.c.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+                claim_token=token
+            ))
+            if not result.rowcount:
+                metrics.increment('email_outbox.claim_conflicts')
+        db.session.commit()
+
+        if not recipients:
+            return []
+        return EmailOutbox.query.filter_by(claim_token=token).order_by(EmailOutbox.id).all()
+
+    def process_due(self):
+        """Send every due email this worker can claim; returns the number of rows handled"""
+        handled = 0
+        while True:
+            rows = self.claim()
+            if not rows:
+                return handled
+            self._deliver(rows)
+            handled += len(rows)
+
+    def _render(self, row):
+        app = self._app or current_app._get_current_object()
+        ticket = db.session.get(Ticket, row.ticket_id)
+        if ticket is None:
+            return None
+        with app.test_request_context(base_url=row.base_url or None):
+            return build_notification_email(ticket, row.event_type, row.recipient,
+                                            **json.loads(row.params or '{}'))
+
+    def _hold_for_digest(self, rows, frequency):
+        """Put rows back in the queue until the recipient's next digest"""
+        config = (self._app or current_app).config
+        send_at = next_digest_at(frequency, datetime.utcnow(), config)
+        for row in rows:
+            row.status = 'pending'
+            row.attempts -= 1  # Holding is not a delivery attempt
+            row.digest = True
+            row.next_attempt_at = send_at
+        metrics.increment('email_outbox.held_for_digest', len(rows))
+
+    def _deliver(self, rows):
+        """Apply preferences, render one email or digest per recipient, and send them"""
+        by_recipient = {}
+        for row in rows:
+            by_recipient.setdefault(row.recipient, []).append(row)
+        preferences = load_preferences(by_recipient)
+
+        ready = []  # (row ids, oldest created_at, message)
+        for recipient, group in by_recipient.items():
+            settings = preferences[recipient]
+            wanted = [row for row in group if wants_email(settings, row.event_type)]
+            if len(wanted) < len(group):
+                unwanted = [row.id for row in group if row not in wanted]
+                EmailOutbox.query.filter(EmailOutbox.id.in_(unwanted)).delete(synchronize_session=False)
+                metrics.increment('email_outbox.suppressed', len(unwanted))
+            if not wanted:
+                continue
+
+            frequency = settings.digest_frequency if settings else 'immediate'
+            if frequency in ('daily', 'weekly') and not any(row.digest for row in wanted):
+                self._hold_for_digest(wanted, frequency)
+                continue
+
+            rendered = []
+            for row in wanted:
+                try:
+                    msg = self._render(row)
+                except Exception as e:
+                    self._failed(row, e)
+                    continue
+                if msg is None:
+                    self._dead_letter(row, 'Ticket no longer exists')
+                    continue
+                rendered.append((row, msg))
+            if not rendered:
+                continue
+
+            if len(rendered) == 1:
+                msg = rendered[0][1]
+            else:
+                msg = build_digest_email(recipient, [msg for _, msg in rendered])
+                metrics.increment('email_outbox.coalesced', len(rendered) - 1)
+            ready.append(([row.id for row, _ in rendered], min(row.created_at for row, _ in rendered), msg))
+
+        # Do not hold a read transaction open while waiting on the mail server
+        db.session.commit()
+        if not ready:
+            return
+
+        errors = smtp_pool.send_batch([msg for _, _, msg in ready])
+
+        now = datetime.utcnow()
+        delivered = [row_id for (row_ids, _, _), error in zip(ready, errors) if error is None for row_id in row_ids]
+        if delivered:
+            EmailOutbox.query.filter(EmailOutbox.id.in_(delivered)).delete(synchronize_session=False)
+        for (row_ids, created_at, _), error in zip(ready, errors):
+            if error is None:
+                metrics.increment('email_outbox.sent', len(row_ids))
+                metrics.increment('email_outbox.messages')
+                metrics.record_timing('email_outbox.lag', (now - created_at).total_seconds())
+            else:
+                for row_id in row_ids:
+                    self._failed(db.session.get(EmailOutbox, row_id), error)
+        db.session.commit()
+
+    def _failed(self, row, error):
+        """Schedule a retry, or dead-letter the row; the caller commits"""
+        config = (self._app or current_app).config
+        if row.attempts >= config.get('EMAIL_MAX_ATTEMPTS', 6):
+            self._dead_letter(row, str(error))
+            return
+        row.status = 'pending'
+        row.last_error = str(error)
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(row.attempts, config))
+        metrics.increment('email_outbox.retries')
+
+    def _dead_letter(self, row, error):
+        row.status = 'dead'
+        row.last_error = error
+        metrics.increment('email_outbox.dead_lettered')
+        (self._app or current_app).logger.error(
+            f'Email to {row.recipient} ({row.event_type}, ticket #{row.ticket_id}) dead-lettered: {error}'
+        )
+
+email_outbox = EmailOutboxWorkers()
+
+@event.listens_for(Session, 'after_commit')
+def _wake_outbox_workers(session):
+    if session.info.pop('outbox_added', False):
+        email_outbox.notify()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_outbox_rows(session):
+    session.info.pop('outbox_added', None)
+
+def init_email_outbox(app):
+    """Attach the process-wide outbox worker pool to app"""
+    email_outbox.init_app(app)
+
+def retry_dead_letters():
+    """Requeue every dead-lettered email; returns the number requeued"""
+    count = EmailOutbox.query.filter_by(status='dead').update(
+        {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    if count:
+        email_outbox.start()
+        email_outbox.notify()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Deliver queued QuickDesk notification emails')
+    parser.add_argument('--workers', type=int, default=2, help='Sending threads (default 2)')
+    parser.add_argument('--retry-dead', action='store_true', help='Requeue dead-lettered emails and exit')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.retry_dead:
+            print(f'Requeued {retry_dead_letters()} dead-lettered email(s)')
+            return
+        if not app.config.get('MAIL_USERNAME'):
+            print('MAIL_USERNAME is not set; nothing would be sent')
+            return
+
+    print(f'Delivering queued emails with {args.workers} worker(s); Ctrl+C to stop')
+    email_outbox.start(workers=args.workers)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+QuickDesk read-replica routing
+
+When REPLICA_DATABASE_URL is set, views decorated with @replica_reads
+(analytics, stats endpoints, dashboards and list pages) run their SELECTs
+against the replica bind. Everything else stays on the primary:
+
+- any request that is not GET/HEAD;
+- any transaction once it has written (RoutingSession pins it to the primary);
+- every request from a client that made a successful write request in the
+  last READ_YOUR_WRITES_SECONDS, so users always see their own changes even
+  while the replica lags.
+
+For local testing with SQLite, run this module as a copy job that refreshes a
+replica file from the primary with SQLite's online backup API:
+
+    python replica.py --interval 10
+
+READ_YOUR_WRITES_SECONDS should be at least the copy interval.
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from functools import wraps
+from flask import current_app, g, request, session
+from sqlalchemy.engine import make_url
+from db_engine import REPLICA_BIND
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def replica_reads(view):
+    """Serve this view's reads from the replica unless the client just wrote"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+            g.use_replica = time.time() - session.get('last_write_at', 0) > window
+        return view(*args, **kwargs)
+    return decorated_function
+
+def init_replica(app):
+    """Remember when each client last wrote, for the read-your-writes window"""
+    @app.after_request
+    def _record_write(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            session['last_write_at'] = time.time()
+        return response
+
+def _sqlite_path(database_uri):
+    url = make_url(database_uri)
+    if url.get_backend_name() != 'sqlite' or not url.database:
+        raise ValueError(f'{database_uri} is not a SQLite file database')
+    return url.database
+
+def copy_to_replica(primary_path, replica_path):
+    """Copy the primary SQLite file onto the replica with the online backup API"""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the primary SQLite database onto the replica')
+    parser.add_argument('--interval', type=float, default=0, help='Repeat every N seconds (0 = copy once)')
+    args = parser.parse_args()
+
+    from app import app
+    replica_uri = app.config.get('REPLICA_DATABASE_URL')
+    if not replica_uri:
+        print('REPLICA_DATABASE_URL is not set')
+        sys.exit(1)
+
+    with app.app_context():
+        from models import db
+        # Resolve relative paths the same way Flask-SQLAlchemy does
+        primary_path = _sqlite_path(str(db.engine.url))
+        replica_path = _sqlite_path(str(db.engines[REPLICA_BIND].url))
+
+    while True:
+        started = time.perf_counter()
+        copy_to_replica(primary_path, replica_path)
+        print(f'Copied {primary_path} -> {replica_path} in {(time.perf_counter() - started) * 1000:.0f}ms')
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
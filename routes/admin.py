@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from flask_login import login_required, current_user
 from functools import wraps
-from models import User, Category, Ticket, Comment, Vote, Attachment, TicketActivity, NotificationSettings, Tag, db
-from forms import CategoryForm, UserForm
+from models import User, Category, Ticket, TicketActivity, Tag, WebhookDelivery, WebhookSubscription, db
+from forms import CategoryForm, UserForm, WebhookForm
 from werkzeug.security import generate_password_hash
+from deletion import delete_user as delete_user_data, delete_user_in_background, get_deletion_progress
+from user_directory import user_directory
+from replica import replica_reads
+from activity_log import activity_row
+from notifications import notify
+from sla import TRACKED_STATUSES, refresh_sla
+from webhooks import queue_counts, retry_dead_deliveries, set_active, subscribe
+from utils import queue_notification_email
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -19,6 +27,7 @@ def admin_required(f):
 @admin_bp.route('/')
 @login_required
 @admin_required
+@replica_reads
 def admin_dashboard():
     # Get statistics
     stats = {
@@ -45,6 +54,7 @@ def admin_dashboard():
 @admin_bp.route('/users')
 @login_required
 @admin_required
+@replica_reads
 def manage_users():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
@@ -53,12 +63,11 @@ def manage_users():
     query = User.query
     
     if search:
-        query = query.filter(
-            db.or_(
-                User.username.contains(search),
-                User.email.contains(search)
-            )
-        )
+        # Resolve matches from the in-memory directory index rather than a LIKE scan.
+        # The role is filtered inside the search so the result cap applies to that role only
+        matches = user_directory.search(search, roles=[role_filter] if role_filter != 'all' else None,
+                                        limit=current_app.config['USER_SEARCH_MAX_RESULTS'])
+        query = query.filter(User.id.in_([match['id'] for match in matches]))
     
     if role_filter != 'all':
         query = query.filter_by(role=role_filter)
@@ -73,6 +82,7 @@ def manage_users():
 @admin_required
 def create_user():
     form = UserForm()
+    form.skills.choices = [(c.id, c.name) for c in Category.query.filter_by(is_active=True).all()]
     
     if form.validate_on_submit():
         # Check if user already exists
@@ -92,6 +102,7 @@ def create_user():
             password_hash=generate_password_hash(form.password.data),
             role=form.role.data
         )
+        user.skills = Category.query.filter(Category.id.in_(form.skills.data or [])).all()
         
         db.session.add(user)
         db.session.commit()
@@ -107,6 +118,9 @@ def create_user():
 def edit_user(id):
     user = User.query.get_or_404(id)
     form = UserForm(obj=user)
+    form.skills.choices = [(c.id, c.name) for c in Category.query.filter_by(is_active=True).all()]
+    if request.method == 'GET':
+        form.skills.data = [category.id for category in user.skills]
     
     if form.validate_on_submit():
         # Check for duplicate email (excluding current user)
@@ -125,6 +139,7 @@ def edit_user(id):
         user.email = form.email.data
         user.role = form.role.data
         user.is_active = form.is_active.data
+        user.skills = Category.query.filter(Category.id.in_(form.skills.data or [])).all()
         
         if form.password.data:
             user.password_hash = generate_password_hash(form.password.data)
@@ -145,42 +160,25 @@ def delete_user(id):
         return jsonify({'error': 'You cannot delete your own account.'}), 400
 
     user = User.query.get_or_404(id)
+    if user.pending_deletion:
+        return jsonify({'error': f'User {user.username} is already being deleted.'}), 409
 
     try:
-        # Delete user's tickets and associated data
-        for ticket in user.tickets:
-            # Delete ticket comments
-            Comment.query.filter_by(ticket_id=ticket.id).delete()
-            # Delete ticket votes
-            Vote.query.filter_by(ticket_id=ticket.id).delete()
-            # Delete ticket attachments
-            Attachment.query.filter_by(ticket_id=ticket.id).delete()
-            # Delete ticket activities
-            TicketActivity.query.filter_by(ticket_id=ticket.id).delete()
-            # Clear tag associations
-            ticket.tags.clear()
-            # Delete the ticket
-            db.session.delete(ticket)
-
-        # Delete user's comments on other tickets
-        Comment.query.filter_by(user_id=user.id).delete()
-
-        # Delete user's votes
-        Vote.query.filter_by(user_id=user.id).delete()
-
-        # Delete user's activities
-        TicketActivity.query.filter_by(user_id=user.id).delete()
-
-        # Delete user's notification settings
-        NotificationSettings.query.filter_by(user_id=user.id).delete()
-
-        # Update tickets assigned to this user
-        Ticket.query.filter_by(assigned_to=user.id).update({'assigned_to': None})
-
-        # Delete the user
         username = user.username
-        db.session.delete(user)
-        db.session.commit()
+        ticket_count = Ticket.query.filter_by(user_id=user.id).count()
+        chunk_size = current_app.config.get('DELETE_CHUNK_SIZE', 500)
+        background = request.args.get('background', '').lower() in ('1', 'true')
+
+        if background or ticket_count > current_app.config.get('USER_DELETE_BACKGROUND_THRESHOLD', 1000):
+            delete_user_in_background(user, chunk_size=chunk_size)
+            return jsonify({
+                'success': True,
+                'pending': True,
+                'message': f'User {username} has been deactivated; their {ticket_count} tickets are being deleted in the background.',
+                'status_url': url_for('admin.delete_user_status', id=id)
+            }), 202
+
+        delete_user_data(user.id, chunk_size=chunk_size)
 
         return jsonify({
             'success': True,
@@ -193,9 +191,70 @@ def delete_user(id):
             'error': f'Failed to delete user: {str(e)}'
         }), 500
 
+@admin_bp.route('/users/<int:id>/delete-status')
+@login_required
+@admin_required
+def delete_user_status(id):
+    """Progress of a user deletion"""
+    progress = get_deletion_progress(id)
+    if progress is None:
+        user = db.session.get(User, id)
+        if user is None:
+            return jsonify({'status': 'completed'})
+        # Started by another worker process, or interrupted by a restart
+        return jsonify({'status': 'pending' if user.pending_deletion else 'not_started'})
+    return jsonify(progress)
+
+@admin_bp.route('/api/metrics')
+@login_required
+@admin_required
+def metrics_snapshot():
+    """In-process performance metrics for this worker"""
+    import metrics
+    return jsonify(metrics.snapshot())
+
+@admin_bp.route('/api/email-outbox')
+@login_required
+@admin_required
+def email_outbox_status():
+    """Undelivered notification emails, with the most recent dead letters"""
+    from models import EmailOutbox
+    counts = dict(db.session.query(EmailOutbox.status, db.func.count()).group_by(EmailOutbox.status).all())
+    dead = EmailOutbox.query.filter_by(status='dead').order_by(EmailOutbox.id.desc()).limit(50).all()
+    return jsonify({
+        'counts': counts,
+        'dead': [{
+            'id': row.id,
+            'ticket_id': row.ticket_id,
+            'event_type': row.event_type,
+            'recipient': row.recipient,
+            'attempts': row.attempts,
+            'last_error': row.last_error,
+            'created_at': row.created_at.isoformat() if row.created_at else None
+        } for row in dead]
+    })
+
+@admin_bp.route('/api/email-outbox/retry', methods=['POST'])
+@login_required
+@admin_required
+def email_outbox_retry():
+    """Requeue every dead-lettered email"""
+    from outbox import retry_dead_letters
+    return jsonify({'success': True, 'requeued': retry_dead_letters()})
+
+@admin_bp.route('/api/jobs')
+@login_required
+@admin_required
+def scheduled_jobs():
+    """Periodic jobs: which process leads each one, and its latest runs"""
+    from scheduler import job_status
+    recent = min(max(request.args.get('runs', 20, type=int), 1), 100)
+    return jsonify({'jobs': job_status(recent=recent)})
+
 @admin_bp.route('/categories')
 @login_required
 @admin_required
+@replica_reads
 def manage_categories():
     categories = Category.query.all()
     return render_template('admin/categories.html', categories=categories)
@@ -215,7 +274,9 @@ def create_category():
         
         category = Category(
             name=form.name.data,
-            description=form.description.data
+            description=form.description.data,
+            sla_first_response_hours=form.sla_first_response_hours.data,
+            sla_resolution_hours=form.sla_resolution_hours.data
         )
         
         db.session.add(category)
@@ -240,9 +301,19 @@ def edit_category(id):
             flash('Category name already exists', 'error')
             return render_template('admin/edit_category.html', form=form, category=category)
         
+        old_targets = (category.sla_first_response_hours, category.sla_resolution_hours)
         category.name = form.name.data
         category.description = form.description.data
         category.is_active = form.is_active.data
+        category.sla_first_response_hours = form.sla_first_response_hours.data
+        category.sla_resolution_hours = form.sla_resolution_hours.data
+
+        # New SLA targets move the deadlines of the category's open tickets
+        if old_targets != (category.sla_first_response_hours, category.sla_resolution_hours):
+            db.session.flush()
+            refresh_sla([ticket_id for (ticket_id,) in db.session.query(Ticket.id).filter(
+                Ticket.category_id == id, Ticket.status.in_(TRACKED_STATUSES)
+            )])
         
         db.session.commit()
         
@@ -266,6 +337,70 @@ def delete_category(id):
     
     return jsonify({'success': True})
 
+@admin_bp.route('/webhooks', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def manage_webhooks():
+    form = WebhookForm()
+
+    if form.validate_on_submit():
+        subscription = subscribe(form.name.data, form.url.data, form.events.data, is_active=form.is_active.data)
+        db.session.commit()
+
+        flash(f'Webhook added. Its signing secret is {subscription.secret}', 'success')
+        return redirect(url_for('admin.manage_webhooks'))
+
+    subscriptions = WebhookSubscription.query.order_by(WebhookSubscription.id).all()
+    return render_template('admin/webhooks.html', form=form, subscriptions=subscriptions, counts=queue_counts())
+
+@admin_bp.route('/webhooks/<int:id>/toggle', methods=['POST'])
+@login_required
+@admin_required
+def toggle_webhook(id):
+    subscription = WebhookSubscription.query.get_or_404(id)
+    set_active(subscription, not subscription.is_active)
+    db.session.commit()
+    return jsonify({'success': True, 'is_active': subscription.is_active})
+
+@admin_bp.route('/webhooks/<int:id>/retry', methods=['POST'])
+@login_required
+@admin_required
+def retry_webhook(id):
+    """Requeue a subscription's dead-lettered events"""
+    WebhookSubscription.query.get_or_404(id)
+    return jsonify({'success': True, 'requeued': retry_dead_deliveries(id)})
+
+@admin_bp.route('/webhooks/<int:id>/delete', methods=['POST'])
+@login_required
+@admin_required
+def delete_webhook(id):
+    subscription = WebhookSubscription.query.get_or_404(id)
+    WebhookDelivery.query.filter_by(subscription_id=id).delete(synchronize_session=False)
+    db.session.delete(subscription)
+    db.session.commit()
+    return jsonify({'success': True})
+
+@admin_bp.route('/api/webhooks')
+@login_required
+@admin_required
+def webhook_status():
+    """Webhook subscriptions with their queue depth and last outcome"""
+    counts = queue_counts()
+    return jsonify({'subscriptions': [{
+        'id': subscription.id,
+        'name': subscription.name,
+        'url': subscription.url,
+        'events': subscription.event_types,
+        'is_active': subscription.is_active,
+        'cursor': subscription.last_event_id,
+        'pending': counts.get(subscription.id, {}).get('pending', 0),
+        'dead': counts.get(subscription.id, {}).get('dead', 0),
+        'failures': subscription.failures,
+        'retry_at': subscription.retry_at.isoformat() if subscription.retry_at else None,
+        'last_error': subscription.last_error,
+        'last_delivery_at': subscription.last_delivery_at.isoformat() if subscription.last_delivery_at else None
+    } for subscription in WebhookSubscription.query.order_by(WebhookSubscription.id)]})
+
 # Duplicate function removed - using the enhanced version above
 
 @admin_bp.route('/assign-ticket', methods=['POST'])
@@ -290,37 +425,30 @@ def assign_ticket_admin():
         ticket.assigned_to = agent_id
 
         # Create activity log
-        activity = TicketActivity(
-            ticket_id=ticket.id,
-            user_id=current_user.id,
-            activity_type='assigned',
-            description=f'Ticket assigned to {agent.username} by admin {current_user.username}',
-            old_value=old_assignee.username if old_assignee else None,
-            new_value=agent.username
-        )
+        old_assignee_id = old_assignee.id if old_assignee else None
+        activity = TicketActivity(**activity_row(
+            ticket.id, current_user.id, 'assigned', o=old_assignee_id, n=agent.id
+        ))
         db.session.add(activity)
-        db.session.commit()
+        notify(ticket.id, current_user.id, 'assigned', [ticket.user_id, agent.id], o=old_assignee_id, n=agent.id)
+
+        # Queue notifications with the assignment
+        # Notify the assigned agent
+        queue_notification_email(
+            ticket=ticket,
+            event_type='assigned_to_you',
+            recipient_email=agent.email,
+            assigner_name=current_user.username
+        )
 
-        # Send notifications
-        try:
-            from utils import send_notification_email
-            # Notify the assigned agent
-            send_notification_email(
-                ticket=ticket,
-                event_type='assigned_to_you',
-                recipient_email=agent.email,
-                assigner_name=current_user.username
-            )
-
-            # Notify the ticket creator
-            send_notification_email(
-                ticket=ticket,
-                event_type='assigned',
-                recipient_email=ticket.creator.email,
-                agent_name=agent.username
-            )
-        except Exception as e:
-            print(f"Error sending assignment notification: {e}")
+        # Notify the ticket creator
+        queue_notification_email(
+            ticket=ticket,
+            event_type='assigned',
+            recipient_email=ticket.creator.email,
+            agent_name=agent.username
+        )
+        db.session.commit()
 
         return jsonify({
             'success': True,
@@ -333,15 +461,10 @@ def assign_ticket_admin():
         ticket.assigned_to = None
 
         # Create activity log
-        activity = TicketActivity(
-            ticket_id=ticket.id,
-            user_id=current_user.id,
-            activity_type='unassigned',
-            description=f'Ticket unassigned by admin {current_user.username}',
-            old_value=old_assignee.username if old_assignee else None,
-            new_value=None
-        )
+        old_assignee_id = old_assignee.id if old_assignee else None
+        activity = TicketActivity(**activity_row(ticket.id, current_user.id, 'unassigned', o=old_assignee_id))
         db.session.add(activity)
+        notify(ticket.id, current_user.id, 'unassigned', [ticket.user_id, old_assignee_id], o=old_assignee_id)
         db.session.commit()
 
         return jsonify({
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from models import User, db, NotificationSettings
+from write_behind import touch
 from forms import LoginForm, RegisterForm, ProfileForm, PasswordChangeForm, NotificationSettingsForm
 from datetime import datetime
 
@@ -27,9 +28,8 @@ def login():
                 flash('Your account has been deactivated. Please contact an administrator.', 'error')
                 return render_template('auth/login.html', form=form)
 
-            # Update last login
-            user.last_login = datetime.utcnow()
-            db.session.commit()
+            # Update last login (buffered, best-effort)
+            touch(User, user.id, 'last_login')
 
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
@@ -179,6 +179,7 @@ def notification_settings():
         settings.email_on_comment_added = form.email_on_comment_added.data
         settings.email_on_status_changed = form.email_on_status_changed.data
         settings.email_on_assignment = form.email_on_assignment.data
+        settings.digest_frequency = form.digest_frequency.data
 
         db.session.commit()
         flash('Notification settings updated successfully!', 'success')
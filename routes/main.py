@@ -1,8 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, Response
 from flask_login import login_required, current_user
 from models import Ticket, Category, User, Tag, TicketActivity, db
 from sqlalchemy import or_, desc, asc, func
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
+from user_directory import user_directory
+from replica import replica_reads
+from live_feed import live_feed, dashboard_counts, assigned_counts
+from change_feed import changes_since, head_cursor, MAX_BATCH
 
 main_bp = Blueprint('main', __name__)
 
@@ -14,6 +19,7 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@replica_reads
 def dashboard():
     # Get filter parameters
     status_filter = request.args.get('status', 'all')
@@ -99,8 +105,38 @@ def dashboard():
 def profile():
     return render_template('profile.html')
 
+@main_bp.route('/api/live-feed')
+@login_required
+def live_feed_stream():
+    """Server-Sent Events stream of new ticket activity for the dashboards"""
+    # Browsers send Last-Event-ID when reconnecting; ?since= covers the first connection
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', type=int)
+    client, backlog = live_feed.subscribe(current_user.id, current_user.is_agent(), last_event_id)
+
+    # Not wrapped in stream_with_context: the request context and its database
+    # session are released as soon as the response starts
+    response = Response(live_feed.stream(client, backlog), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: pass events straight through
+    return response
+
+@main_bp.route('/api/changes')
+@login_required
+@replica_reads
+def changes():
+    """Tickets, comments and activity changed after ?since=<cursor> (see change_feed.py)"""
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'changes': [], 'tickets': [], 'comments': [], 'next_cursor': head_cursor(), 'has_more': False})
+
+    limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_BATCH)
+    if current_user.is_agent():
+        return jsonify(changes_since(since, limit))
+    return jsonify(changes_since(since, limit, user_id=current_user.id, include_internal=False))
+
 @main_bp.route('/api/ticket-stats')
 @login_required
+@replica_reads
 def ticket_stats():
     """API endpoint for dashboard statistics"""
     if current_user.is_agent():
@@ -123,8 +159,36 @@ def ticket_stats():
     
     return jsonify(stats)
 
+@main_bp.route('/api/users/search')
+@login_required
+def search_users():
+    """Directory search for user management and agent pickers"""
+    if not current_user.is_agent():
+        return jsonify({'error': 'Permission denied'}), 403
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify([])
+
+    roles = [role for role in request.args.get('role', '').split(',') if role]
+    active = request.args.get('active', 'true').lower()
+    is_active = None if active == 'all' else active == 'true'
+    limit = min(request.args.get('limit', 20, type=int), current_app.config['USER_SEARCH_MAX_RESULTS'])
+
+    users = user_directory.search(query, roles=roles or None, is_active=is_active, limit=limit)
+    return jsonify([{
+        'id': user['id'],
+        'username': user['username'],
+        'email': user['email'],
+        'display_name': ' '.join(part for part in (user['first_name'], user['last_name']) if part) or user['username'],
+        'department': user['department'],
+        'role': user['role'],
+        'is_active': user['is_active']
+    } for user in users])
+
 @main_bp.route('/agent-dashboard')
 @login_required
+@replica_reads
 def agent_dashboard():
     if not current_user.is_agent():
         flash('Access denied. Agent privileges required.', 'error')
@@ -194,29 +258,24 @@ def agent_dashboard():
     # Get categories for filter dropdown
     categories = Category.query.filter_by(is_active=True).all()
 
-    # Get agent statistics
-    stats = {
-        'total_tickets': Ticket.query.count(),
-        'open_tickets': Ticket.query.filter(Ticket.status.in_(['open', 'in_progress'])).count(),
-        'my_assigned': Ticket.query.filter_by(assigned_to=current_user.id).count(),
-        'unassigned': Ticket.query.filter(Ticket.assigned_to.is_(None)).count(),
-        'resolved_today': Ticket.query.filter(
-            Ticket.status == 'resolved',
-            Ticket.updated_at >= datetime.utcnow().date()
-        ).count(),
-        'urgent_tickets': Ticket.query.filter_by(priority='urgent').filter(
-            Ticket.status.in_(['open', 'in_progress'])
-        ).count()
-    }
+    # Get agent statistics (the same counters the live feed pushes)
+    stats = dashboard_counts()
+    stats['my_assigned'] = assigned_counts([current_user.id])[current_user.id]
 
     # Get recent activity
-    recent_activity = TicketActivity.query.order_by(desc(TicketActivity.created_at)).limit(10).all()
+    recent_activity = TicketActivity.query.options(joinedload(TicketActivity.user)).order_by(
+        desc(TicketActivity.created_at)).limit(10).all()
+    TicketActivity.resolve_names(recent_activity)
+
+    # The live feed resumes after the newest event shown on the page
+    live_feed_since = max((activity.id for activity in recent_activity), default=None)
 
     return render_template('agent_dashboard.html',
                          tickets=tickets,
                          categories=categories,
                          stats=stats,
                          recent_activity=recent_activity,
+                         live_feed_since=live_feed_since,
                          current_filters={
                              'status': status_filter,
                              'category': category_filter,
@@ -227,6 +286,7 @@ def agent_dashboard():
 
 @main_bp.route('/analytics')
 @login_required
+@replica_reads
 def analytics():
     if not current_user.is_agent():
         flash('Access denied. Agent privileges required.', 'error')
@@ -0,0 +1,57 @@
+from flask import Blueprint, render_template, request, jsonify, url_for
+from flask_login import login_required, current_user
+from notifications import inbox_page, mark_read
+from utils import time_ago
+
+notifications_bp = Blueprint('notifications', __name__)
+
+# Largest page a client may ask for
+MAX_PAGE_SIZE = 100
+
+def _serialize(notification):
+    return dict(
+        notification,
+        url=url_for('tickets.view_ticket', id=notification['ticket_id']),
+        created_at=notification['created_at'].isoformat() if notification['created_at'] else None,
+        time_ago=time_ago(notification['created_at'])
+    )
+
+@notifications_bp.route('/')
+@login_required
+def inbox():
+    notifications, next_cursor = inbox_page(current_user.id, limit=20)
+    return render_template('notifications/inbox.html', notifications=notifications, next_cursor=next_cursor)
+
+@notifications_bp.route('/api')
+@login_required
+def list_notifications():
+    """One page of the current user's notifications, newest first
+
+    Pass the returned next_cursor as ?before= to fetch the following page;
+    it is null on the last page.
+    """
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+    unread_only = request.args.get('unread', '').lower() in ('1', 'true')
+
+    notifications, next_cursor = inbox_page(current_user.id, before=before, limit=limit, unread_only=unread_only)
+    return jsonify({
+        'notifications': [_serialize(notification) for notification in notifications],
+        'next_cursor': next_cursor,
+        'unread_count': current_user.unread_notifications
+    })
+
+@notifications_bp.route('/api/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Mark notifications read: {"ids": [...]} for some, {"all": true} for every one"""
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        ids = None
+    else:
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return jsonify({'error': 'ids must be a non-empty list of notification ids'}), 400
+        ids = ids[:MAX_PAGE_SIZE]
+
+    return jsonify({'success': True, 'unread_count': mark_read(current_user.id, ids)})
@@ -3,7 +3,18 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from models import Ticket, Category, Comment, Vote, Attachment, User, Tag, TicketActivity, db
 from forms import TicketForm, CommentForm
-from utils import send_notification_email, allowed_file
+from utils import queue_notification_email, allowed_file
+from assignment import auto_assign
+from bulk_actions import apply_bulk_action, parse_ticket_ids, BULK_ACTIONS
+from deletion import delete_tickets
+from write_behind import touch
+from activity_log import activity_row
+from sqlite_writer import run_write
+from outbox import enqueue_email
+from notifications import notify, watchers
+from work_queue import claim_next_ticket, claim_ticket, skill_category_ids
+from tag_index import get_popular_tags, parse_tag_names, set_ticket_tags, tag_prefix_index
+from sla import apply_sla, record_first_response, refresh_sla
 import os
 import uuid
 from datetime import datetime
@@ -27,21 +38,11 @@ def create_ticket():
 
         db.session.add(ticket)
         db.session.flush()  # Get the ticket ID
+        apply_sla(ticket)
 
         # Handle tags
         if form.tags.data:
-            tag_names = [tag.strip() for tag in form.tags.data.split(',') if tag.strip()]
-            for tag_name in tag_names:
-                # Get or create tag
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                    db.session.flush()
-
-                # Associate tag with ticket
-                if tag not in ticket.tags:
-                    ticket.tags.append(tag)
+            set_ticket_tags(ticket, parse_tag_names(form.tags.data))
 
         # Handle file upload
         if form.attachment.data:
@@ -62,28 +63,23 @@ def create_ticket():
                 db.session.add(attachment)
 
         # Create activity log
-        activity = TicketActivity(
-            ticket_id=ticket.id,
-            user_id=current_user.id,
-            activity_type='created',
-            description=f'Ticket created by {current_user.username}'
-        )
+        activity = TicketActivity(**activity_row(ticket.id, current_user.id, 'created'))
         db.session.add(activity)
 
-        db.session.commit()
-
-        # Send notification email
-        send_notification_email(
+        # Queue notification email with the ticket
+        queue_notification_email(
             ticket=ticket,
             event_type='created',
             recipient_email=current_user.email
         )
 
+        db.session.commit()
+
         flash('Ticket created successfully!', 'success')
         return redirect(url_for('tickets.view_ticket', id=ticket.id))
 
     # Get popular tags for suggestions
-    popular_tags = Tag.query.join(Tag.tickets).group_by(Tag.id).order_by(db.func.count(Ticket.id).desc()).limit(10).all()
+    popular_tags = get_popular_tags(10)
 
     return render_template('tickets/create.html', form=form, popular_tags=popular_tags)
 
@@ -118,6 +114,39 @@ def view_ticket(id):
                          form=form,
                          user_vote=user_vote)
 
+def _insert_comment(ticket_id, user_id, content, is_internal, notify_email=None, base_url=None, watcher_ids=(),
+                    first_response=False):
+    """Write job: add a comment, notify the ticket's watchers and queue the creator's email
+
+    first_response marks an agent's public reply, which stops the first response SLA clock.
+    """
+    comment = Comment(content=content, ticket_id=ticket_id, user_id=user_id, is_internal=is_internal)
+    db.session.add(comment)
+    db.session.flush()  # Get the comment ID for the change feed
+    internal = 1 if is_internal else None
+    db.session.add(TicketActivity(**activity_row(ticket_id, user_id, 'commented', m=comment.id, i=internal)))
+    notify(ticket_id, user_id, 'commented', watcher_ids, m=comment.id, i=internal)
+    if first_response:
+        refresh_sla([ticket_id], first_response_at=comment.created_at)
+    if notify_email:
+        enqueue_email(ticket_id, 'commented', notify_email, base_url=base_url)
+
+def _apply_vote(ticket_id, user_id, vote_type):
+    """Write job: add, change or remove (same vote twice) a user's vote"""
+    existing_vote = Vote.query.filter_by(ticket_id=ticket_id, user_id=user_id).first()
+
+    if existing_vote:
+        if existing_vote.vote_type == vote_type:
+            # Remove vote if clicking same vote
+            db.session.delete(existing_vote)
+            return 'removed'
+        # Change vote
+        existing_vote.vote_type = vote_type
+        return 'changed'
+
+    db.session.add(Vote(ticket_id=ticket_id, user_id=user_id, vote_type=vote_type))
+    return 'added'
+
 @tickets_bp.route('/<int:id>/comment', methods=['POST'])
 @login_required
 def add_comment(id):
@@ -130,30 +159,19 @@ def add_comment(id):
     
     form = CommentForm()
     if form.validate_on_submit():
-        comment = Comment(
-            content=form.content.data,
-            ticket_id=id,
-            user_id=current_user.id,
-            is_internal=form.is_internal.data if current_user.is_agent() else False
-        )
-        
-        db.session.add(comment)
-        
-        # Update ticket timestamp
-        ticket.updated_at = db.func.now()
-        
-        db.session.commit()
+        # Notify the creator unless they wrote the comment themselves
+        recipient_email = ticket.creator.email if current_user.id != ticket.user_id else None
+        is_internal = form.is_internal.data if current_user.is_agent() else False
+        first_response = (current_user.is_agent() and not is_internal and current_user.id != ticket.user_id
+                          and ticket.first_response_at is None)
+        run_write(_insert_comment, id, current_user.id, form.content.data, is_internal,
+                  recipient_email, request.url_root,
+                  watchers(ticket.user_id, ticket.assigned_to, internal=is_internal), first_response)
+
+        # Update ticket timestamp (buffered, best-effort)
+        touch(Ticket, ticket.id, 'updated_at')
         
         flash('Comment added successfully!', 'success')
-        
-        # Send notification email
-        recipient_email = ticket.creator.email if current_user.id != ticket.user_id else None
-        if recipient_email:
-            send_notification_email(
-                ticket=ticket,
-                event_type='commented',
-                recipient_email=recipient_email
-            )
     
     return redirect(url_for('tickets.view_ticket', id=id))
 
@@ -165,27 +183,9 @@ def vote_ticket(id):
     
     if vote_type not in ['up', 'down']:
         return jsonify({'error': 'Invalid vote type'}), 400
-    
-    # Check if user already voted
-    existing_vote = Vote.query.filter_by(ticket_id=id, user_id=current_user.id).first()
-    
-    if existing_vote:
-        if existing_vote.vote_type == vote_type:
-            # Remove vote if clicking same vote
-            db.session.delete(existing_vote)
-            action = 'removed'
-        else:
-            # Change vote
-            existing_vote.vote_type = vote_type
-            action = 'changed'
-    else:
-        # Add new vote
-        vote = Vote(ticket_id=id, user_id=current_user.id, vote_type=vote_type)
-        db.session.add(vote)
-        action = 'added'
-    
-    db.session.commit()
-    
+
+    action = run_write(_apply_vote, id, current_user.id, vote_type)
+
     return jsonify({
         'success': True,
         'action': action,
@@ -204,90 +204,74 @@ def assign_ticket(id):
 
     # Handle self-assignment
     if is_self_assignment:
-        agent_id = current_user.id
-        agent = current_user
-    else:
-        if not agent_id:
-            # Unassign ticket
-            old_assignee = ticket.assignee
-            ticket.assigned_to = None
-
-            # Create activity log
-            activity = TicketActivity(
-                ticket_id=ticket.id,
-                user_id=current_user.id,
-                activity_type='unassigned',
-                description=f'Ticket unassigned from {old_assignee.username if old_assignee else "unknown"}',
-                old_value=old_assignee.username if old_assignee else None,
-                new_value=None
-            )
-            db.session.add(activity)
-            db.session.commit()
-            return jsonify({'success': True, 'message': 'Ticket unassigned'})
+        # Claim only if still unassigned, so concurrent accepts cannot both win
+        if not claim_ticket(ticket.id, current_user):
+            return jsonify({'error': 'Ticket is already assigned'}), 409
+        return jsonify({
+            'success': True,
+            'agent_name': current_user.username,
+            'agent_phone': current_user.phone,
+            'agent_email': current_user.email,
+            'is_self_assignment': True,
+            'message': f'Ticket assigned to {current_user.username} (self-assigned)'
+        })
+
+    if not agent_id:
+        # Unassign ticket
+        old_assignee = ticket.assignee
+        ticket.assigned_to = None
+
+        # Create activity log
+        old_assignee_id = old_assignee.id if old_assignee else None
+        activity = TicketActivity(**activity_row(ticket.id, current_user.id, 'unassigned', o=old_assignee_id))
+        db.session.add(activity)
+        notify(ticket.id, current_user.id, 'unassigned', [ticket.user_id, old_assignee_id], o=old_assignee_id)
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Ticket unassigned'})
 
-        agent = User.query.get(agent_id)
-        if not agent or not agent.is_agent():
-            return jsonify({'error': 'Invalid agent'}), 400
+    agent = User.query.get(agent_id)
+    if not agent or not agent.is_agent():
+        return jsonify({'error': 'Invalid agent'}), 400
 
-        # Only admins can assign to other agents
-        if not current_user.is_admin() and agent_id != current_user.id:
-            return jsonify({'error': 'Only admins can assign tickets to other agents'}), 403
+    # Only admins can assign to other agents
+    if not current_user.is_admin() and agent_id != current_user.id:
+        return jsonify({'error': 'Only admins can assign tickets to other agents'}), 403
 
     # Update ticket assignment
     old_assignee = ticket.assignee
     ticket.assigned_to = agent_id
 
     # Create activity log
-    activity = TicketActivity(
-        ticket_id=ticket.id,
-        user_id=current_user.id,
-        activity_type='assigned',
-        description=f'Ticket assigned to {agent.username}' + (' (self-assigned)' if is_self_assignment else ''),
-        old_value=old_assignee.username if old_assignee else None,
-        new_value=agent.username
-    )
+    old_assignee_id = old_assignee.id if old_assignee else None
+    activity = TicketActivity(**activity_row(ticket.id, current_user.id, 'assigned', o=old_assignee_id, n=agent.id))
     db.session.add(activity)
-    db.session.commit()
+    notify(ticket.id, current_user.id, 'assigned', [ticket.user_id, agent.id], o=old_assignee_id, n=agent.id)
 
-    # Send notification to ticket creator
-    try:
-        if is_self_assignment:
-            # Special notification for self-assignment
-            send_notification_email(
-                ticket=ticket,
-                event_type='agent_accepted',
-                recipient_email=ticket.creator.email,
-                agent_name=agent.username,
-                agent_phone=agent.phone or 'Not provided',
-                agent_email=agent.email
-            )
-        else:
-            # Regular assignment notification
-            send_notification_email(
-                ticket=ticket,
-                event_type='assigned',
-                recipient_email=ticket.creator.email,
-                agent_name=agent.username
-            )
-
-        # Send notification to assigned agent if different from current user
-        if agent_id != current_user.id:
-            send_notification_email(
-                ticket=ticket,
-                event_type='assigned_to_you',
-                recipient_email=agent.email,
-                assigner_name=current_user.username
-            )
-    except Exception as e:
-        print(f"Error sending assignment notification: {e}")
+    # Queue notification to ticket creator
+    queue_notification_email(
+        ticket=ticket,
+        event_type='assigned',
+        recipient_email=ticket.creator.email,
+        agent_name=agent.username
+    )
+
+    # Queue notification to assigned agent if different from current user
+    if agent_id != current_user.id:
+        queue_notification_email(
+            ticket=ticket,
+            event_type='assigned_to_you',
+            recipient_email=agent.email,
+            assigner_name=current_user.username
+        )
+    db.session.commit()
 
     return jsonify({
         'success': True,
         'agent_name': agent.username,
         'agent_phone': agent.phone,
         'agent_email': agent.email,
-        'is_self_assignment': is_self_assignment,
-        'message': f'Ticket assigned to {agent.username}' + (' (self-assigned)' if is_self_assignment else '')
+        'is_self_assignment': False,
+        'message': f'Ticket assigned to {agent.username}'
     })
 
 @tickets_bp.route('/<int:id>/self-assign', methods=['POST'])
@@ -299,36 +283,10 @@ def self_assign_ticket(id):
 
     ticket = Ticket.query.get_or_404(id)
 
-    # Check if ticket is already assigned
-    if ticket.assigned_to:
+    # Claim only if still unassigned, so concurrent accepts cannot both win
+    if not claim_ticket(ticket.id, current_user):
         return jsonify({'error': 'Ticket is already assigned'}), 400
-
-    # Assign to current user
-    ticket.assigned_to = current_user.id
-
-    # Create activity log
-    activity = TicketActivity(
-        ticket_id=ticket.id,
-        user_id=current_user.id,
-        activity_type='self_assigned',
-        description=f'{current_user.username} accepted this ticket for resolution',
-        new_value=current_user.username
-    )
-    db.session.add(activity)
-    db.session.commit()
-
-    # Send notification to ticket creator
-    try:
-        send_notification_email(
-            ticket=ticket,
-            event_type='agent_accepted',
-            recipient_email=ticket.creator.email,
-            agent_name=current_user.username,
-            agent_phone=current_user.phone or 'Not provided',
-            agent_email=current_user.email
-        )
-    except Exception as e:
-        print(f"Error sending self-assignment notification: {e}")
+    db.session.refresh(ticket)
 
     return jsonify({
         'success': True,
@@ -362,32 +320,61 @@ def update_status(id):
     ticket.status = new_status
     ticket.updated_at = db.func.now()
 
+    # Moving a ticket on from 'open' counts as its first response
+    if old_status == 'open' and new_status != 'open':
+        record_first_response(ticket)
+    apply_sla(ticket)
+
     # Create activity log
-    activity = TicketActivity(
-        ticket_id=ticket.id,
-        user_id=current_user.id,
-        activity_type='status_changed',
-        description=f'Status changed from {old_status} to {new_status} by {current_user.username}',
-        old_value=old_status,
-        new_value=new_status
-    )
+    activity = TicketActivity(**activity_row(
+        ticket.id, current_user.id, 'status_changed', o=old_status, n=new_status
+    ))
     db.session.add(activity)
-    db.session.commit()
+    notify(ticket.id, current_user.id, 'status_changed', watchers(ticket.user_id, ticket.assigned_to),
+           o=old_status, n=new_status)
 
-    # Send notification email
-    send_notification_email(
+    # Queue notification email with the status change
+    queue_notification_email(
         ticket=ticket,
         event_type='status_changed',
         recipient_email=ticket.creator.email,
         old_status=old_status,
         new_status=new_status
     )
+    db.session.commit()
 
     return jsonify({
         'success': True,
         'message': f'Ticket status updated to {new_status.replace("_", " ").title()}'
     })
 
+@tickets_bp.route('/bulk', methods=['POST'])
+@login_required
+def bulk_update():
+    """Apply one action to many tickets in a single transaction"""
+    if not current_user.is_agent():
+        return jsonify({'error': 'Permission denied'}), 403
+
+    data = request.json or {}
+    action = data.get('action')
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': 'Invalid action'}), 400
+
+    try:
+        ticket_ids = parse_ticket_ids(data.get('ticket_ids'), current_app.config['BULK_ACTION_MAX_TICKETS'])
+        result = apply_bulk_action(current_user, ticket_ids, action, data.get('value'))
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'updated': result['updated'],
+        'skipped': result['skipped'],
+        'message': f'{result["updated"]} ticket(s) updated' + (f', {result["skipped"]} skipped' if result['skipped'] else '')
+    })
+
 @tickets_bp.route('/attachment/<filename>')
 @login_required
 def download_attachment(filename):
@@ -423,30 +410,27 @@ def escalate_ticket(id):
     db.session.add(escalation)
 
     # Update ticket priority if not already urgent
+    old_priority = ticket.priority
     if ticket.priority != 'urgent':
-        old_priority = ticket.priority
         ticket.priority = 'urgent'
 
         # Create activity log
-        activity = TicketActivity(
-            ticket_id=ticket.id,
-            user_id=current_user.id,
-            activity_type='escalated',
-            description=f'Ticket escalated by {current_user.username}',
-            old_value=old_priority,
-            new_value='urgent'
-        )
+        activity = TicketActivity(**activity_row(
+            ticket.id, current_user.id, 'escalated', o=old_priority, n='urgent'
+        ))
         db.session.add(activity)
+        apply_sla(ticket)
+    notify(ticket.id, current_user.id, 'escalated', watchers(ticket.user_id, ticket.assigned_to),
+           o=old_priority, n='urgent')
 
-    db.session.commit()
-
-    # Send notification
-    send_notification_email(
+    # Queue notification with the escalation
+    queue_notification_email(
         ticket=ticket,
         event_type='escalated',
         recipient_email=ticket.creator.email,
         escalation_reason=reason
     )
+    db.session.commit()
 
     return jsonify({'success': True})
 
@@ -457,47 +441,59 @@ def search_tags():
     if len(query) < 2:
         return jsonify([])
 
-    tags = Tag.query.filter(Tag.name.contains(query)).filter_by(is_active=True).limit(10).all()
-    return jsonify([{'id': tag.id, 'name': tag.name, 'color': tag.color} for tag in tags])
+    tags = tag_prefix_index.search(query, limit=10)
+    return jsonify([{'id': tag['id'], 'name': tag['name'], 'color': tag['color']} for tag in tags])
 
-@tickets_bp.route('/api/auto-assign')
+@tickets_bp.route('/api/auto-assign', methods=['GET', 'POST'])
 @login_required
 def auto_assign_tickets():
     if not current_user.is_admin():
         return jsonify({'error': 'Permission denied'}), 403
 
-    # Get unassigned tickets
-    unassigned_tickets = Ticket.query.filter(
-        Ticket.assigned_to.is_(None),
-        Ticket.status.in_(['open', 'in_progress'])
-    ).all()
-
-    # Get available agents
-    agents = User.query.filter_by(role='agent', is_active=True).all()
+    # Assign by current agent load, most urgent and oldest tickets first
+    weighted = request.args.get('weighted', str(current_app.config['AUTO_ASSIGN_WEIGHTED'])).lower() in ('1', 'true')
+    use_skills = request.args.get('skills', 'true').lower() in ('1', 'true')
+    result = auto_assign(current_user.id, weighted=weighted, use_skills=use_skills,
+                         chunk_size=current_app.config['AUTO_ASSIGN_CHUNK_SIZE'])
 
-    if not agents:
+    if result is None:
         return jsonify({'error': 'No available agents'}), 400
 
-    assigned_count = 0
-    for i, ticket in enumerate(unassigned_tickets):
-        agent = agents[i % len(agents)]  # Round-robin assignment
-        ticket.assigned_to = agent.id
+    return jsonify({'success': True, **result})
 
-        # Create activity log
-        activity = TicketActivity(
-            ticket_id=ticket.id,
-            user_id=current_user.id,
-            activity_type='auto_assigned',
-            description=f'Auto-assigned to {agent.username}',
-            new_value=agent.username
-        )
-        db.session.add(activity)
+@tickets_bp.route('/api/next', methods=['POST'])
+@login_required
+def claim_next():
+    """Claim the most urgent, oldest unassigned ticket matching the agent's filters"""
+    if not current_user.is_agent():
+        return jsonify({'error': 'Permission denied'}), 403
 
-        assigned_count += 1
+    try:
+        category_ids = [int(value) for value in request.args.get('category', '').split(',') if value]
+    except ValueError:
+        return jsonify({'error': 'Invalid category'}), 400
+    priorities = [value for value in request.args.get('priority', '').split(',') if value]
 
-    db.session.commit()
+    # Restrict to the agent's skill categories unless categories were given
+    if not category_ids and request.args.get('skills', 'false').lower() in ('1', 'true'):
+        category_ids = skill_category_ids(current_user)
 
-    return jsonify({'success': True, 'assigned_count': assigned_count})
+    ticket = claim_next_ticket(current_user, category_ids=category_ids, priorities=priorities)
+    if ticket is None:
+        return jsonify({'error': 'No unassigned tickets match your filters'}), 404
+
+    return jsonify({
+        'success': True,
+        'message': f'You have accepted ticket #{ticket.id}',
+        'ticket': {
+            'id': ticket.id,
+            'subject': ticket.subject,
+            'priority': ticket.priority,
+            'status': ticket.status,
+            'category': ticket.category.name,
+            'url': url_for('tickets.view_ticket', id=ticket.id)
+        }
+    })
 
 @tickets_bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -515,7 +511,7 @@ def edit_ticket(id):
         old_subject = ticket.subject
         old_description = ticket.description
         old_priority = ticket.priority
-        old_category = ticket.category.name
+        old_category_id = ticket.category_id
 
         # Update ticket
         ticket.subject = form.subject.data
@@ -525,42 +521,29 @@ def edit_ticket(id):
         ticket.updated_at = db.func.now()
 
         # Handle tags
+        tags_changed = False
         if form.tags.data:
-            # Clear existing tags
-            ticket.tags.clear()
-
-            tag_names = [tag.strip() for tag in form.tags.data.split(',') if tag.strip()]
-            for tag_name in tag_names:
-                # Get or create tag
-                tag = Tag.query.filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                    db.session.add(tag)
-                    db.session.flush()
-
-                # Associate tag with ticket
-                if tag not in ticket.tags:
-                    ticket.tags.append(tag)
+            tags_changed = set_ticket_tags(ticket, parse_tag_names(form.tags.data),
+                                           current_tag_ids=[tag.id for tag in ticket.tags])
 
         # Create activity log
-        changes = []
+        changes = {}
         if old_subject != ticket.subject:
-            changes.append(f'Subject: "{old_subject}" → "{ticket.subject}"')
+            changes['s'] = [old_subject, ticket.subject]
         if old_description != ticket.description:
-            changes.append(f'Description updated')
+            changes['d'] = 1
         if old_priority != ticket.priority:
-            changes.append(f'Priority: {old_priority} → {ticket.priority}')
-        if old_category != ticket.category.name:
-            changes.append(f'Category: {old_category} → {ticket.category.name}')
+            changes['p'] = [old_priority, ticket.priority]
+        if old_category_id != ticket.category_id:
+            changes['c'] = [old_category_id, ticket.category_id]
+        if tags_changed:
+            changes['g'] = 1
 
         if changes:
-            activity = TicketActivity(
-                ticket_id=ticket.id,
-                user_id=current_user.id,
-                activity_type='edited',
-                description=f'Ticket edited by {current_user.username}: {"; ".join(changes)}'
-            )
+            activity = TicketActivity(**activity_row(ticket.id, current_user.id, 'edited', **changes))
             db.session.add(activity)
+        if 'p' in changes or 'c' in changes:
+            apply_sla(ticket)
 
         db.session.commit()
 
@@ -575,7 +558,8 @@ def edit_ticket(id):
         form.category.data = ticket.category_id
         form.tags.data = ', '.join([tag.name for tag in ticket.tags])
 
-    return render_template('tickets/edit.html', form=form, ticket=ticket)
+    recent_changes = TicketActivity.resolve_names(ticket.activities[-5:])
+    return render_template('tickets/edit.html', form=form, ticket=ticket, recent_changes=recent_changes)
 
 @tickets_bp.route('/<int:id>/delete', methods=['POST'])
 @login_required
@@ -586,22 +570,11 @@ def delete_ticket(id):
     ticket = Ticket.query.get_or_404(id)
 
     try:
-        # Delete related records first
-        Comment.query.filter_by(ticket_id=ticket.id).delete()
-        Vote.query.filter_by(ticket_id=ticket.id).delete()
-        Attachment.query.filter_by(ticket_id=ticket.id).delete()
-        TicketActivity.query.filter_by(ticket_id=ticket.id).delete()
-
-        # Clear tag associations
-        ticket.tags.clear()
-
-        # Delete the ticket
-        db.session.delete(ticket)
-        db.session.commit()
+        delete_tickets([id])
 
         return jsonify({
             'success': True,
-            'message': f'Ticket #{ticket.id} has been permanently deleted.'
+            'message': f'Ticket #{id} has been permanently deleted.'
         })
 
     except Exception as e:
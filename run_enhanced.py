@@ -16,8 +16,9 @@ def create_database():
             from models import (User, Category, Ticket, Comment, Vote, Attachment, 
                               Tag, TicketActivity, NotificationSettings, TicketEscalation)
             
-            # Create all tables
-            db.create_all()
+            # Create all tables and apply column/index migrations to existing ones
+            from migrate_database import upgrade_schema
+            upgrade_schema()
             print("Database tables created successfully!")
             
             # Create default admin user if it doesn't exist
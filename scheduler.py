@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+QuickDesk periodic job scheduler
+
+Periodic work (SLA scans, auto-assignment, inbound email, history cleanup) must run once per
+interval however many app processes or nodes are up. Every process runs the
+same scheduler thread, and a job_lease row per job decides which of them is
+the job's leader:
+
+- A process becomes leader with a conditional UPDATE that only matches while
+  the lease is free (expired) or already its own, so at most one process
+  holds a job at any time. The first process to see a job inserts its row.
+- The leader renews the lease well before it expires, also while a run is in
+  progress, and runs the job whenever last_run_at is an interval old. If it
+  dies, the lease lapses after SCHEDULER_LEASE_SECONDS and the next process
+  to check takes over, picking the schedule up from last_run_at.
+- Processes that are not the leader re-read the lease with one plain SELECT
+  per tick and only try to take it once it has expired, so followers never
+  contend for the write lock while a leader is alive.
+- A process shutting down releases its leases, and a follower takes over on
+  its next tick.
+
+Every run is recorded in job_run with its duration, outcome and result, and
+timed in the in-process metrics (scheduler.<job>). The history is pruned
+after SCHEDULER_HISTORY_DAYS by a job of its own.
+
+Leases compare wall-clock times from different nodes, so node clocks need to
+agree to well within SCHEDULER_LEASE_SECONDS (as NTP keeps them).
+
+Web processes can leave the jobs to one dedicated process with
+SCHEDULER_ENABLED=False:
+
+    python scheduler.py            # run the scheduler in the foreground
+    python scheduler.py --status   # show leases and the latest runs
+"""
+
+import argparse
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from models import JobLease, JobRun, db
+import metrics
+
+# Rows removed per statement when pruning run history
+PRUNE_BATCH = 5000
+
+class Scheduler:
+    """Runs registered periodic jobs on whichever process holds each job's lease"""
+
+    def __init__(self):
+        self._app = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._jobs = {}  # name -> (interval seconds, function)
+        self.holder = None
+        self._held = {}  # job -> expiry of the lease this process holds
+        self._busy_until = {}  # job -> expiry of the lease another process was last seen holding
+        self._last_run = {}  # job -> last_run_at, for jobs this process holds
+
+    def init_app(self, app):
+        self._app = app
+        app.before_request(self.start)
+        metrics.register_gauge('scheduler.jobs_led', lambda: len(self._held))
+
+    def register(self, name, interval, function):
+        """Run function every interval seconds (not at all when interval is 0)"""
+        if interval > 0:
+            self._jobs[name] = (interval, function)
+
+    def start(self):
+        """Start the scheduler thread once per process (none with SCHEDULER_ENABLED=False)"""
+        # Started lazily so each forked worker process gets its own thread and identity
+        if self._app is None or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._reset()
+            if self._app.config.get('SCHEDULER_ENABLED', True) and self._jobs:
+                threading.Thread(target=self._run, name='scheduler', daemon=True).start()
+                atexit.register(self._release_on_exit)
+
+    def _reset(self):
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._held, self._busy_until, self._last_run = {}, {}, {}
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                try:
+                    self.tick()
+                except Exception as e:
+                    db.session.rollback()
+                    self._app.logger.error(f'Scheduler tick failed: {str(e)}')
+                finally:
+                    # Do not hold a pooled connection between ticks
+                    db.session.remove()
+                time.sleep(self._app.config.get('SCHEDULER_TICK', 5))
+
+    def tick(self):
+        """Take or renew leases as needed and run the jobs this process leads that are due"""
+        ran = []
+        for name, (interval, function) in self._jobs.items():
+            now = datetime.utcnow()
+            if not self._lead(name, now):
+                continue
+            last_run = self._last_run.get(name)
+            if last_run is None or last_run + timedelta(seconds=interval) <= now:
+                self.run(name, function)
+                ran.append(name)
+        return ran
+
+    def _lead(self, name, now):
+        """Whether this process holds name's lease, acquiring or renewing it when due"""
+        ttl = current_app.config.get('SCHEDULER_LEASE_SECONDS', 30)
+        held = self._held.get(name)
+        if held and held - now > timedelta(seconds=ttl * 2 / 3):
+            return True
+        if self._busy_until.get(name) and self._busy_until[name] > now:
+            # Read the lease again rather than trusting the cached expiry, which a release cuts short
+            busy_until = db.session.query(JobLease.expires_at).filter(JobLease.name == name).scalar()
+            db.session.commit()
+            if busy_until and busy_until >= now:
+                self._busy_until[name] = busy_until
+                return False
+
+        if self._acquire(name, now, now + timedelta(seconds=ttl)):
+            if held is None:
+                # Newly elected: the schedule continues from the previous leader's last run
+                self._last_run[name] = db.session.query(JobLease.last_run_at).filter(
+                    JobLease.name == name
+                ).scalar()
+                metrics.increment('scheduler.elections')
+                current_app.logger.info(f'Scheduler: {self.holder} now runs {name}')
+            return True
+
+        if held:
+            metrics.increment('scheduler.lost_leases')
+            current_app.logger.warning(f'Scheduler: {self.holder} lost the lease on {name}')
+        self._held.pop(name, None)
+        self._last_run.pop(name, None)
+        self._busy_until[name] = db.session.query(JobLease.expires_at).filter(JobLease.name == name).scalar()
+        db.session.commit()
+        return False
+
+    def _acquire(self, name, now, expires_at):
+        """Take or renew the lease with a compare-and-set UPDATE (inserting it the first time)"""
+        lease_table = JobLease.__table__
+        result = db.session.execute(lease_table.update().where(
+            lease_table.c.name == name,
+            or_(lease_table.c.holder == self.holder, lease_table.c.expires_at < now)
+        ).values(holder=self.holder, expires_at=expires_at))
+        acquired = result.rowcount == 1
+        if not acquired and db.session.get(JobLease, name) is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(lease_table.insert().values(name=name, holder=self.holder, expires_at=expires_at))
+                acquired = True
+            except IntegrityError:
+                # Another process inserted it first
+                pass
+        db.session.commit()
+        if acquired:
+            self._held[name] = expires_at
+            self._busy_until.pop(name, None)
+        return acquired
+
+    def _renew_during(self, name, stop):
+        """Keep renewing name's lease until stop is set (runs beside a long job)"""
+        ttl = self._app.config.get('SCHEDULER_LEASE_SECONDS', 30)
+        with self._app.app_context():
+            while not stop.wait(ttl / 3):
+                try:
+                    now = datetime.utcnow()
+                    if not self._acquire(name, now, now + timedelta(seconds=ttl)):
+                        metrics.increment('scheduler.lost_leases')
+                        self._app.logger.warning(f'Scheduler: {self.holder} lost the lease on {name} while running it')
+                        return
+                except Exception as e:
+                    db.session.rollback()
+                    self._app.logger.error(f'Scheduler could not renew the lease on {name}: {str(e)}')
+                finally:
+                    db.session.remove()
+
+    def run(self, name, function):
+        """Run a job now, record the run and move its schedule on; returns the JobRun"""
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew_during, args=(name, stop), name=f'scheduler-{name}', daemon=True)
+        renewer.start()
+
+        status, result, error = 'succeeded', None, None
+        try:
+            result = function()
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'failed', str(e)
+            current_app.logger.error(f'Scheduled job {name} failed: {error}')
+        finally:
+            stop.set()
+            renewer.join()
+        duration = time.perf_counter() - started
+
+        # Only the lease holder moves the schedule on
+        lease_table = JobLease.__table__
+        db.session.execute(lease_table.update().where(
+            lease_table.c.name == name, lease_table.c.holder == self.holder
+        ).values(last_run_at=started_at))
+        run = JobRun(job=name, holder=self.holder, started_at=started_at, duration=duration, status=status,
+                     result=None if result is None else str(result)[:255], error=error)
+        db.session.add(run)
+        db.session.commit()
+        self._last_run[name] = started_at
+
+        metrics.record_timing(f'scheduler.{name}', duration)
+        metrics.increment('scheduler.runs')
+        if status == 'failed':
+            metrics.increment('scheduler.failures')
+        return run
+
+    def release(self):
+        """Give up every lease this process holds, so another process takes over at once"""
+        if not self._held:
+            return
+        lease_table = JobLease.__table__
+        db.session.execute(lease_table.update().where(
+            lease_table.c.name.in_(list(self._held)), lease_table.c.holder == self.holder
+        ).values(expires_at=datetime.utcnow()))
+        db.session.commit()
+        self._held.clear()
+        self._last_run.clear()
+
+    def _release_on_exit(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            with self._app.app_context():
+                self.release()
+        except Exception:
+            # The leases lapse by themselves
+            pass
+
+scheduler = Scheduler()
+
+def prune_job_runs():
+    """Delete run history older than SCHEDULER_HISTORY_DAYS; returns the rows removed"""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('SCHEDULER_HISTORY_DAYS', 14))
+    removed = 0
+    while True:
+        ids = [run_id for (run_id,) in db.session.query(JobRun.id).filter(
+            JobRun.started_at < cutoff
+        ).limit(PRUNE_BATCH)]
+        if not ids:
+            return removed
+        JobRun.query.filter(JobRun.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+
+def _auto_assign():
+    from assignment import auto_assign
+    from sla import system_actor_id
+    actor_id = system_actor_id()
+    if actor_id is None:
+        return 'skipped: no active admin to attribute assignments to'
+    config = current_app.config
+    return auto_assign(actor_id, weighted=config['AUTO_ASSIGN_WEIGHTED'], chunk_size=config['AUTO_ASSIGN_CHUNK_SIZE'])
+
+def init_scheduler(app):
+    """Attach the process-wide scheduler to app and register the periodic jobs"""
+    from sla import overdue_count, scan_breaches
+    scheduler.init_app(app)
+    scheduler.register('sla_scan', app.config['SLA_SCAN_INTERVAL'], scan_breaches)
+    metrics.register_gauge('sla.overdue', overdue_count)
+    scheduler.register('auto_assign', app.config['AUTO_ASSIGN_INTERVAL'], _auto_assign)
+    scheduler.register('prune_job_runs', 3600, prune_job_runs)
+    if app.config.get('INBOUND_MAILDIR'):
+        from email_ingest import ingest_maildir
+        scheduler.register('inbound_mail', app.config['INBOUND_POLL_INTERVAL'], ingest_maildir)
+
+def job_status(recent=20):
+    """Each registered job's lease and latest runs"""
+    leases = {lease.name: lease for lease in JobLease.query.all()}
+    now = datetime.utcnow()
+    jobs = []
+    for name, (interval, _) in scheduler._jobs.items():
+        lease = leases.get(name)
+        runs = JobRun.query.filter_by(job=name).order_by(JobRun.id.desc()).limit(recent).all()
+        jobs.append({
+            'name': name,
+            'interval': interval,
+            'leader': lease.holder if lease and lease.expires_at > now else None,
+            'lease_expires_at': lease.expires_at.isoformat() if lease else None,
+            'last_run_at': lease.last_run_at.isoformat() if lease and lease.last_run_at else None,
+            'runs': [{
+                'holder': run.holder,
+                'started_at': run.started_at.isoformat(),
+                'duration': round(run.duration, 3),
+                'status': run.status,
+                'result': run.result,
+                'error': run.error,
+            } for run in runs],
+        })
+    return jobs
+
+def main():
+    parser = argparse.ArgumentParser(description='Run QuickDesk periodic jobs')
+    parser.add_argument('--status', action='store_true', help='Show leases and the latest runs, then exit')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.status:
+            for job in job_status(recent=5):
+                print(f"{job['name']} every {job['interval']:g}s, leader {job['leader'] or '-'}, "
+                      f"last run {job['last_run_at'] or 'never'}")
+                for run in job['runs']:
+                    print(f"    {run['started_at']}  {run['status']:<9} {run['duration']:>8.3f}s  "
+                          f"{run['result'] or run['error'] or ''}")
+            return
+
+        scheduler._reset()
+        print(f'Running periodic jobs as {scheduler.holder}; Ctrl+C to stop')
+        try:
+            while True:
+                try:
+                    for name in scheduler.tick():
+                        print(f'Ran {name}')
+                except Exception as e:
+                    db.session.rollback()
+                    print(f'Scheduler tick failed: {e}')
+                finally:
+                    db.session.remove()
+                time.sleep(app.config.get('SCHEDULER_TICK', 5))
+        except KeyboardInterrupt:
+            scheduler.release()
+
+if __name__ == '__main__':
+    # app.py registers the jobs on the importable module, not on this __main__ copy
+    import scheduler as scheduler_module
+    scheduler_module.main()
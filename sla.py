@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+QuickDesk SLA escalation
+
+Every open ticket has two deadlines, both counted from its creation: a first
+response by an agent (SLA_FIRST_RESPONSE_HOURS) and resolution
+(SLA_RESOLUTION_HOURS), set per priority. A category may set tighter targets
+of its own (Category.sla_first_response_hours / sla_resolution_hours); the
+earlier deadline wins. A resolved ticket that is reopened counts from the
+time it was reopened instead (Ticket.sla_started_at).
+
+Rather than re-checking every open ticket on each pass, the next deadline a
+ticket can miss is stored on the ticket itself:
+
+- sla_stage is the deadline being tracked ('response' until an agent first
+  responds, then 'resolution'; 'breached' once both were missed, 'paused'
+  while a ticket is resolved or closed);
+- sla_due_at is when that deadline passes, NULL when nothing is tracked
+  (paused and breached tickets).
+
+Both are recomputed whenever an input changes: on create, on priority,
+category and status changes, and on the first response (an agent's public
+comment, or moving the ticket out of 'open'). The scanner then only
+range-scans ix_ticket_sla_due for sla_due_at <= now, so a pass with nothing
+overdue is one empty index read however many tickets are open.
+
+Each overdue ticket is moved on to its next stage with a compare-and-set
+UPDATE (a ticket is never escalated twice for the same deadline), and the batch's
+TicketEscalation rows, 'escalated' activity rows and in-app notifications for
+the assignees are inserted together and committed once per SLA_SCAN_BATCH
+tickets. Automatic escalations are attributed to the oldest active admin.
+
+The scan runs every SLA_SCAN_INTERVAL seconds as a scheduler job (see
+scheduler.py), so one process at a time scans. It can also be run by hand:
+
+    python sla.py            # escalate what is overdue now and exit
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam
+from models import Category, Ticket, TicketActivity, TicketEscalation, User, db
+from activity_log import activity_row
+from notifications import add_notifications, notification_rows
+import metrics
+
+TRACKED_STATUSES = ('open', 'in_progress')
+
+# Stages in the order a ticket moves through them; resolved and closed tickets are 'paused'
+STAGES = ('response', 'resolution', 'breached')
+
+ESCALATION_REASONS = {
+    'response': 'SLA breached: no first response',
+    'resolution': 'SLA breached: not resolved in time',
+}
+
+# Tickets read per statement when recomputing many deadlines
+CHUNK_SIZE = 500
+
+def _target_hours(config_key, priority, category_hours):
+    hours = current_app.config[config_key].get(priority)
+    if category_hours is not None:
+        hours = category_hours if hours is None else min(hours, category_hours)
+    return hours
+
+def due_at(stage, created_at, priority, response_hours=None, resolution_hours=None):
+    """When the stage's deadline passes for a ticket, or None without a target
+
+    response_hours and resolution_hours are the ticket category's own targets.
+    """
+    if stage == 'response':
+        hours = _target_hours('SLA_FIRST_RESPONSE_HOURS', priority, response_hours)
+    elif stage == 'resolution':
+        hours = _target_hours('SLA_RESOLUTION_HOURS', priority, resolution_hours)
+    else:
+        return None
+    return created_at + timedelta(hours=hours) if hours is not None else None
+
+def compute_sla(status, created_at, priority, first_response_at, current_stage,
+                response_hours=None, resolution_hours=None, started_at=None, now=None):
+    """(sla_stage, sla_due_at, sla_started_at) for a ticket in this state
+
+    A ticket never moves back to an earlier stage, so a deadline that was
+    already escalated is not escalated again when, say, its priority changes.
+    Reopening a paused ticket restarts its clock at now, so a ticket resolved
+    in time is not escalated at once for deadlines counted from its creation.
+    """
+    if status not in TRACKED_STATUSES:
+        # Stays marked as breached if it is reopened
+        return ('breached' if current_stage == 'breached' else 'paused'), None, started_at
+
+    if current_stage == 'paused':
+        current_stage, started_at = None, now or datetime.utcnow()
+    stage = 'resolution' if first_response_at else 'response'
+    if current_stage in STAGES and STAGES.index(current_stage) > STAGES.index(stage):
+        stage = current_stage
+    start = started_at or created_at or datetime.utcnow()
+    return stage, due_at(stage, start, priority, response_hours, resolution_hours), started_at
+
+def apply_sla(ticket):
+    """Recompute an ORM ticket's SLA stage and deadline after a change"""
+    category = db.session.get(Category, ticket.category_id)
+    ticket.sla_stage, ticket.sla_due_at, ticket.sla_started_at = compute_sla(
+        ticket.status, ticket.created_at, ticket.priority, ticket.first_response_at, ticket.sla_stage,
+        category.sla_first_response_hours if category else None,
+        category.sla_resolution_hours if category else None,
+        ticket.sla_started_at
+    )
+
+def record_first_response(ticket, now=None):
+    """Note an ORM ticket's first agent response (a no-op after the first) and recompute its SLA"""
+    if ticket.first_response_at is None:
+        ticket.first_response_at = now or datetime.utcnow()
+        apply_sla(ticket)
+
+def refresh_sla(ticket_ids, first_response_at=None):
+    """Recompute the SLA of tickets changed with set-based UPDATEs
+
+    Passing first_response_at also records it on those tickets that have not
+    had a first response yet. Only tickets whose deadline changes are written.
+    """
+    ticket_table = Ticket.__table__
+    statement = ticket_table.update().where(ticket_table.c.id == bindparam('b_id')).values(
+        sla_stage=bindparam('b_stage'),
+        sla_due_at=bindparam('b_due'),
+        sla_started_at=bindparam('b_started'),
+        first_response_at=bindparam('b_first_response'),
+        # An SLA recalculation is not a ticket change
+        updated_at=ticket_table.c.updated_at,
+    )
+
+    ticket_ids = list(ticket_ids)
+    for start in range(0, len(ticket_ids), CHUNK_SIZE):
+        rows = db.session.query(
+            Ticket.id, Ticket.status, Ticket.created_at, Ticket.priority, Ticket.first_response_at,
+            Ticket.sla_stage, Ticket.sla_due_at, Ticket.sla_started_at,
+            Category.sla_first_response_hours, Category.sla_resolution_hours
+        ).outerjoin(Category, Ticket.category_id == Category.id).filter(
+            Ticket.id.in_(ticket_ids[start:start + CHUNK_SIZE])
+        ).all()
+
+        updates = []
+        for (ticket_id, status, created_at, priority, first_response, stage, due, started,
+             response_hours, resolution_hours) in rows:
+            recorded = first_response is None and first_response_at is not None
+            if recorded:
+                first_response = first_response_at
+            new_stage, new_due, new_started = compute_sla(status, created_at, priority, first_response, stage,
+                                                          response_hours, resolution_hours, started)
+            if recorded or (new_stage, new_due, new_started) != (stage, due, started):
+                updates.append({'b_id': ticket_id, 'b_stage': new_stage, 'b_due': new_due,
+                                'b_started': new_started, 'b_first_response': first_response})
+        if updates:
+            db.session.execute(statement, updates)
+
+def system_actor_id():
+    """The user automatic escalations are attributed to: the oldest active admin"""
+    return db.session.query(User.id).filter(
+        User.role == 'admin', User.is_active.is_(True)
+    ).order_by(User.id).limit(1).scalar()
+
+def escalate_breaches(now=None, limit=None):
+    """Escalate up to limit tickets whose SLA deadline has passed; returns how many"""
+    now = now or datetime.utcnow()
+    limit = limit or current_app.config.get('SLA_SCAN_BATCH', 500)
+
+    # A range scan of ix_ticket_sla_due: only overdue tickets are read
+    overdue = db.session.query(
+        Ticket.id, Ticket.sla_stage, Ticket.sla_due_at, Ticket.created_at, Ticket.sla_started_at,
+        Ticket.priority, Ticket.assigned_to, Category.sla_resolution_hours
+    ).outerjoin(Category, Ticket.category_id == Category.id).filter(
+        Ticket.sla_due_at <= now
+    ).order_by(Ticket.sla_due_at).limit(limit).all()
+    if not overdue:
+        return 0
+
+    actor_id = system_actor_id()
+    if actor_id is None:
+        current_app.logger.warning('SLA escalation skipped: there is no active admin to attribute it to')
+        return 0
+
+    ticket_table = Ticket.__table__
+    escalated = []
+    for ticket_id, stage, due, created_at, started_at, priority, assigned_to, resolution_hours in overdue:
+        if stage == 'response':
+            next_stage = 'resolution'
+            next_due = due_at('resolution', started_at or created_at, priority, resolution_hours=resolution_hours)
+        else:
+            next_stage, next_due = 'breached', None
+
+        # Only escalates if no other scanner (or ticket change) moved the deadline since it was read
+        result = db.session.execute(ticket_table.update().where(
+            ticket_table.c.id == ticket_id,
+            ticket_table.c.sla_stage == stage,
+            ticket_table.c.sla_due_at == due,
+        ).values(sla_stage=next_stage, sla_due_at=next_due, updated_at=ticket_table.c.updated_at))
+        if result.rowcount == 1:
+            escalated.append((ticket_id, stage, assigned_to))
+
+    if escalated:
+        db.session.execute(TicketEscalation.__table__.insert(), [
+            {'ticket_id': ticket_id, 'escalated_at': now, 'escalated_by': None,
+             'escalation_reason': ESCALATION_REASONS.get(stage, 'SLA breached')}
+            for ticket_id, stage, _ in escalated
+        ])
+        db.session.execute(TicketActivity.__table__.insert(), [
+            activity_row(ticket_id, actor_id, 'escalated', created_at=now, r=stage)
+            for ticket_id, stage, _ in escalated
+        ])
+
+        notifications = []
+        for ticket_id, stage, assigned_to in escalated:
+            # Attributed to the system actor, who is still told about their own tickets
+            for row in notification_rows(ticket_id, None, 'escalated', [assigned_to], now, r=stage):
+                row['actor_id'] = actor_id
+                notifications.append(row)
+        add_notifications(notifications)
+
+    db.session.commit()
+    metrics.increment('sla.escalations', len(escalated))
+    if len(escalated) < len(overdue):
+        metrics.increment('sla.conflicts', len(overdue) - len(escalated))
+    return len(escalated)
+
+def scan_breaches():
+    """Escalate everything overdue, one batch at a time; returns how many"""
+    total = 0
+    batch = current_app.config.get('SLA_SCAN_BATCH', 500)
+    with metrics.timed('sla.scan'):
+        while True:
+            escalated = escalate_breaches(limit=batch)
+            total += escalated
+            if escalated < batch:
+                return total
+
+def overdue_count():
+    """Tickets past their SLA deadline and not escalated yet"""
+    return Ticket.query.filter(Ticket.sla_due_at <= datetime.utcnow()).count()
+
+def main():
+    argparse.ArgumentParser(description='Escalate QuickDesk tickets past their SLA deadlines now').parse_args()
+
+    from app import app
+    with app.app_context():
+        print(f'Escalated {scan_breaches()} ticket(s)')
+
+if __name__ == '__main__':
+    main()
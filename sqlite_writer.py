@@ -0,0 +1,141 @@
+"""
+QuickDesk single-writer queue for SQLite
+
+SQLite admits one writer at a time, so request threads that all try to write
+end up waiting on the database lock and eventually fail with "database is
+locked". With SQLITE_WRITE_QUEUE enabled, hot write paths (votes, comments)
+hand their work to one dedicated writer thread instead and wait on a future.
+Reads meanwhile go through the read-only connection pool (see db_engine).
+
+The writer drains up to WRITE_QUEUE_MAX_BATCH queued jobs and commits them as
+one transaction (group commit). If any job in a batch raises, the batch is
+rolled back and its jobs are re-run one transaction each, so a failing job
+only fails its own caller.
+
+A job is a plain function that writes through db.session and does not
+commit; it runs in the writer thread's app context, so it must take ids and
+values rather than ORM objects and return plain values. With the queue
+disabled, run_write() runs the job inline and commits, exactly as before.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from models import db
+import metrics
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'submitted_at')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+class WriteQueue:
+    """Runs write jobs on a single dedicated thread"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._app = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        metrics.register_gauge('write_queue.depth', self._queue.qsize)
+
+    @property
+    def enabled(self):
+        return self._app is not None and self._app.config.get('SQLITE_WRITE_QUEUE', False)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for the writer thread and return a Future"""
+        job = _Job(fn, args, kwargs)
+        self._ensure_thread()
+        self._queue.put(job)
+        return job.future
+
+    def run_write(self, fn, *args, **kwargs):
+        """Run a write job (queued when enabled, inline otherwise) and return its result"""
+        if not self.enabled:
+            result = fn(*args, **kwargs)
+            db.session.commit()
+            return result
+
+        # The caller's read transaction must not pin an old snapshot while it waits
+        db.session.rollback()
+        return self.submit(fn, *args, **kwargs).result(timeout=self._app.config.get('WRITE_QUEUE_TIMEOUT', 10))
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                batch = [self._queue.get()]
+                max_batch = self._app.config.get('WRITE_QUEUE_MAX_BATCH', 50)
+                while len(batch) < max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        try:
+            results = [job.fn(*job.args, **job.kwargs) for job in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                self._finish(batch[0], error=e)
+            else:
+                metrics.increment('write_queue.batch_retries')
+                for job in batch:
+                    self._execute_one(job)
+            return
+        finally:
+            metrics.record_timing('write_queue.commit', time.perf_counter() - started)
+
+        metrics.increment('write_queue.batches')
+        for job, result in zip(batch, results):
+            self._finish(job, result=result)
+
+    def _execute_one(self, job):
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._finish(job, error=e)
+        else:
+            self._finish(job, result=result)
+
+    def _finish(self, job, result=None, error=None):
+        metrics.increment('write_queue.jobs')
+        metrics.record_timing('write_queue.latency', time.perf_counter() - job.submitted_at)
+        if error is not None:
+            metrics.increment('write_queue.errors')
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+write_queue = WriteQueue()
+
+def init_write_queue(app):
+    """Attach the process-wide write queue to app"""
+    write_queue.init_app(app)
+
+def run_write(fn, *args, **kwargs):
+    """Run a write job through the write queue; see the module docstring"""
+    return write_queue.run_write(fn, *args, **kwargs)
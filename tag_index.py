@@ -0,0 +1,189 @@
+"""
+QuickDesk tag storage, usage tracking and autocomplete index
+
+Ticket tags are written with set-based statements: all names are resolved in
+one IN query, missing tags are created with a single conflict-tolerant insert
+(so concurrent requests creating the same tag do not fail on the unique
+constraint), and ticket_tags rows are inserted and deleted in bulk.
+
+Tag.usage_count is kept in step with the ticket_tags association table by the
+ticket create, edit and delete handlers, so popular tags can be read straight
+from the usage_count index instead of aggregating ticket_tags.
+
+Autocomplete is served from an in-memory sorted array of active tag names
+searched with bisect. The array is rebuilt after any commit that changed tags
+and, to pick up changes made by other worker processes, after TAG_INDEX_TTL
+seconds.
+"""
+
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Tag, ticket_tags, db
+
+WORD_SEPARATORS = re.compile(r'[\s\-_./]+')
+
+def parse_tag_names(raw):
+    """Split a comma-separated tag string into unique, non-empty names"""
+    names = []
+    for name in (raw or '').split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def _insert_ignoring_conflicts(table):
+    """INSERT that silently skips rows violating a unique constraint"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+def get_or_create_tag_ids(names):
+    """Resolve tag names to ids, creating missing tags in one batched insert"""
+    if not names:
+        return []
+
+    found = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)).all())
+    missing = [name for name in names if name not in found]
+    if missing:
+        db.session.execute(_insert_ignoring_conflicts(Tag.__table__), [{'name': name} for name in missing])
+        found.update(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(missing)).all())
+        mark_tags_changed()
+
+    return [found[name] for name in names]
+
+def set_ticket_tags(ticket, names, current_tag_ids=()):
+    """Replace a ticket's tags with names using bulk association writes; returns True if they changed"""
+    tag_ids = get_or_create_tag_ids(names)
+    current_tag_ids = set(current_tag_ids)
+    added = [tag_id for tag_id in tag_ids if tag_id not in current_tag_ids]
+    removed = current_tag_ids - set(tag_ids)
+
+    if removed:
+        db.session.execute(ticket_tags.delete().where(
+            ticket_tags.c.ticket_id == ticket.id,
+            ticket_tags.c.tag_id.in_(removed)
+        ))
+    if added:
+        db.session.execute(ticket_tags.insert(), [
+            {'ticket_id': ticket.id, 'tag_id': tag_id} for tag_id in added
+        ])
+
+    adjust_tag_usage(removed, -1)
+    adjust_tag_usage(added, 1)
+    db.session.expire(ticket, ['tags'])
+    return bool(added or removed)
+
+def adjust_tag_usage(tag_ids, delta):
+    """Add delta to usage_count for each tag id (ids may repeat)"""
+    counts = Counter(tag_ids)
+    if not counts:
+        return
+
+    # One UPDATE per distinct multiplicity, usually exactly one
+    by_multiplicity = {}
+    for tag_id, times in counts.items():
+        by_multiplicity.setdefault(times, []).append(tag_id)
+
+    for times, ids in by_multiplicity.items():
+        Tag.query.filter(Tag.id.in_(ids)).update(
+            {Tag.usage_count: Tag.usage_count + delta * times},
+            synchronize_session=False
+        )
+
+    mark_tags_changed()
+
+def get_popular_tags(limit=10):
+    """Most used active tags, served from the usage_count index"""
+    return Tag.query.filter(
+        Tag.is_active.is_(True),
+        Tag.usage_count > 0
+    ).order_by(Tag.usage_count.desc(), Tag.name).limit(limit).all()
+
+class TagPrefixIndex:
+    """Sorted array of lowercase tag keys for prefix lookups"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = ([], [])  # (sorted keys, parallel (rank, tag) entries), swapped as one
+        self._loaded_at = None
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _is_fresh(self):
+        if self._loaded_at is None:
+            return False
+        ttl = current_app.config.get('TAG_INDEX_TTL', 60)
+        return time.monotonic() - self._loaded_at < ttl
+
+    def _load(self):
+        rows = db.session.query(Tag.id, Tag.name, Tag.color, Tag.usage_count).filter(
+            Tag.is_active.is_(True)
+        ).all()
+
+        # Each tag is indexed under its full name (rank 0) and under every later
+        # word of its name (rank 1), so "req" also finds "feature-request".
+        pairs = []
+        for tag_id, name, color, usage_count in rows:
+            tag = {'id': tag_id, 'name': name, 'color': color, 'usage_count': usage_count or 0}
+            lowered = name.lower()
+            pairs.append((lowered, 0, tag))
+            for word in WORD_SEPARATORS.split(lowered)[1:]:
+                if word:
+                    pairs.append((word, 1, tag))
+
+        pairs.sort(key=lambda pair: pair[0])
+        self._index = ([pair[0] for pair in pairs], [(pair[1], pair[2]) for pair in pairs])
+        self._loaded_at = time.monotonic()
+
+    def search(self, query, limit=10):
+        """Return up to limit tags matching query, ranked by prefix then usage"""
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._load()
+
+        keys, entries = self._index
+        prefix = query.lower()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', lo=start)
+
+        best = {}
+        for rank, tag in entries[start:end]:
+            if rank < best.get(tag['id'], (2, None))[0]:
+                best[tag['id']] = (rank, tag)
+
+        ranked = heapq.nsmallest(
+            limit, best.values(),
+            key=lambda item: (item[0], -item[1]['usage_count'], item[1]['name'].lower())
+        )
+        return [tag for _, tag in ranked]
+
+tag_prefix_index = TagPrefixIndex()
+
+def mark_tags_changed():
+    """Rebuild the autocomplete index once the current transaction commits"""
+    db.session.info['tags_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('tags_changed', False):
+        tag_prefix_index.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('tags_changed', None)
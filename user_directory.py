@@ -0,0 +1,219 @@
+"""
+QuickDesk user directory search
+
+An in-memory, case-insensitive prefix index over username, email, first and
+last name and department, used by admin user management and the agent
+pickers.
+
+Users are held in username order, so results come out already sorted and a
+search can stop as soon as it has enough matches:
+
+- username prefix matches form one contiguous range found with bisect and are
+  returned first;
+- every word of the indexed fields maps to a posting list of user positions,
+  so selective terms only visit the users that contain them;
+- broad terms (a single letter, a large department) walk users in order,
+  restricted to the requested roles, and stop after `limit` matches.
+
+The index is rebuilt after a commit touches an indexed user field and, to pick
+up changes made by other worker processes, every USER_INDEX_TTL seconds.
+Rebuilds that take longer than SYNC_REBUILD_SECONDS (very large user tables)
+run in the background while searches keep using the previous index.
+"""
+
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from itertools import chain
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import User, db
+import metrics
+
+INDEXED_FIELDS = ('username', 'email', 'first_name', 'last_name', 'department')
+WORD_SEPARATORS = re.compile(r'[\s@._\-+]+')
+
+# Terms matching more users than this are served by an ordered scan instead of postings
+SCAN_THRESHOLD = 5000
+
+# Directories that rebuild faster than this are refreshed inline so changes show up immediately
+SYNC_REBUILD_SECONDS = 0.25
+
+def _words(*values):
+    words = set()
+    for value in values:
+        if value:
+            lowered = value.lower()
+            words.add(lowered)
+            words.update(WORD_SEPARATORS.split(lowered))
+    words.discard('')
+    return tuple(words)
+
+def _prefix_range(keys, prefix):
+    start = bisect_left(keys, prefix)
+    return start, bisect_left(keys, prefix + '\uffff', lo=start)
+
+class _DirectorySnapshot:
+    """Immutable index built from one read of the user table"""
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[1].lower())
+        self.records = []
+        self.usernames = []
+        self.role_positions = {}
+        postings = {}
+
+        for position, (user_id, username, email, first_name, last_name, department, role, is_active) in enumerate(rows):
+            words = _words(username, email, first_name, last_name, department)
+            self.records.append({
+                'id': user_id,
+                'username': username,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'department': department,
+                'role': role,
+                'is_active': bool(is_active),
+                '_words': words,
+            })
+            self.usernames.append(username.lower())
+            self.role_positions.setdefault(role, []).append(position)
+            for word in words:
+                postings.setdefault(word, []).append(position)
+
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        self.cumulative = [0]
+        for posting in self.postings:
+            self.cumulative.append(self.cumulative[-1] + len(posting))
+
+    def candidates(self, terms, roles):
+        """Positions worth checking, in username order"""
+        start, end = min((_prefix_range(self.words, term) for term in terms),
+                         key=lambda bounds: self.cumulative[bounds[1]] - self.cumulative[bounds[0]])
+        if self.cumulative[end] - self.cumulative[start] <= SCAN_THRESHOLD:
+            return sorted(set(chain.from_iterable(self.postings[start:end])))
+        if roles:
+            return heapq.merge(*(self.role_positions.get(role, []) for role in roles))
+        return range(len(self.records))
+
+class UserDirectoryIndex:
+    """Process-wide user directory, rebuilt in the background when stale"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._invalidated_at = 0.0
+        self._refreshing = False
+        self._build_seconds = 0.0
+
+    def invalidate(self):
+        self._invalidated_at = time.monotonic()
+
+    def _is_fresh(self):
+        ttl = current_app.config.get('USER_INDEX_TTL', 60)
+        return self._loaded_at > self._invalidated_at and time.monotonic() - self._loaded_at < ttl
+
+    def _build(self):
+        started = time.monotonic()
+        rows = db.session.execute(select(
+            User.id, User.username, User.email, User.first_name,
+            User.last_name, User.department, User.role, User.is_active
+        )).all()
+        snapshot = _DirectorySnapshot(rows)
+        self._build_seconds = time.monotonic() - started
+        metrics.record_timing('user_directory.rebuild', self._build_seconds)
+        metrics.set_gauge('user_directory.indexed_users', len(snapshot.records))
+        return snapshot, started
+
+    def _refresh_in_background(self, app):
+        try:
+            with app.app_context():
+                self._snapshot, self._loaded_at = self._build()
+        except Exception as e:
+            app.logger.error(f'User directory rebuild failed: {str(e)}')
+        finally:
+            self._refreshing = False
+
+    def _current(self):
+        if self._snapshot is None or (not self._is_fresh() and self._build_seconds < SYNC_REBUILD_SECONDS):
+            with self._lock:
+                if self._snapshot is None or not self._is_fresh():
+                    self._snapshot, self._loaded_at = self._build()
+        elif not self._is_fresh() and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh_in_background,
+                        args=(current_app._get_current_object(),),
+                        daemon=True
+                    ).start()
+        return self._snapshot
+
+    def search(self, query, roles=None, is_active=None, limit=20):
+        """Return user records with a word starting with every term of query"""
+        started = time.perf_counter()
+        snapshot = self._current()
+
+        terms = [term for term in WORD_SEPARATORS.split(query.lower()) if term]
+        if not terms:
+            return []
+        if limit is None:
+            limit = len(snapshot.records)
+
+        def accepts(position):
+            record = snapshot.records[position]
+            if roles and record['role'] not in roles:
+                return False
+            if is_active is not None and record['is_active'] != is_active:
+                return False
+            return all(any(word.startswith(term) for word in record['_words']) for term in terms)
+
+        # Users whose username starts with the first term are listed first
+        first_start, first_end = _prefix_range(snapshot.usernames, terms[0])
+        positions = []
+        for position in range(first_start, first_end):
+            if len(positions) == limit:
+                break
+            if accepts(position):
+                positions.append(position)
+
+        if len(positions) < limit:
+            for position in snapshot.candidates(terms, roles):
+                if len(positions) == limit:
+                    break
+                if not first_start <= position < first_end and accepts(position):
+                    positions.append(position)
+
+        metrics.record_timing('user_directory.search', time.perf_counter() - started)
+        return [
+            {key: value for key, value in snapshot.records[position].items() if key != '_words'}
+            for position in positions
+        ]
+
+user_directory = UserDirectoryIndex()
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_delete')
+def _user_added_or_removed(mapper, connection, target):
+    inspect(target).session.info['users_changed'] = True
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS + ('role', 'is_active')):
+        state.session.info['users_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('users_changed', False):
+        user_directory.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('users_changed', None)
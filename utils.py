@@ -1,5 +1,6 @@
 from flask import current_app
 from flask_mail import Message, Mail
+from email.utils import make_msgid
 import os
 
 # Mail instance will be imported when needed
@@ -12,35 +13,28 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def send_notification_email(ticket, event_type, recipient_email, **kwargs):
-    """Send notification emails for ticket events"""
-    try:
-        # Get mail instance from current app
-        from flask import current_app, url_for
-        mail = current_app.extensions.get('mail')
+def build_notification_email(ticket, event_type, recipient_email, **kwargs):
+    """Build the email Message for a ticket event"""
+    from flask import url_for
+
+    # Enhanced subject mapping
+    subject_map = {
+        'created': f'New Ticket Created: #{ticket.id} - {ticket.subject}',
+        'commented': f'New Comment on Ticket: #{ticket.id} - {ticket.subject}',
+        'comment_added': f'New Comment on Ticket: #{ticket.id} - {ticket.subject}',
+        'status_changed': f'Ticket Status Updated: #{ticket.id} - {ticket.subject}',
+        'assigned': f'Ticket Assigned: #{ticket.id} - {ticket.subject}',
+        'assigned_to_you': f'Ticket Assigned to You: #{ticket.id} - {ticket.subject}',
+        'agent_accepted': f'Agent Accepted Your Ticket: #{ticket.id} - {ticket.subject}',
+        'escalated': f'Ticket Escalated: #{ticket.id} - {ticket.subject}',
+        'video_call_started': f'Video Call Started: #{ticket.id} - {ticket.subject}'
+    }
 
-        if not current_app.config.get('MAIL_USERNAME') or not mail:
-            # Email not configured, skip sending
-            return
+    subject = subject_map.get(event_type, f'Ticket Update: #{ticket.id} - {ticket.subject}')
 
-        # Enhanced subject mapping
-        subject_map = {
-            'created': f'New Ticket Created: #{ticket.id} - {ticket.subject}',
-            'commented': f'New Comment on Ticket: #{ticket.id} - {ticket.subject}',
-            'comment_added': f'New Comment on Ticket: #{ticket.id} - {ticket.subject}',
-            'status_changed': f'Ticket Status Updated: #{ticket.id} - {ticket.subject}',
-            'assigned': f'Ticket Assigned: #{ticket.id} - {ticket.subject}',
-            'assigned_to_you': f'Ticket Assigned to You: #{ticket.id} - {ticket.subject}',
-            'agent_accepted': f'Agent Accepted Your Ticket: #{ticket.id} - {ticket.subject}',
-            'escalated': f'Ticket Escalated: #{ticket.id} - {ticket.subject}',
-            'video_call_started': f'Video Call Started: #{ticket.id} - {ticket.subject}'
-        }
-
-        subject = subject_map.get(event_type, f'Ticket Update: #{ticket.id} - {ticket.subject}')
-
-        # Create email body based on event type
-        if event_type == 'created':
-            body = f"""
+    # Create email body based on event type
+    if event_type == 'created':
+        body = f"""
 A new support ticket has been created.
 
 Ticket Details:
@@ -59,9 +53,9 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'assigned':
-            agent_name = kwargs.get('agent_name', 'Unknown Agent')
-            body = f"""
+    elif event_type == 'assigned':
+        agent_name = kwargs.get('agent_name', 'Unknown Agent')
+        body = f"""
 Your support ticket has been assigned to an agent.
 
 Ticket Details:
@@ -77,11 +71,11 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'agent_accepted':
-            agent_name = kwargs.get('agent_name', 'Unknown Agent')
-            agent_phone = kwargs.get('agent_phone', 'Not provided')
-            agent_email = kwargs.get('agent_email', 'Not provided')
-            body = f"""
+    elif event_type == 'agent_accepted':
+        agent_name = kwargs.get('agent_name', 'Unknown Agent')
+        agent_phone = kwargs.get('agent_phone', 'Not provided')
+        agent_email = kwargs.get('agent_email', 'Not provided')
+        body = f"""
 Great news! Agent {agent_name} has accepted your problem for resolution.
 
 Ticket Details:
@@ -99,9 +93,9 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'assigned_to_you':
-            assigner_name = kwargs.get('assigner_name', 'Administrator')
-            body = f"""
+    elif event_type == 'assigned_to_you':
+        assigner_name = kwargs.get('assigner_name', 'Administrator')
+        body = f"""
 A support ticket has been assigned to you by {assigner_name}.
 
 Ticket Details:
@@ -120,10 +114,10 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'status_changed':
-            old_status = kwargs.get('old_status', 'Unknown')
-            new_status = kwargs.get('new_status', 'Unknown')
-            body = f"""
+    elif event_type == 'status_changed':
+        old_status = kwargs.get('old_status', 'Unknown')
+        new_status = kwargs.get('new_status', 'Unknown')
+        body = f"""
 Your support ticket status has been updated.
 
 Ticket Details:
@@ -138,10 +132,10 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type in ['commented', 'comment_added']:
-            commenter_name = kwargs.get('commenter_name', 'Unknown User')
-            commenter_role = kwargs.get('commenter_role', 'User')
-            body = f"""
+    elif event_type in ['commented', 'comment_added']:
+        commenter_name = kwargs.get('commenter_name', 'Unknown User')
+        commenter_role = kwargs.get('commenter_role', 'User')
+        body = f"""
 A new comment has been added to your support ticket.
 
 Ticket Details:
@@ -155,9 +149,9 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'escalated':
-            escalation_reason = kwargs.get('escalation_reason', 'Manual escalation')
-            body = f"""
+    elif event_type == 'escalated':
+        escalation_reason = kwargs.get('escalation_reason', 'Manual escalation')
+        body = f"""
 Your support ticket has been escalated for priority handling.
 
 Ticket Details:
@@ -174,9 +168,9 @@ Best regards,
 QuickDesk Support Team
 """
 
-        elif event_type == 'video_call_started':
-            room_name = kwargs.get('room_name', 'Unknown Room')
-            body = f"""
+    elif event_type == 'video_call_started':
+        room_name = kwargs.get('room_name', 'Unknown Room')
+        body = f"""
 A video call has been started for your support ticket.
 
 Ticket Details:
@@ -190,8 +184,8 @@ Best regards,
 QuickDesk Support Team
 """
 
-        else:
-            body = f"""
+    else:
+        body = f"""
 Your ticket has been updated:
 
 Ticket ID: #{ticket.id}
@@ -203,14 +197,54 @@ Best regards,
 QuickDesk Support Team
 """
 
-        msg = Message(
-            subject=subject,
-            sender=current_app.config['MAIL_USERNAME'],
-            recipients=[recipient_email],
-            body=body
-        )
+    message = Message(
+        subject=subject,
+        sender=current_app.config['MAIL_USERNAME'],
+        recipients=[recipient_email],
+        body=body
+    )
+    # Replies quote this Message-ID, which lets email_ingest.py thread them onto the ticket
+    sender_domain = str(current_app.config['MAIL_USERNAME'] or '').rpartition('@')[2]
+    message.msgId = make_msgid(idstring=f'quickdesk-ticket-{ticket.id}', domain=sender_domain or None)
+    return message
+
+def build_digest_email(recipient_email, messages):
+    """Combine several notification Messages for one recipient into a single digest"""
+    sign_off = 'Best regards,\nQuickDesk Support Team'
+    sections = []
+    for msg in messages:
+        body = msg.body.strip()
+        if body.endswith(sign_off):
+            body = body[:-len(sign_off)].rstrip()
+        sections.append(f"{msg.subject}\n{'-' * len(msg.subject)}\n{body}")
+
+    body = f"""
+You have {len(messages)} ticket updates.
+
+""" + '\n\n'.join(sections) + f"""
+
+{sign_off}
+"""
+
+    return Message(
+        subject=f'QuickDesk: {len(messages)} ticket updates',
+        sender=current_app.config['MAIL_USERNAME'],
+        recipients=[recipient_email],
+        body=body
+    )
 
-        mail.send(msg)
+def send_notification_email(ticket, event_type, recipient_email, **kwargs):
+    """Send notification emails for ticket events"""
+    try:
+        # Get mail instance from current app
+        mail = current_app.extensions.get('mail')
+
+        if not current_app.config.get('MAIL_USERNAME') or not mail:
+            # Email not configured, skip sending
+            return
+
+        from mail_transport import smtp_pool
+        smtp_pool.send(build_notification_email(ticket, event_type, recipient_email, **kwargs))
         return True
 
     except Exception as e:
@@ -218,6 +252,15 @@ QuickDesk Support Team
         current_app.logger.error(f'Failed to send email: {str(e)}')
         return False
 
+def queue_notification_email(ticket, event_type, recipient_email, **kwargs):
+    """Queue a notification email in the outbox as part of the current transaction
+
+    Nothing is sent unless the caller's transaction commits; background
+    workers deliver it afterwards (see outbox.py). kwargs must be JSON-serialisable.
+    """
+    from outbox import enqueue_email
+    return enqueue_email(ticket.id, event_type, recipient_email, **kwargs)
+
 def format_datetime(dt):
     """Format datetime for display"""
     if dt:
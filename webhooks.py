@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+QuickDesk outbound webhooks
+
+Ticket events (created, assigned, status_changed, escalated, commented) are
+pushed to the endpoints administrators subscribe in the admin area, so other
+systems do not have to poll /api/changes.
+
+Events are taken from the ticket_event log every handler already writes in
+its own transaction, so nothing is lost however an event was recorded (single
+changes, bulk actions, auto-assignment, SLA escalation):
+
+- relay() reads the events after the subscriptions' cursors
+  (WebhookSubscription.last_event_id) and queues one WebhookDelivery row per
+  subscription that wants the event, carrying the event and the ticket's
+  state at that moment. Cursors move on with compare-and-set UPDATEs in the
+  same transaction, so concurrent relays never queue an event twice. Like
+  every changes_since() batch, relaying stops at a recent gap in event ids in
+  case the transaction holding the missing id has not committed yet.
+- A pool of WEBHOOK_WORKERS threads per process delivers the queue. A worker
+  claims a whole subscription (a lease on its row, like the email outbox
+  claims), so each endpoint has at most one request in flight and receives
+  its events in order, in batches of up to WEBHOOK_BATCH_SIZE.
+- Every request has a WEBHOOK_TIMEOUT. A failed or timed-out endpoint backs
+  off exponentially (WEBHOOK_RETRY_BASE seconds doubling up to
+  WEBHOOK_RETRY_MAX) and is skipped meanwhile, so a slow or broken endpoint
+  only ever ties up one worker for one timeout and the others keep flowing.
+  Events that failed WEBHOOK_MAX_ATTEMPTS times are dead-lettered until an
+  administrator requeues them.
+- Delivered rows are deleted, so the table only holds undelivered events.
+
+Requests are POSTs of {"events": [...]} signed with the subscription secret:
+X-QuickDesk-Signature is "sha256=" + HMAC-SHA256 of "<timestamp>.<body>",
+where timestamp is the X-QuickDesk-Timestamp header (see verify_signature).
+Delivery is at least once; consumers deduplicate on the event id.
+
+Web processes can run with WEBHOOK_WORKERS=0 and leave delivery to a
+dedicated process:
+
+    python webhooks.py               # run the dispatcher in the foreground
+    python webhooks.py --retry-dead  # requeue dead-lettered events
+"""
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import random
+import secrets
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from flask import current_app
+from sqlalchemy import exists, func, or_
+from models import WebhookDelivery, WebhookSubscription, db
+from change_feed import changes_since, head_cursor
+import metrics
+
+# Event types a subscription can choose, and the ticket events behind each
+WEBHOOK_EVENTS = ('created', 'assigned', 'status_changed', 'escalated', 'commented')
+EVENT_TYPES = {
+    'created': 'created',
+    'assigned': 'assigned',
+    'self_assigned': 'assigned',
+    'auto_assigned': 'assigned',
+    'unassigned': 'assigned',
+    'status_changed': 'status_changed',
+    'escalated': 'escalated',
+    'commented': 'commented',
+}
+
+# Ticket events read per relay pass
+RELAY_BATCH = 500
+
+# Subscriptions considered per claim attempt
+CLAIM_CANDIDATES = 10
+
+USER_AGENT = 'QuickDesk-Webhooks/1.0'
+
+def new_secret():
+    return secrets.token_hex(32)
+
+def sign(secret, timestamp, body):
+    """Signature header value for a request body sent at timestamp"""
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+def verify_signature(secret, timestamp, body, signature, tolerance=300):
+    """Whether a received request is authentic and no older than tolerance seconds"""
+    try:
+        fresh = abs(time.time() - int(timestamp)) <= tolerance
+    except (TypeError, ValueError):
+        return False
+    return fresh and hmac.compare_digest(sign(secret, timestamp, body), signature or '')
+
+def retry_delay(failures, config):
+    """Seconds an endpoint is skipped after its failures-th consecutive failure"""
+    delay = min(config['WEBHOOK_RETRY_BASE'] * 2 ** (failures - 1), config['WEBHOOK_RETRY_MAX'])
+    # Up to 10% jitter so endpoints that failed together do not retry in lockstep
+    return delay * (1 + random.random() / 10)
+
+def subscribe(name, url, events, is_active=True):
+    """Add a subscription (not committed); it receives events from now on"""
+    subscription = WebhookSubscription(
+        name=name, url=url, events=','.join(event for event in WEBHOOK_EVENTS if event in events),
+        secret=new_secret(), is_active=is_active, last_event_id=head_cursor()
+    )
+    db.session.add(subscription)
+    return subscription
+
+def set_active(subscription, is_active):
+    """Pause or resume a subscription; a resumed one skips what happened while paused"""
+    if is_active and not subscription.is_active:
+        subscription.last_event_id = head_cursor()
+        subscription.failures = 0
+        subscription.retry_at = None
+    subscription.is_active = is_active
+
+def relay():
+    """Queue new ticket events for the subscriptions that want them; returns the rows queued"""
+    subscriptions = db.session.query(
+        WebhookSubscription.id, WebhookSubscription.events, WebhookSubscription.last_event_id
+    ).filter(WebhookSubscription.is_active.is_(True)).all()
+    if not subscriptions:
+        return 0
+
+    since = min(subscription.last_event_id for subscription in subscriptions)
+    batch = changes_since(since, limit=RELAY_BATCH)
+    changes = batch['changes']
+    if not changes:
+        db.session.rollback()
+        return 0
+
+    tickets = {ticket['id']: ticket for ticket in batch['tickets']}
+    comments = {comment['id']: comment for comment in batch['comments']}
+    payloads = {}
+    for change in changes:
+        event_type = EVENT_TYPES.get(change['event'])
+        if event_type is None:
+            continue
+        payloads[change['id']] = (event_type, json.dumps({
+            'id': change['id'],
+            'type': event_type,
+            'event': change['event'],
+            'description': change['description'],
+            'actor_id': change['actor_id'],
+            'created_at': change['created_at'],
+            'ticket': tickets.get(change['ticket_id']),
+            'comment': comments.get(change['comment_id']),
+        }, separators=(',', ':'), ensure_ascii=False))
+
+    now = datetime.utcnow()
+    cursor = batch['next_cursor']
+    subscription_table = WebhookSubscription.__table__
+    rows = []
+    for subscription_id, events, last_event_id in subscriptions:
+        if last_event_id >= cursor:
+            continue
+        wanted = set(events.split(','))
+        rows.extend({'subscription_id': subscription_id, 'event_id': event_id, 'payload': payload, 'created_at': now}
+                    for event_id, (event_type, payload) in payloads.items()
+                    if event_id > last_event_id and event_type in wanted)
+        # Only moves the cursor if no other relay moved it since it was read
+        result = db.session.execute(subscription_table.update().where(
+            subscription_table.c.id == subscription_id, subscription_table.c.last_event_id == last_event_id
+        ).values(last_event_id=cursor))
+        if result.rowcount != 1:
+            db.session.rollback()
+            metrics.increment('webhooks.relay_conflicts')
+            return 0
+
+    if rows:
+        db.session.execute(WebhookDelivery.__table__.insert(), rows)
+    db.session.commit()
+    metrics.increment('webhooks.queued', len(rows))
+    return len(rows)
+
+class _Connections(threading.local):
+    """Keep-alive HTTP connections of one worker thread, by scheme and host"""
+
+    def __init__(self):
+        self.open = {}
+
+_connections = _Connections()
+
+def post(url, body, headers, timeout):
+    """POST body to url over a reused connection; returns the response status"""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+    for attempt in (1, 2):
+        connection = _connections.open.pop(key, None)
+        reused = connection is not None
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(parts.netloc, timeout=timeout)
+        try:
+            connection.request('POST', path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            # The endpoint closed an idle kept-alive connection: retry once on a new one
+            if reused and attempt == 1:
+                continue
+            raise
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            _connections.open[key] = connection
+        return response.status
+
+class WebhookDispatcher:
+    """Pool of threads relaying ticket events and delivering them to subscriptions"""
+
+    def __init__(self):
+        self._app = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        app.before_request(self.start)
+        metrics.register_gauge('webhooks.depth', lambda: self._count('pending'))
+        metrics.register_gauge('webhooks.dead', lambda: self._count('dead'))
+
+    def _count(self, status):
+        return WebhookDelivery.query.filter_by(status=status).count()
+
+    def start(self, workers=None):
+        """Start the worker threads once per process (none with WEBHOOK_WORKERS=0)"""
+        # Started lazily so each forked worker process gets its own pool
+        if self._app is None or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if workers is None:
+                workers = self._app.config.get('WEBHOOK_WORKERS', 4)
+            for number in range(workers):
+                threading.Thread(target=self._run, args=(number,), name=f'webhooks-{number}', daemon=True).start()
+
+    def _run(self, number):
+        with self._app.app_context():
+            while True:
+                handled = 0
+                try:
+                    # One relaying thread per process is plenty
+                    if number == 0:
+                        handled += relay()
+                    handled += self.process_due()
+                except Exception as e:
+                    db.session.rollback()
+                    self._app.logger.error(f'Webhook worker failed: {str(e)}')
+                finally:
+                    db.session.remove()
+                if not handled:
+                    time.sleep(self._app.config.get('WEBHOOK_POLL_INTERVAL', 1))
+
+    def claim(self):
+        """Claim one subscription with queued events that is not backing off; returns (id, token) or None"""
+        config = current_app.config
+        now = datetime.utcnow()
+        has_queue = exists().where(
+            WebhookDelivery.subscription_id == WebhookSubscription.id, WebhookDelivery.status == 'pending'
+        )
+        # Least recently served first, so every endpoint gets its turn
+        candidates = [subscription_id for (subscription_id,) in db.session.query(WebhookSubscription.id).filter(
+            WebhookSubscription.is_active.is_(True),
+            or_(WebhookSubscription.retry_at.is_(None), WebhookSubscription.retry_at <= now),
+            or_(WebhookSubscription.claimed_until.is_(None), WebhookSubscription.claimed_until < now),
+            has_queue
+        ).order_by(WebhookSubscription.last_delivery_at).limit(CLAIM_CANDIDATES)]
+
+        table = WebhookSubscription.__table__
+        token = uuid.uuid4().hex
+        # The claim outlives a request that times out, so a crashed worker's endpoint is picked up again later
+        lease = timedelta(seconds=config.get('WEBHOOK_TIMEOUT', 5) * 2 + 30)
+        for subscription_id in candidates:
+            result = db.session.execute(table.update().where(
+                table.c.id == subscription_id,
+                or_(table.c.claimed_until.is_(None), table.c.claimed_until < now)
+            ).values(claim_token=token, claimed_until=now + lease))
+            if result.rowcount == 1:
+                db.session.commit()
+                return subscription_id, token
+            metrics.increment('webhooks.claim_conflicts')
+        db.session.rollback()
+        return None
+
+    def process_due(self):
+        """Deliver one batch to every endpoint this worker can claim; returns the events handled"""
+        handled = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                return handled
+            handled += self.deliver(*claimed)
+
+    def _release(self, subscription_id, token, **values):
+        # Only the worker still holding the claim records the outcome
+        table = WebhookSubscription.__table__
+        db.session.execute(table.update().where(
+            table.c.id == subscription_id, table.c.claim_token == token
+        ).values(claim_token=None, claimed_until=None, **values))
+        db.session.commit()
+
+    def deliver(self, subscription_id, token):
+        """Send the oldest queued events of a claimed subscription as one request"""
+        config = current_app.config
+        subscription = db.session.get(WebhookSubscription, subscription_id)
+        rows = db.session.query(WebhookDelivery.id, WebhookDelivery.payload, WebhookDelivery.created_at).filter(
+            WebhookDelivery.subscription_id == subscription_id, WebhookDelivery.status == 'pending'
+        ).order_by(WebhookDelivery.id).limit(config.get('WEBHOOK_BATCH_SIZE', 50)).all()
+        if subscription is None or not subscription.is_active or not rows:
+            # Deleted, paused or emptied since it was claimed
+            if subscription is not None:
+                self._release(subscription_id, token)
+            return 0
+        name, url, secret, failures = subscription.name, subscription.url, subscription.secret, subscription.failures
+        # Do not hold a read transaction open while waiting on the endpoint
+        db.session.commit()
+
+        body = ('{"events":[' + ','.join(row.payload for row in rows) + ']}').encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': USER_AGENT,
+            'X-QuickDesk-Delivery': token,
+            'X-QuickDesk-Timestamp': timestamp,
+            'X-QuickDesk-Signature': sign(secret, timestamp, body),
+        }
+        error = None
+        started = time.perf_counter()
+        try:
+            status = post(url, body, headers, config.get('WEBHOOK_TIMEOUT', 5))
+            if not 200 <= status < 300:
+                error = f'HTTP {status}'
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        metrics.record_timing('webhooks.request', time.perf_counter() - started)
+
+        now = datetime.utcnow()
+        batch = WebhookDelivery.query.filter(WebhookDelivery.id.in_([row.id for row in rows]))
+        if error is None:
+            batch.delete(synchronize_session=False)
+            self._release(subscription_id, token, failures=0, retry_at=None, last_error=None, last_delivery_at=now)
+            metrics.increment('webhooks.delivered', len(rows))
+            metrics.increment('webhooks.batches')
+            metrics.record_timing('webhooks.lag', (now - min(row.created_at for row in rows)).total_seconds())
+            return len(rows)
+
+        batch.update({WebhookDelivery.attempts: WebhookDelivery.attempts + 1, WebhookDelivery.last_error: error},
+                     synchronize_session=False)
+        dead = batch.filter(WebhookDelivery.attempts >= config.get('WEBHOOK_MAX_ATTEMPTS', 8)).update(
+            {WebhookDelivery.status: 'dead'}, synchronize_session=False
+        )
+        failures += 1
+        self._release(subscription_id, token, failures=failures, last_error=error,
+                      retry_at=now + timedelta(seconds=retry_delay(failures, config)))
+        metrics.increment('webhooks.failures')
+        if dead:
+            metrics.increment('webhooks.dead_lettered', dead)
+            current_app.logger.error(f'Webhook {name}: {dead} event(s) dead-lettered after {error}')
+        else:
+            current_app.logger.warning(f'Webhook {name} failed, retrying later: {error}')
+        return len(rows)
+
+webhook_dispatcher = WebhookDispatcher()
+
+def init_webhooks(app):
+    """Attach the process-wide webhook dispatcher to app"""
+    webhook_dispatcher.init_app(app)
+
+def retry_dead_deliveries(subscription_id=None):
+    """Requeue dead-lettered events (of one subscription, or all); returns the number requeued"""
+    query = WebhookDelivery.query.filter_by(status='dead')
+    if subscription_id is not None:
+        query = query.filter_by(subscription_id=subscription_id)
+    count = query.update({WebhookDelivery.status: 'pending', WebhookDelivery.attempts: 0},
+                         synchronize_session=False)
+    db.session.commit()
+    return count
+
+def queue_counts():
+    """{subscription id: {'pending': n, 'dead': n}} in one query"""
+    counts = {}
+    for subscription_id, status, count in db.session.query(
+        WebhookDelivery.subscription_id, WebhookDelivery.status, func.count()
+    ).group_by(WebhookDelivery.subscription_id, WebhookDelivery.status):
+        counts.setdefault(subscription_id, {'pending': 0, 'dead': 0})[status] = count
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Deliver QuickDesk webhooks')
+    parser.add_argument('--workers', type=int, default=4, help='Delivery threads (default 4)')
+    parser.add_argument('--retry-dead', action='store_true', help='Requeue dead-lettered events and exit')
+    args = parser.parse_args()
+
+    from app import app
+    if args.retry_dead:
+        with app.app_context():
+            print(f'Requeued {retry_dead_deliveries()} dead-lettered event(s)')
+        return
+
+    print(f'Delivering webhooks with {args.workers} worker(s); Ctrl+C to stop')
+    webhook_dispatcher.start(workers=args.workers)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    # app.py attaches the importable module's dispatcher, not this __main__ copy
+    import webhooks as webhooks_module
+    webhooks_module.main()
@@ -0,0 +1,100 @@
+"""
+QuickDesk agent work queue
+
+Agents claim tickets with a compare-and-set UPDATE ... WHERE assigned_to IS
+NULL instead of reading the assignee and writing it back, so two agents can
+never both accept the same ticket and no lock is held between requests.
+
+claim_next_ticket() reads a short batch of candidates (most urgent first,
+oldest first within a priority, served by the ix_ticket_queue index) and
+tries to claim them in order. Losing a race only costs one UPDATE that
+matches no rows; the agent moves on to the next candidate, re-reading the
+queue if the whole batch was taken.
+"""
+
+from datetime import datetime
+from models import Ticket, TicketActivity, User, agent_skills, db
+from activity_log import activity_row
+from notifications import notify
+from outbox import enqueue_email
+import metrics
+
+QUEUE_PRIORITIES = ('urgent', 'high', 'medium', 'low')
+QUEUE_STATUSES = ('open', 'in_progress')
+
+# Candidates read per attempt, and attempts before giving up
+CANDIDATE_BATCH = 10
+MAX_ATTEMPTS = 5
+
+def claim_ticket(ticket_id, agent, statuses=None):
+    """Assign ticket_id to agent only if it is still unassigned; return True on success
+
+    The ticket creator's notification and "agent accepted" email are added in the same transaction.
+    """
+    ticket_table = Ticket.__table__
+    conditions = [ticket_table.c.id == ticket_id, ticket_table.c.assigned_to.is_(None)]
+    if statuses:
+        conditions.append(ticket_table.c.status.in_(statuses))
+
+    now = datetime.utcnow()
+    result = db.session.execute(
+        ticket_table.update().where(*conditions).values(assigned_to=agent.id, updated_at=now)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        metrics.increment('work_queue.conflicts')
+        return False
+
+    db.session.add(TicketActivity(**activity_row(ticket_id, agent.id, 'self_assigned', created_at=now)))
+    creator_id, creator_email = db.session.query(User.id, User.email).join(Ticket, Ticket.user_id == User.id).filter(
+        Ticket.id == ticket_id
+    ).one()
+    notify(ticket_id, agent.id, 'self_assigned', [creator_id], created_at=now)
+    enqueue_email(ticket_id, 'agent_accepted', creator_email, agent_name=agent.username,
+                  agent_phone=agent.phone or 'Not provided', agent_email=agent.email)
+    db.session.commit()
+    metrics.increment('work_queue.claims')
+    return True
+
+def skill_category_ids(agent):
+    """Category ids the agent is skilled in"""
+    return [category_id for (category_id,) in db.session.query(agent_skills.c.category_id).filter(
+        agent_skills.c.user_id == agent.id
+    )]
+
+def _candidates(category_ids, priorities, limit):
+    """Unassigned open ticket ids in queue order, at most limit"""
+    found = []
+    for priority in QUEUE_PRIORITIES:
+        if priorities and priority not in priorities:
+            continue
+        query = db.session.query(Ticket.id).filter(
+            Ticket.assigned_to.is_(None),
+            Ticket.priority == priority,
+            Ticket.status.in_(QUEUE_STATUSES)
+        )
+        if category_ids:
+            query = query.filter(Ticket.category_id.in_(category_ids))
+        found.extend(ticket_id for (ticket_id,) in query.order_by(
+            Ticket.created_at, Ticket.id
+        ).limit(limit - len(found)))
+        if len(found) == limit:
+            break
+    return found
+
+def claim_next_ticket(agent, category_ids=None, priorities=None, max_attempts=MAX_ATTEMPTS):
+    """Claim the most urgent, oldest unassigned ticket matching the filters, or None"""
+    with metrics.timed('work_queue.claim_next'):
+        for _ in range(max_attempts):
+            candidates = _candidates(category_ids, priorities, CANDIDATE_BATCH)
+            # Release the read snapshot so the UPDATE sees other agents' claims
+            db.session.commit()
+            if not candidates:
+                return None
+
+            for ticket_id in candidates:
+                if claim_ticket(ticket_id, agent, statuses=QUEUE_STATUSES):
+                    return db.session.get(Ticket, ticket_id)
+
+        metrics.increment('work_queue.exhausted')
+        return None
@@ -0,0 +1,128 @@
+"""
+QuickDesk write-behind buffer for touch updates
+
+Low-value timestamp writes (User.last_login, Ticket.updated_at when a comment
+is added) are recorded in memory and written later in one batched UPDATE per
+column, instead of each costing its own commit on the request path. Repeated
+touches of the same row are coalesced and the latest timestamp wins.
+
+The buffer is flushed every WRITE_BEHIND_INTERVAL seconds by a background
+thread, as soon as it holds WRITE_BEHIND_MAX_ENTRIES rows, and at interpreter
+shutdown.
+
+This is best-effort: values can lag the database by up to the flush interval,
+and touches still buffered when a worker is killed (SIGKILL, OOM, power loss)
+are lost. Never route writes that matter through it.
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, or_
+from models import db
+import metrics
+
+class WriteBehindBuffer:
+    """Coalesces (model, column, row id) -> timestamp and flushes in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._app = None
+        self._thread_pid = None
+        self._wakeup = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+        metrics.register_gauge('write_behind.pending', lambda: len(self._pending))
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Started lazily so each forked worker process gets its own flusher
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config.get('WRITE_BEHIND_INTERVAL', 5))
+            self._wakeup.clear()
+            self.flush()
+
+    def touch(self, model, row_id, column, value=None):
+        """Set model.column to value (default now) for row_id, eventually"""
+        value = value or datetime.utcnow()
+        if self._app is None or not self._app.config.get('WRITE_BEHIND_ENABLED', True):
+            self._write({(model, column): [{'b_id': row_id, 'b_value': value}]})
+            return
+
+        key = (model, column, row_id)
+        with self._lock:
+            if key not in self._pending or self._pending[key] < value:
+                self._pending[key] = value
+            size = len(self._pending)
+
+        self._ensure_thread()
+        if size >= self._app.config.get('WRITE_BEHIND_MAX_ENTRIES', 500):
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered touches; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            batches = {}
+            for (model, column, row_id), value in pending.items():
+                batches.setdefault((model, column), []).append({'b_id': row_id, 'b_value': value})
+
+            started = time.perf_counter()
+            try:
+                self._write(batches)
+            except Exception as e:
+                # Put the touches back (unless newer ones arrived) and retry next interval
+                with self._lock:
+                    for key, value in pending.items():
+                        if key not in self._pending or self._pending[key] < value:
+                            self._pending[key] = value
+                metrics.increment('write_behind.flush_errors')
+                if self._app is not None:
+                    self._app.logger.error(f'Write-behind flush failed: {str(e)}')
+                return 0
+
+            metrics.record_timing('write_behind.flush', time.perf_counter() - started)
+            metrics.increment('write_behind.rows_flushed', len(pending))
+            return len(pending)
+
+    def _write(self, batches):
+        app = self._app or current_app._get_current_object()
+        with app.app_context():
+            with db.engine.begin() as connection:
+                for (model, column), rows in batches.items():
+                    table = model.__table__
+                    target = table.c[column]
+                    # Never move a timestamp backwards if a newer value was written directly
+                    connection.execute(
+                        table.update().where(
+                            table.c.id == bindparam('b_id'),
+                            or_(target.is_(None), target < bindparam('b_value'))
+                        ).values({column: bindparam('b_value')}),
+                        rows
+                    )
+
+write_behind = WriteBehindBuffer()
+
+def init_write_behind(app):
+    """Attach the process-wide write-behind buffer to app"""
+    write_behind.init_app(app)
+
+def touch(model, row_id, column, value=None):
+    """Buffer a timestamp write; see the module docstring for guarantees"""
+    write_behind.touch(model, row_id, column, value)